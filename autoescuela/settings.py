@@ -46,6 +46,19 @@ else:
 WHATSAPP_PHONE = os.environ.get('WHATSAPP_PHONE', '34000000000')
 
 
+# Registro de auditoría: las entradas se guardan en bloque al terminar la
+# petición (ver students/audit.py). Con AUDIT_LOG_SYNC=True, al momento.
+AUDIT_LOG_SYNC = os.environ.get('AUDIT_LOG_SYNC', 'False') == 'True'
+AUDIT_LOG_BATCH_SIZE = 50
+AUDIT_LOG_MAX_PENDING = 10000
+
+# Procesos como máximo para generar los PDF de una exportación de facturas
+# (ver students/invoice_export.py): cada uno carga Django entero
+TAX_INVOICE_EXPORT_MAX_WORKERS = 4
+
+
+
+
 # Application definition
 
 INSTALLED_APPS = [
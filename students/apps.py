@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class StudentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'students'
+
+    def ready(self):
+        # Registrar señales (saldo materializado de alumnos)
+        from . import signals  # noqa: F401
+
+        # Vaciar la cola de auditoría al terminar cada petición
+        from django.core.signals import request_finished, request_started
+        from .audit import flush_on_request_finished, mark_request_started
+        request_started.connect(mark_request_started, dispatch_uid='students_audit_request')
+        request_finished.connect(flush_on_request_finished, dispatch_uid='students_audit_flush')
+
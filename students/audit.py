@@ -0,0 +1,161 @@
+"""
+Escritura diferida del registro de auditoría (AuditLog).
+
+AuditLog.log_action() ya no hace un INSERT dentro de la petición: construye
+la entrada y la deja en una cola en memoria (audit_buffer), que se vacía
+con bulk_create en los límites de la petición o de la transacción, en el
+mismo hilo (sin hilos de fondo que compitan por la base de datos ni colas
+que se pierdan si el proceso muere):
+
+- dentro de una petición: al terminar (señal request_finished, después de
+  enviar la respuesta) o antes si la cola llega a AUDIT_LOG_BATCH_SIZE
+- fuera de una petición (comandos, shell): al hacer commit
+
+Las entradas registradas dentro de una transacción se encolan al hacer
+commit (transaction.on_commit), así que un rollback las descarta igual que
+antes.
+
+Si el bulk_create de un lote falla, el lote se reintenta una vez fila a fila:
+las entradas que siguen fallando por sus datos (IntegrityError, DataError:
+usuario borrado, texto demasiado largo...) se registran en el log y pasan a
+audit_buffer.dead_letter (las últimas AUDIT_LOG_DEAD_LETTER_SIZE); las que
+fallan por la conexión vuelven a la cola para el siguiente vaciado. La cola
+no pasa de AUDIT_LOG_MAX_PENDING entradas: si la base de datos no responde
+se descartan las más antiguas.
+
+Con AUDIT_LOG_SYNC = True cada entrada se guarda al momento con save(),
+como el comportamiento original.
+"""
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto (se pueden cambiar en settings)
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_PENDING = 10000
+DEFAULT_DEAD_LETTER_SIZE = 100
+
+
+def is_sync():
+    """True si las entradas deben guardarse al momento (AUDIT_LOG_SYNC)"""
+    return getattr(settings, 'AUDIT_LOG_SYNC', False)
+
+
+class AuditBuffer:
+    """Cola de entradas de auditoría pendientes del proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        # Petición en curso en cada hilo (request_started / request_finished)
+        self._local = threading.local()
+        # Entradas que no se han podido guardar por sus datos (las más recientes)
+        self.dead_letter = deque(maxlen=getattr(settings, 'AUDIT_LOG_DEAD_LETTER_SIZE', DEFAULT_DEAD_LETTER_SIZE))
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'AUDIT_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'AUDIT_LOG_MAX_PENDING', DEFAULT_MAX_PENDING)
+
+    @property
+    def in_request(self):
+        return getattr(self._local, 'in_request', False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entry):
+        """Encola una entrada (AuditLog sin guardar) al hacer commit"""
+        if is_sync():
+            entry.save()
+            return
+        transaction.on_commit(lambda: self._enqueue(entry))
+
+    def _enqueue(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            self._trim()
+            pending = len(self._entries)
+        if not self.in_request or pending >= self.batch_size:
+            self.flush()
+
+    def _trim(self):
+        """Descarta las entradas más antiguas por encima de max_pending (con el lock tomado)"""
+        excess = len(self._entries) - self.max_pending
+        if excess > 0:
+            del self._entries[:excess]
+            logger.error('Cola de auditoría llena: descartadas %d entradas antiguas', excess)
+
+    def request_started(self):
+        self._local.in_request = True
+
+    def request_finished(self):
+        """Fin de petición: guarda lo pendiente"""
+        self._local.in_request = False
+        self.flush()
+
+    def flush(self):
+        """Guarda todas las entradas pendientes. Retorna cuántas se guardaron."""
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if not entries:
+            return 0
+        from .models import AuditLog
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Error guardando %d entradas de auditoría, se reintenta una a una', len(entries))
+            return self._save_one_by_one(entries)
+        return len(entries)
+
+    def _save_one_by_one(self, entries):
+        """
+        Reintenta un lote fallido entrada a entrada. Las que fallan por sus
+        datos van a dead_letter; las demás (conexión) vuelven a la cola.
+        """
+        saved = 0
+        retry = []
+        for entry in entries:
+            # bulk_create puede haber asignado pk a entradas que no llegaron a guardarse
+            entry.pk = None
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+            except (IntegrityError, DataError):
+                logger.exception(
+                    'Entrada de auditoría descartada: %s %s %s',
+                    entry.action, entry.entity_type, entry.entity_id
+                )
+                self.dead_letter.append(entry)
+            except Exception:
+                logger.exception('Error guardando entrada de auditoría, se reintentará')
+                retry.append(entry)
+            else:
+                saved += 1
+        if retry:
+            with self._lock:
+                self._entries[:0] = retry
+                self._trim()
+        return saved
+
+
+audit_buffer = AuditBuffer()
+
+
+def mark_request_started(sender, **kwargs):
+    """Receptor de request_started"""
+    audit_buffer.request_started()
+
+
+def flush_on_request_finished(sender, **kwargs):
+    """Receptor de request_finished: la respuesta ya se ha enviado"""
+    audit_buffer.request_finished()
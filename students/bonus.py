@@ -0,0 +1,115 @@
+"""
+Motor de descuentos de bono por prácticas acumuladas.
+
+Cada BONUS_MINUTES minutos de prácticas facturadas individualmente el alumno
+recibe un cargo BONUS_DISCOUNT de -BONUS_DISCOUNT_AMOUNT€
+(5 prácticas de 90' = 325€, bono = 300€, descuento = 25€).
+
+El contador de minutos vive en StudentBalance.practice_minutes. Cada alta,
+edición o borrado de una práctica llama a apply_practice_minutes() con la
+variación de minutos dentro de una transacción que bloquea la fila del saldo
+(SELECT ... FOR UPDATE), de modo que dos peticiones simultáneas no pueden
+emitir el mismo descuento. El descuento se decide de forma incremental:
+solo se comparan los umbrales cruzados antes y después del cambio.
+
+Si los minutos bajan de un umbral (edición o borrado) se revierten los
+descuentos más recientes.
+
+Borrar un cargo de práctica individual fuera de las vistas (admin) también
+descuenta los minutos de sus prácticas: ver release_practice_minutes en
+signals.py.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import AuditLog, StudentBalance, Voucher
+
+# Minutos de práctica necesarios para cada descuento de bono
+BONUS_MINUTES = 450
+
+# Importe del descuento por cada bono alcanzado
+BONUS_DISCOUNT_AMOUNT = Decimal('25.00')
+
+
+class BonusResult:
+    """Resultado de aplicar una variación de minutos"""
+
+    def __init__(self, total_minutes, created=None, reversed_count=0):
+        self.total_minutes = total_minutes
+        self.created = created or []
+        self.reversed_count = reversed_count
+
+    @property
+    def minutes_for_next_bonus(self):
+        return BONUS_MINUTES - (self.total_minutes % BONUS_MINUTES)
+
+
+def apply_practice_minutes(student, delta, user=None, request=None):
+    """
+    Suma delta minutos (puede ser negativo) al contador del alumno y emite o
+    revierte los descuentos de bono correspondientes.
+    Debe llamarse después de guardar el cambio de la práctica.
+    """
+    with transaction.atomic():
+        ledger = _lock_ledger(student)
+        previous = ledger.practice_minutes
+        current = max(0, previous + delta)
+        ledger.practice_minutes = current
+        ledger.save(update_fields=['practice_minutes', 'updated_at'])
+
+        crossed = current // BONUS_MINUTES - previous // BONUS_MINUTES
+        if crossed > 0:
+            created = [_issue_discount(student, current, user, request) for _ in range(crossed)]
+            return BonusResult(current, created=created)
+        if crossed < 0:
+            return BonusResult(current, reversed_count=_reverse_discounts(student, -crossed, user, request))
+        return BonusResult(current)
+
+
+def _lock_ledger(student):
+    """Bloquea (y crea si falta) la fila de saldo del alumno"""
+    ledger = StudentBalance.objects.select_for_update().filter(student_id=student.pk).first()
+    if ledger is None:
+        StudentBalance.refresh(student.pk)
+        ledger = StudentBalance.objects.select_for_update().get(student_id=student.pk)
+    return ledger
+
+
+def _issue_discount(student, total_minutes, user, request):
+    voucher = Voucher.objects.create(
+        student=student,
+        concept_type='BONUS_DISCOUNT',
+        amount=-BONUS_DISCOUNT_AMOUNT,  # Importe negativo = descuento
+        description=f'Descuento por bono {BONUS_MINUTES}\' (prácticas acumuladas: {total_minutes}\')',
+        created_by=user
+    )
+    AuditLog.log_action(
+        user=user,
+        action='CREATE',
+        entity_type='VOUCHER',
+        entity_id=voucher.id,
+        entity_name=f'Descuento Bono - {student}',
+        description=f'Descuento de {BONUS_DISCOUNT_AMOUNT}€ aplicado por alcanzar {BONUS_MINUTES} minutos de prácticas',
+        request=request
+    )
+    return voucher
+
+
+def _reverse_discounts(student, count, user, request):
+    """Elimina los count descuentos de bono más recientes. Retorna cuántos se eliminaron."""
+    discounts = list(
+        Voucher.objects.filter(student=student, concept_type='BONUS_DISCOUNT').order_by('-date_created', '-pk')[:count]
+    )
+    for voucher in discounts:
+        AuditLog.log_action(
+            user=user,
+            action='DELETE',
+            entity_type='VOUCHER',
+            entity_id=voucher.id,
+            entity_name=f'Descuento Bono - {student}',
+            description=f'Descuento de {-voucher.amount}€ revertido: las prácticas acumuladas bajan de un bloque de {BONUS_MINUTES} minutos',
+            request=request
+        )
+        voucher.delete()
+    return len(discounts)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from django import forms
+from django.utils import timezone
 from .models import Student, Voucher, Payment, LicenseType, Vehicle, Maintenance, Practice, TaxInvoice
+from .tax_invoice_batch import uninvoiced_payments
 
 
 class StudentForm(forms.ModelForm):
@@ -146,6 +148,48 @@ class PracticeForm(forms.ModelForm):
         }
 
 
+class BulkPracticeForm(forms.Form):
+    """Una fila del alta de prácticas en bloque (las filas vacías se ignoran)"""
+
+    student = forms.TypedChoiceField(
+        coerce=int,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}),
+        label='Alumno'
+    )
+    practice_date = forms.DateField(
+        initial=timezone.localdate,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}),
+        label='Fecha'
+    )
+    duration = forms.TypedChoiceField(
+        coerce=int,
+        choices=[('', '---------')] + Practice.DURATION_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}),
+        label='Duración'
+    )
+    notes = forms.CharField(
+        max_length=200,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Notas (opcional)'}),
+        label='Notas'
+    )
+
+    def __init__(self, *args, student_choices=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if student_choices is None:
+            # Alta para un solo alumno: el alumno lo fija la URL
+            del self.fields['student']
+        else:
+            self.fields['student'].choices = [('', '---------')] + student_choices
+
+    def has_changed(self):
+        # Una fila sin duración se considera vacía aunque tenga otra fecha o alumno
+        return bool(self['duration'].data) and super().has_changed()
+
+
+BulkPracticeFormSet = forms.formset_factory(BulkPracticeForm, extra=10, max_num=100, validate_max=True)
+
+
 class TaxInvoiceForm(forms.ModelForm):
     """Formulario para crear facturas trimestrales con tasas DGT"""
 
@@ -202,16 +246,36 @@ class TaxInvoiceForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if student:
             # Filtrar pagos de este alumno que no tienen factura trimestral
-            self.fields['selected_payments'].queryset = Payment.objects.filter(
-                student=student
-            ).exclude(
-                tax_invoices__isnull=False
+            self.fields['selected_payments'].queryset = uninvoiced_payments(
+                Payment.objects.filter(student=student)
             ).order_by('-date_paid')
 
             # Pre-rellenar curso basado en el tipo de carnet del alumno
-            curso_map = {
-                'B': 'B', 'A': 'A', 'A1': 'A1', 'A2': 'A2', 'AM': 'AM',
-                'C': 'C', 'D': 'B', 'BE': 'B'
-            }
-            license_name = student.license_type.name if student.license_type else 'B'
-            self.initial['curso'] = curso_map.get(license_name, 'B')
+            self.initial['curso'] = TaxInvoice.curso_for_student(student)
+
+
+def _quarter_start():
+    today = timezone.localdate()
+    return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+
+
+class TaxInvoiceBatchForm(forms.Form):
+    """Rango de fechas de los pagos a facturar en bloque"""
+
+    date_from = forms.DateField(
+        initial=_quarter_start,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+        label='Pagos desde'
+    )
+    date_to = forms.DateField(
+        initial=timezone.localdate,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+        label='Pagos hasta'
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('La fecha inicial no puede ser posterior a la final.')
+        return cleaned_data
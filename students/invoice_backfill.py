@@ -0,0 +1,106 @@
+"""
+Emisión en bloque de las facturas de los pagos con tarjeta que no tienen.
+
+Invoice.create_from_payment() emite la factura al descargar el PDF, así que
+los números siguen el orden de descarga. backfill_card_invoices() emite de
+una vez las facturas de todos los pagos con tarjeta pendientes, numeradas
+por orden de pago (date_paid) y con la fecha del pago:
+
+1. Una sola consulta trae los pagos pendientes con el concepto del último
+   cargo del alumno anterior al pago (subconsulta correlacionada)
+2. Reserva los números de cada año de un bloque (InvoiceSequence.reserve)
+3. bulk_create de las facturas
+
+Todo ocurre en una transacción: si algo falla no se crea ninguna factura
+ni se consume ningún número.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Invoice, InvoiceSequence, Payment, Voucher
+
+# Facturas por INSERT en bulk_create
+BATCH_SIZE = 500
+
+
+def pending_card_payments():
+    """Pagos con tarjeta sin factura, en orden de pago, con el concepto del último cargo anterior"""
+    last_concept = Voucher.objects.filter(
+        student_id=OuterRef('student_id'),
+        date_created__lte=OuterRef('date_paid')
+    ).order_by('-date_created').values('concept_type')[:1]
+    return (
+        Payment.objects.filter(payment_method='CARD')
+        .filter(~Exists(Invoice.objects.filter(payment_id=OuterRef('pk'))))
+        .annotate(last_concept_type=Subquery(last_concept))
+        .select_related('student')
+        .order_by('date_paid', 'pk')
+    )
+
+
+def plan_card_invoices(payments):
+    """Facturas (sin guardar ni numerar) de payments (de pending_card_payments), en el mismo orden"""
+    invoices = []
+    for payment in payments:
+        base, iva = Invoice.split_amount(payment.amount)
+        student = payment.student
+        invoices.append(Invoice(
+            payment=payment,
+            date_issued=payment.date_paid,
+            client_name=f"{student.first_name} {student.last_name}",
+            client_dni=student.dni,
+            client_address=student.address or "",
+            base_amount=base,
+            iva_amount=iva,
+            total_amount=payment.amount,
+            concept=Invoice.concept_for(payment.last_concept_type)
+        ))
+    return invoices
+
+
+def _assign_numbers(invoices, first_number):
+    """Numera las facturas de cada año (de la fecha del pago) en orden a partir de first_number(año, cuántas)"""
+    by_year = defaultdict(list)
+    for invoice in invoices:
+        by_year[timezone.localtime(invoice.date_issued).year].append(invoice)
+    for year in sorted(by_year):
+        number = first_number(year, len(by_year[year]))
+        for invoice in by_year[year]:
+            invoice.invoice_number = Invoice.format_invoice_number(year, number)
+            number += 1
+
+
+def preview_card_invoices():
+    """Facturas que emitiría backfill_card_invoices(), con números provisionales (no se guarda nada)"""
+    invoices = plan_card_invoices(pending_card_payments())
+    _assign_numbers(invoices, lambda year, count: InvoiceSequence.peek(InvoiceSequence.SERIES_INVOICE, year))
+    return invoices
+
+
+def backfill_card_invoices():
+    """Emite las facturas de todos los pagos con tarjeta sin factura. Retorna la lista de facturas creadas."""
+    with transaction.atomic():
+        payments = list(pending_card_payments())
+        if not payments:
+            return []
+
+        # Bloquear los pagos y descartar los que se hayan facturado mientras tanto (descarga del PDF)
+        locked = set(
+            Payment.objects.select_for_update()
+            .filter(pk__in=[payment.pk for payment in payments])
+            .filter(~Exists(Invoice.objects.filter(payment_id=OuterRef('pk'))))
+            .values_list('pk', flat=True)
+        )
+        invoices = plan_card_invoices([payment for payment in payments if payment.pk in locked])
+        if not invoices:
+            return []
+
+        _assign_numbers(
+            invoices,
+            lambda year, count: InvoiceSequence.reserve(InvoiceSequence.SERIES_INVOICE, year, count)
+        )
+        Invoice.objects.bulk_create(invoices, batch_size=BATCH_SIZE)
+    return invoices
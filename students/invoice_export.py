@@ -0,0 +1,187 @@
+"""
+Exportación de las facturas trimestrales de un trimestre en un ZIP.
+
+Los PDF se generan con render_tax_invoice_pdf() (el mismo diseño que la
+descarga individual) en un pool de procesos. Los que ya están en la caché de
+PDF (ver invoice_pdf.py) no se vuelven a generar, y los trimestres pequeños
+se generan en el propio proceso.
+
+El pool se crea para cada exportación y se cierra al terminarla: no quedan
+procesos vivos dentro de los workers web. Tiene un proceso por CPU
+disponible para el proceso (afinidad, no las CPUs de la máquina, que en un
+contenedor pueden ser muchas más) y como mucho
+TAX_INVOICE_EXPORT_MAX_WORKERS, porque cada proceso carga Django entero.
+
+El ZIP se escribe en streaming: cada PDF se añade al archivo en cuanto
+termina y sus bytes salen enseguida (por la respuesta HTTP o al fichero),
+así que en memoria solo están los PDF en curso, no el trimestre entero.
+
+Uso:
+    for chunk in stream_quarter_zip(year, quarter, curso=None):
+        ...
+"""
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice
+
+from multiprocessing import get_context
+
+from django.conf import settings
+
+from .invoice_pdf import (
+    PDF_CACHE_TIMEOUT, render_tax_invoice_pdf, tax_invoice_filename, tax_invoice_fingerprint
+)
+
+# Por debajo de este número de PDF pendientes se generan en el propio proceso
+# (arrancar el pool cuesta más que generarlos)
+PARALLEL_MIN_INVOICES = 20
+
+# Procesos del pool como máximo (se puede cambiar en settings)
+DEFAULT_MAX_WORKERS = 4
+
+
+def quarter_invoices(year, quarter, curso=None):
+    """Facturas trimestrales de un trimestre (y curso opcional)"""
+    from .models import TaxInvoice
+    invoices = TaxInvoice.objects.filter(year=year, quarter=quarter)
+    if curso:
+        invoices = invoices.filter(curso=curso)
+    return invoices.order_by('invoice_number')
+
+
+def zip_filename(year, quarter, curso=None):
+    """Nombre del ZIP: facturas_2025_T1.zip / facturas_2025_T1_B.zip"""
+    suffix = f'_{curso}' if curso else ''
+    return f'facturas_{year}_T{quarter}{suffix}.zip'
+
+
+def _init_worker():
+    # Los procesos se crean con 'spawn' (no heredan conexiones a la base de datos)
+    import django
+    django.setup()
+
+
+def _render(tax_invoice):
+    return render_tax_invoice_pdf(tax_invoice)
+
+
+def available_cpus():
+    """CPUs que puede usar este proceso"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Sin sched_getaffinity (macOS, Windows)
+        return os.cpu_count() or 1
+
+
+def default_workers():
+    """Procesos del pool: uno por CPU disponible, como mucho TAX_INVOICE_EXPORT_MAX_WORKERS"""
+    max_workers = getattr(settings, 'TAX_INVOICE_EXPORT_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    return max(1, min(available_cpus(), max_workers))
+
+
+def _render_and_cache(key, tax_invoice):
+    from django.core.cache import cache
+
+    pdf = render_tax_invoice_pdf(tax_invoice)
+    cache.set(key, pdf, PDF_CACHE_TIMEOUT)
+    return pdf
+
+
+def render_pdfs(invoices, workers=None):
+    """
+    Genera los PDF de invoices. Produce (factura, pdf) según van terminando:
+    primero los que están en caché y después los generados en el pool.
+    """
+    from django.core.cache import cache
+
+    pending = []
+    for tax_invoice in invoices:
+        key = f'pdf:{tax_invoice_fingerprint(tax_invoice)}'
+        pdf = cache.get(key)
+        if pdf is not None:
+            yield tax_invoice, pdf
+        else:
+            pending.append((key, tax_invoice))
+
+    workers = workers or default_workers()
+    if workers == 1 or len(pending) < PARALLEL_MIN_INVOICES:
+        for key, tax_invoice in pending:
+            yield tax_invoice, _render_and_cache(key, tax_invoice)
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context('spawn'), initializer=_init_worker
+    )
+    # Como mucho 2 trabajos en cola por proceso: los PDF terminados no se acumulan en memoria
+    queue = iter(pending)
+    running = {}
+    try:
+        for key, tax_invoice in islice(queue, workers * 2):
+            running[executor.submit(_render, tax_invoice)] = (key, tax_invoice)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, tax_invoice = running.pop(future)
+                try:
+                    pdf = future.result()
+                except BrokenProcessPool:
+                    # Un proceso del pool ha muerto: lo que queda se genera en este proceso
+                    pdf = render_tax_invoice_pdf(tax_invoice)
+                cache.set(key, pdf, PDF_CACHE_TIMEOUT)
+                yield tax_invoice, pdf
+                following = next(queue, None)
+                if following is None:
+                    continue
+                try:
+                    running[executor.submit(_render, following[1])] = following
+                except BrokenProcessPool:
+                    for key, tax_invoice in chain([following], queue):
+                        yield tax_invoice, _render_and_cache(key, tax_invoice)
+    finally:
+        # También si la respuesta se corta: cancelar lo pendiente y cerrar los procesos
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _ZipOutput:
+    """Fichero de solo escritura para zipfile que entrega los bytes por trozos"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Genera los bytes de un ZIP con entries = iterable de (nombre, contenido)"""
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+            chunk = output.take()
+            if chunk:
+                yield chunk
+    chunk = output.take()
+    if chunk:
+        yield chunk
+
+
+def stream_quarter_zip(year, quarter, curso=None, workers=None):
+    """Bytes del ZIP con los PDF del trimestre, en streaming"""
+    invoices = list(quarter_invoices(year, quarter, curso))
+    return stream_zip(
+        (tax_invoice_filename(tax_invoice), pdf)
+        for tax_invoice, pdf in render_pdfs(invoices, workers=workers)
+    )
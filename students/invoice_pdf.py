@@ -0,0 +1,392 @@
+"""
+Generación de los PDF de facturas con caché por contenido.
+
+- render_invoice_pdf(invoice): factura de un pago con tarjeta (Invoice)
+- render_tax_invoice_pdf(tax_invoice): factura trimestral (TaxInvoice)
+- print_run_response(...): tirada de impresión, un solo PDF con una página
+  por factura (ver draw_invoices / draw_tax_invoice)
+
+Las facturas no cambian una vez emitidas, así que el PDF se guarda en la
+caché con una clave que es el hash de todos los campos de la factura, la
+versión de la plantilla (*_LAYOUT_VERSION) y el logo. Si cambia cualquier
+dato o la plantilla, cambia la clave y el PDF se vuelve a generar; no hace
+falta invalidar nada a mano. El mismo hash se usa como ETag, de modo que una
+descarga repetida con If-None-Match recibe un 304 sin tocar ReportLab.
+
+Al cambiar el diseño de un PDF hay que subir su *_LAYOUT_VERSION.
+"""
+import hashlib
+import io
+import tempfile
+
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import pdf_resources
+
+# Versión de la plantilla de cada PDF (subir al cambiar el diseño)
+INVOICE_LAYOUT_VERSION = 1
+TAX_INVOICE_LAYOUT_VERSION = 1
+
+
+# Segundos que se guarda un PDF en caché (las facturas no cambian)
+PDF_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+# Nombre del formulario (XObject) con el logo de la factura trimestral
+TAX_INVOICE_LOGO_FORM = 'TaxInvoiceLogo'
+
+# Facturas por lote de lectura en las tiradas de impresión
+PRINT_RUN_CHUNK_SIZE = 500
+
+def fingerprint(obj, layout, *extra):
+    """Hash de los campos de obj + versión de plantilla + datos extra"""
+    digest = hashlib.sha256(f'{type(obj).__name__}:{layout}'.encode())
+    for field in obj._meta.concrete_fields:
+        digest.update(f'|{field.attname}={field.value_from_object(obj)!r}'.encode())
+    for value in extra:
+        digest.update(f'|{value!r}'.encode())
+    return digest.hexdigest()
+
+
+def invoice_fingerprint(invoice):
+    from .models import Invoice
+    company = (Invoice.COMPANY_NAME, Invoice.COMPANY_CIF, Invoice.COMPANY_ADDRESS,
+               Invoice.COMPANY_CITY, Invoice.COMPANY_PHONE, Invoice.COMPANY_EMAIL, Invoice.IVA_RATE)
+    return fingerprint(invoice, INVOICE_LAYOUT_VERSION, company, invoice.payment.date_paid)
+
+
+def tax_invoice_fingerprint(tax_invoice):
+    return fingerprint(tax_invoice, TAX_INVOICE_LAYOUT_VERSION, pdf_resources.logo_signature())
+
+
+def tax_invoice_filename(tax_invoice):
+    """Nombre del PDF de una factura trimestral: 'fra 0012.pdf'"""
+    number = tax_invoice.invoice_number
+    num_short = number.split('/')[1] if '/' in number else number
+    return f'fra {num_short}.pdf'
+
+
+def get_or_render(key, render):
+    """PDF en bytes desde la caché, o renderizado y guardado si no está"""
+    cache_key = f'pdf:{key}'
+    pdf = cache.get(cache_key)
+    if pdf is None:
+        pdf = render()
+        cache.set(cache_key, pdf, PDF_CACHE_TIMEOUT)
+    return pdf
+
+
+def pdf_response(request, key, render, filename, last_modified=None):
+    """
+    Respuesta de descarga del PDF con ETag/Last-Modified.
+    Responde 304 si el navegador ya tiene esta versión; si no, sirve el PDF
+    desde la caché (renderizándolo solo la primera vez).
+    """
+    etag = f'"{key}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = HttpResponse(get_or_render(key, render), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['ETag'] = etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    # Privado (datos personales) y siempre revalidar: la revalidación es un 304
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def print_run_response(filename, draw, invoices):
+    """
+    Respuesta con la tirada de impresión de invoices: draw(output, invoices)
+    dibuja todas las facturas en un único PDF (un solo documento de ReportLab,
+    con estilos, fuentes y logo compartidos por todas las páginas).
+    El PDF se escribe en un fichero temporal que FileResponse envía por bloques.
+    """
+    output = tempfile.TemporaryFile()
+    try:
+        draw(output, invoices)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    response = FileResponse(output, as_attachment=True, filename=filename, content_type='application/pdf')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def render_invoice_pdf(invoice):
+    """Genera el PDF de una factura de pago con tarjeta. Retorna bytes."""
+    buffer = io.BytesIO()
+    draw_invoices(buffer, [invoice])
+    return buffer.getvalue()
+
+
+def draw_invoices(output, invoices):
+    """Dibuja una página por factura de pago con tarjeta en output (fichero o buffer)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import PageBreak, SimpleDocTemplate
+
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm
+    )
+
+    elements = []
+    for invoice in invoices:
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(_invoice_elements(invoice))
+    doc.build(elements)
+
+
+def _invoice_elements(invoice):
+    """Flowables de la página de una factura de pago con tarjeta"""
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Table, Paragraph, Spacer
+    from .models import Invoice
+
+    # Estilos y textos fijos (compartidos por todas las facturas del proceso)
+    styles = pdf_resources.invoice_stylesheet()
+    table_styles = pdf_resources.invoice_table_styles()
+    static_text = pdf_resources.invoice_static_text()
+
+    elements = []
+
+    # ===== CABECERA =====
+    # Tabla con datos empresa a la izquierda y "FACTURA" a la derecha
+    header_data = [
+        [
+            Paragraph(static_text['company_name'], styles['CompanyName']),
+            Paragraph("FACTURA", styles['InvoiceTitle'])
+        ],
+        [
+            Paragraph(static_text['company_details'], styles['Normal']),
+            Paragraph(f"<b>Nº:</b> {invoice.invoice_number}<br/><b>Fecha:</b> {invoice.date_issued.strftime('%d/%m/%Y')}", styles['Normal_Right'])
+        ]
+    ]
+
+    header_table = Table(header_data, colWidths=[10*cm, 7*cm])
+    header_table.setStyle(table_styles['header'])
+    elements.append(header_table)
+    elements.append(Spacer(1, 1*cm))
+
+    # ===== DATOS DEL CLIENTE =====
+    elements.append(Paragraph("DATOS DEL CLIENTE", styles['SectionTitle']))
+
+    client_data = [
+        ['Nombre:', invoice.client_name],
+        ['DNI:', invoice.client_dni],
+    ]
+    if invoice.client_address:
+        client_data.append(['Dirección:', invoice.client_address])
+
+    client_table = Table(client_data, colWidths=[3*cm, 14*cm])
+    client_table.setStyle(table_styles['client'])
+    elements.append(client_table)
+    elements.append(Spacer(1, 1*cm))
+
+    # ===== DETALLE DE LA FACTURA =====
+    elements.append(Paragraph("DETALLE", styles['SectionTitle']))
+
+    detail_data = [
+        ['Concepto', 'Base Imponible', f'IVA ({Invoice.IVA_RATE}%)', 'Total'],
+        [invoice.concept, f'{invoice.base_amount:.2f} €', f'{invoice.iva_amount:.2f} €', f'{invoice.total_amount:.2f} €'],
+    ]
+
+    detail_table = Table(detail_data, colWidths=[8*cm, 3*cm, 3*cm, 3*cm])
+    detail_table.setStyle(table_styles['detail'])
+    elements.append(detail_table)
+    elements.append(Spacer(1, 0.5*cm))
+
+    # ===== TOTALES =====
+    totals_data = [
+        ['Base Imponible:', f'{invoice.base_amount:.2f} €'],
+        [f'IVA ({Invoice.IVA_RATE}%):', f'{invoice.iva_amount:.2f} €'],
+        ['TOTAL:', f'{invoice.total_amount:.2f} €'],
+    ]
+
+    totals_table = Table(totals_data, colWidths=[13*cm, 4*cm])
+    totals_table.setStyle(table_styles['totals'])
+    elements.append(totals_table)
+    elements.append(Spacer(1, 1.5*cm))
+
+    # ===== MÉTODO DE PAGO =====
+    elements.append(Paragraph("INFORMACIÓN DE PAGO", styles['SectionTitle']))
+    elements.append(Paragraph("<b>Método de pago:</b> Tarjeta", styles['Normal']))
+    elements.append(Paragraph(f"<b>Fecha de pago:</b> {invoice.payment.date_paid.strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
+    elements.append(Spacer(1, 2*cm))
+
+    # ===== PIE =====
+    elements.append(Paragraph(static_text['footer'], styles['Normal']))
+
+    return elements
+
+
+def _tax_invoice_logo_form(c, margin_left, y):
+    """
+    Define el logo como formulario (XObject) del documento y retorna su nombre,
+    o None si no hay logo. Se dibuja una vez por PDF: en una tirada todas las
+    páginas reutilizan el mismo objeto con doForm().
+    """
+    from reportlab.lib.units import mm
+
+    logo = pdf_resources.logo_image()
+    if logo is None:
+        return None
+    c.beginForm(TAX_INVOICE_LOGO_FORM)
+    c.drawImage(logo, margin_left, y - 45 * mm, width=60 * mm, height=45 * mm, preserveAspectRatio=True)
+    c.endForm()
+    return TAX_INVOICE_LOGO_FORM
+
+
+def _draw_tax_invoice_header(c, tax_invoice, margin_left, y, logo_form):
+    """Logo (o nombre) y recuadro con los datos del emisor"""
+    from reportlab.lib import colors
+    from reportlab.lib.units import mm
+
+    issuer = pdf_resources.TAX_INVOICE_ISSUER
+
+    if logo_form is not None:
+        c.doForm(logo_form)
+    else:
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(margin_left, y - 5 * mm, "A U T O E S C U E L A")
+        c.setFont("Helvetica-Bold", 22)
+        c.drawString(margin_left, y - 15 * mm, "CARRASCO")
+
+    # Recuadro datos emisor (derecha)
+    box_x = 105 * mm
+    box_y = y - 45 * mm
+    box_width = 85 * mm
+    box_height = 43 * mm
+
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(0.5)
+    c.rect(box_x, box_y, box_width, box_height)
+
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(box_x + 3 * mm, box_y + box_height - 7 * mm,
+                 f"Fecha: {tax_invoice.fecha.strftime('%d/%m/%Y')}")
+    c.drawString(box_x + 3 * mm, box_y + box_height - 14 * mm,
+                 f"Nombre: {issuer['nombre']}")
+    c.setFont("Helvetica", 9)
+    c.drawString(box_x + 3 * mm, box_y + box_height - 20 * mm, issuer['dni'])
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(box_x + 3 * mm, box_y + box_height - 27 * mm,
+                 f"Domicilio: {issuer['domicilio']}")
+    c.drawString(box_x + 3 * mm, box_y + box_height - 33 * mm,
+                 f"C.P: {issuer['cp']}")
+    c.setFont("Helvetica", 9)
+    c.drawString(box_x + 3 * mm, box_y + box_height - 39 * mm, issuer['municipio'])
+
+
+def render_tax_invoice_pdf(tax_invoice):
+    """Genera el PDF de una factura trimestral (formato Carrasco). Retorna bytes."""
+    buffer = io.BytesIO()
+    draw_tax_invoice(buffer, [tax_invoice])
+    return buffer.getvalue()
+
+
+def draw_tax_invoice(output, tax_invoices):
+    """Dibuja una página por factura trimestral en output (fichero o buffer)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    from reportlab.lib.units import mm
+
+    c = canvas.Canvas(output, pagesize=A4)
+    logo_form = _tax_invoice_logo_form(c, 20 * mm, A4[1] - 20 * mm)
+    for tax_invoice in tax_invoices:
+        _draw_tax_invoice_page(c, tax_invoice, logo_form)
+        c.showPage()
+    c.save()
+
+
+def _draw_tax_invoice_page(c, tax_invoice, logo_form):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Table
+
+    width, height = A4
+    table_styles = pdf_resources.tax_invoice_table_styles()
+
+    margin_left = 20 * mm
+    margin_right = width - 20 * mm
+    y = height - 20 * mm
+
+    # === CABECERA ===
+    _draw_tax_invoice_header(c, tax_invoice, margin_left, y, logo_form)
+
+    y = y - 55 * mm
+
+    # === DATOS CLIENTE ===
+    client_box_height = 40 * mm
+    client_box_y = y - client_box_height
+    c.rect(margin_left, client_box_y, 80 * mm, client_box_height)
+
+    c.setFont("Helvetica-BoldOblique", 9)
+    c.drawString(margin_left + 3 * mm, y - 6 * mm, f"Cliente: {tax_invoice.client_name}")
+    c.drawString(margin_left + 3 * mm, y - 12 * mm, f"Dni: {tax_invoice.client_dni}")
+    c.drawString(margin_left + 3 * mm, y - 18 * mm, f"Domicilio: {tax_invoice.client_street}")
+    c.drawString(margin_left + 3 * mm, y - 24 * mm, f"C.P: {tax_invoice.client_postal_code}")
+
+    mun_prov = f"{tax_invoice.client_municipality}"
+    if tax_invoice.client_province:
+        mun_prov += f", {tax_invoice.client_province}"
+    c.drawString(margin_left + 3 * mm, y - 30 * mm, f"Municipio/Provincia: {mun_prov}")
+
+    c.setFont("Helvetica", 9)
+    c.drawString(margin_left + 3 * mm, y - 38 * mm,
+                 f"N FACTURA ALB {tax_invoice.invoice_number}")
+
+    y = y - 50 * mm
+
+    # === TABLA DE CONCEPTOS ===
+    conceptos = []
+
+    if tax_invoice.base_imponible > 0:
+        concepto_curso = f"CURSO PERMISO {tax_invoice.curso}\nALUMNO: {tax_invoice.client_name},\n{tax_invoice.client_dni}"
+        conceptos.append(['1', concepto_curso, f"{tax_invoice.base_imponible:.2f}", ''])
+
+    if tax_invoice.tasas_amount > 0:
+        conceptos.append(['1', "TASA DE TRAFICO (EXENTA DE IVA)", f"{tax_invoice.tasas_amount:.2f}", ''])
+
+    table_data = [['CANTIDAD', 'CONCEPTO', 'PRECIO', 'TOTAL']]
+    table_data.extend(conceptos)
+
+    while len(table_data) < 12:
+        table_data.append(['', '', '', ''])
+
+    col_widths = [20 * mm, 95 * mm, 25 * mm, 25 * mm]
+    table = Table(table_data, colWidths=col_widths)
+    table.setStyle(table_styles['concepts'])
+
+    table_width, table_height = table.wrap(0, 0)
+    table.drawOn(c, margin_left, y - table_height)
+
+    y = y - table_height - 10 * mm
+
+    # === TOTALES ===
+    iva_percent = 21 if tax_invoice.iva_amount > 0 else 0
+
+    totals_data = [
+        ['BASE IMPONIBLE', f"{tax_invoice.base_imponible:.2f}"],
+        [f'IVA {iva_percent} %', f"{tax_invoice.iva_amount:.2f}"],
+        ['EXENTO', f"{tax_invoice.tasas_amount:.2f}"],
+        ['TOTAL', f"{tax_invoice.total:.0f}"],
+    ]
+
+    totals_table = Table(totals_data, colWidths=[35 * mm, 20 * mm])
+    totals_table.setStyle(table_styles['totals'])
+
+    tw, th = totals_table.wrap(0, 0)
+    totals_table.drawOn(c, margin_right - tw, y - th)
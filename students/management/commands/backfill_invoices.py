@@ -0,0 +1,45 @@
+"""
+Comando para emitir las facturas de todos los pagos con tarjeta que aún no tienen,
+numeradas por orden de pago (ver students/invoice_backfill.py)
+
+Uso:
+    python manage.py backfill_invoices --preview
+    python manage.py backfill_invoices
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from students.invoice_backfill import backfill_card_invoices, preview_card_invoices
+
+
+class Command(BaseCommand):
+    help = 'Emite las facturas de los pagos con tarjeta sin factura, en orden de fecha de pago'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--preview',
+            action='store_true',
+            help='Solo mostrar las facturas que se emitirían (números provisionales)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        if options['preview']:
+            invoices = preview_card_invoices()
+            for invoice in invoices:
+                self.stdout.write(
+                    f'  [PREVIEW] {invoice.invoice_number} {invoice.date_issued:%d/%m/%Y} '
+                    f'{invoice.client_name}: {invoice.total_amount}€ - {invoice.concept}'
+                )
+        else:
+            invoices = backfill_card_invoices()
+
+        if not invoices:
+            self.stdout.write(self.style.SUCCESS('Todos los pagos con tarjeta tienen factura.'))
+            return
+
+        action = 'se emitirían' if options['preview'] else 'emitidas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(invoices)} facturas {action} ({invoices[0].invoice_number} - {invoices[-1].invoice_number}) '
+            f'en {time.monotonic() - start:.1f}s'
+        ))
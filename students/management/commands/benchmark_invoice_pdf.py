@@ -0,0 +1,123 @@
+"""
+Micro-benchmark del tiempo de generación de los PDF de facturas.
+
+Compara, para cada tipo de factura, el tiempo por PDF:
+- sin registro: se descartan los recursos de ReportLab antes de cada PDF
+  (estilos, TableStyle y logo se construyen cada vez)
+- con registro: los recursos se construyen una vez y se reutilizan
+
+Con un logo grande la diferencia es mucho mayor que sin logo (--logo).
+
+También compara una tirada de impresión (un solo PDF con una página por
+factura, draw_invoices / draw_tax_invoice) con generar el mismo número de
+PDF sueltos.
+
+No usa la base de datos: las facturas de ejemplo se crean en memoria.
+
+Uso:
+    python manage.py benchmark_invoice_pdf
+    python manage.py benchmark_invoice_pdf --iterations 500
+    python manage.py benchmark_invoice_pdf --logo static_images/Clio.png
+"""
+import datetime
+import io
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from students import pdf_resources
+from students.invoice_pdf import draw_invoices, draw_tax_invoice, render_invoice_pdf, render_tax_invoice_pdf
+from students.models import Invoice, Payment, TaxInvoice
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo por PDF de las facturas con y sin el registro de recursos de ReportLab'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=100,
+            help='PDFs generados por medición (default: 100)'
+        )
+        parser.add_argument(
+            '--logo',
+            help='Usar esta imagen como logo de la factura trimestral durante la medición'
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations debe ser mayor que 0')
+
+        if options['logo']:
+            pdf_resources.LOGO_PATH = options['logo']
+
+        invoice, tax_invoice = self.sample_invoices()
+        for name, render, draw, obj in (
+            ('Factura (tarjeta)', render_invoice_pdf, draw_invoices, invoice),
+            ('Factura trimestral', render_tax_invoice_pdf, draw_tax_invoice, tax_invoice),
+        ):
+            cold = self.measure(render, obj, iterations, reset=True)
+            warm = self.measure(render, obj, iterations, reset=False)
+            self.stdout.write(
+                f'{name}: sin registro {cold:.2f} ms/PDF, con registro {warm:.2f} ms/PDF '
+                f'(x{cold / warm:.1f})'
+            )
+            run = self.measure_print_run(draw, obj, iterations)
+            self.stdout.write(
+                f'{name}: tirada de {iterations} páginas {run:.2f} ms/página, '
+                f'{iterations} PDF sueltos {warm:.2f} ms/PDF (x{warm / run:.1f})'
+            )
+
+    def measure(self, render, obj, iterations, reset):
+        """Milisegundos por PDF"""
+        pdf_resources.reset()
+        render(obj)  # Calentar imports de ReportLab
+        start = time.perf_counter()
+        for _ in range(iterations):
+            if reset:
+                pdf_resources.reset()
+            render(obj)
+        return (time.perf_counter() - start) / iterations * 1000
+
+    def measure_print_run(self, draw, obj, iterations):
+        """Milisegundos por página de un solo PDF con iterations páginas"""
+        start = time.perf_counter()
+        draw(io.BytesIO(), [obj] * iterations)
+        return (time.perf_counter() - start) / iterations * 1000
+
+    def sample_invoices(self):
+        payment = Payment(amount=Decimal('121.00'), payment_method='CARD', date_paid=timezone.now())
+        invoice = Invoice(
+            payment=payment,
+            invoice_number='2025-00001',
+            date_issued=timezone.now(),
+            client_name='Ana García López',
+            client_dni='12345678Z',
+            client_address='C/ Mayor, 1 - 46470 Albal',
+            base_amount=Decimal('100.00'),
+            iva_amount=Decimal('21.00'),
+            total_amount=Decimal('121.00'),
+            concept='Clases prácticas'
+        )
+        tax_invoice = TaxInvoice(
+            invoice_number='2025/0001',
+            fecha=datetime.date(2025, 2, 1),
+            quarter=1,
+            year=2025,
+            curso='B',
+            base_imponible=Decimal('82.64'),
+            iva_amount=Decimal('17.36'),
+            tasas_amount=Decimal('94.05'),
+            total=Decimal('194.05'),
+            client_name='Ana García López',
+            client_dni='12345678Z',
+            client_street='C/ Mayor, 1',
+            client_postal_code='46470',
+            client_municipality='Albal',
+            client_province='VALENCIA'
+        )
+        return invoice, tax_invoice
@@ -0,0 +1,62 @@
+"""
+Comando para exportar a un ZIP los PDF de las facturas trimestrales de un trimestre
+
+Uso:
+    python manage.py export_tax_invoices --year 2025 --quarter 1
+    python manage.py export_tax_invoices --year 2025 --quarter 1 --curso B --output /tmp/t1.zip
+    python manage.py export_tax_invoices --year 2025 --quarter 1 --workers 4
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from students.invoice_export import quarter_invoices, render_pdfs, stream_zip, zip_filename
+from students.invoice_pdf import tax_invoice_filename
+from students.models import TaxInvoice
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo los PDF de las facturas trimestrales de un trimestre y los guarda en un ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help='Año de las facturas')
+        parser.add_argument('--quarter', type=int, required=True, choices=[1, 2, 3, 4], help='Trimestre (1-4)')
+        parser.add_argument(
+            '--curso',
+            choices=[value for value, _ in TaxInvoice.CURSO_CHOICES],
+            help='Exportar solo las facturas de este curso'
+        )
+        parser.add_argument('--output', help='Ruta del ZIP (default: facturas_AAAA_TN.zip)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Procesos para generar los PDF (default: CPUs disponibles, como mucho TAX_INVOICE_EXPORT_MAX_WORKERS)'
+        )
+
+
+
+    def handle(self, *args, **options):
+        year, quarter, curso = options['year'], options['quarter'], options['curso']
+        invoices = list(quarter_invoices(year, quarter, curso))
+        if not invoices:
+            raise CommandError(f'No hay facturas trimestrales para {year} T{quarter}.')
+
+        output = options['output'] or zip_filename(year, quarter, curso)
+        self.stdout.write(f'Exportando {len(invoices)} facturas a {output}...')
+
+        start = time.monotonic()
+        written = 0
+
+        def entries():
+            nonlocal written
+            for tax_invoice, pdf in render_pdfs(invoices, workers=options['workers']):
+                written += 1
+                if written % 50 == 0:
+                    self.stdout.write(f'  {written}/{len(invoices)} PDFs')
+                yield tax_invoice_filename(tax_invoice), pdf
+
+        with open(output, 'wb') as f:
+            for chunk in stream_zip(entries()):
+                f.write(chunk)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(f'{written} PDFs exportados a {output} en {elapsed:.1f}s'))
@@ -0,0 +1,57 @@
+"""
+Comando para exportar facturas trimestrales con las columnas de Trimestre-X.xlsx
+(el fichero, .xlsx o .csv, se puede volver a importar con import_trimestre)
+
+
+Uso:
+    python manage.py export_trimestre --year 2025 --quarter 1
+    python manage.py export_trimestre --year 2025 --output /tmp/facturas_2025.csv
+"""
+from django.core.management.base import BaseCommand, CommandError
+from students.models import TaxInvoice
+from students.spreadsheets import iter_csv, write_xlsx
+from students.trimestre_export import TRIMESTRE_HEADER, trimestre_filename, trimestre_rows
+
+
+class Command(BaseCommand):
+    help = 'Exporta facturas trimestrales a Excel o CSV en el formato de import_trimestre'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Año de las facturas')
+        parser.add_argument('--quarter', type=int, choices=[1, 2, 3, 4], help='Trimestre (1-4)')
+        parser.add_argument(
+            '--output',
+            help='Ruta del fichero .xlsx o .csv (default: Trimestre-N-AAAA.xlsx)'
+        )
+
+    def handle(self, *args, **options):
+        year, quarter = options['year'], options['quarter']
+        if quarter and not year:
+            raise CommandError('--quarter necesita --year')
+
+        invoices = TaxInvoice.objects.all()
+        if year:
+            invoices = invoices.filter(year=year)
+        if quarter:
+            invoices = invoices.filter(quarter=quarter)
+
+        output = options['output'] or f'{trimestre_filename(year, quarter)}.xlsx'
+        if not output.endswith(('.xlsx', '.csv')):
+            raise CommandError('--output debe terminar en .xlsx o .csv')
+
+        count = 0
+
+        def rows():
+            nonlocal count
+            for row in trimestre_rows(invoices):
+                count += 1
+                yield row
+
+        if output.endswith('.csv'):
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                for chunk in iter_csv(TRIMESTRE_HEADER, rows()):
+                    f.write(chunk)
+        else:
+            write_xlsx(output, 'Trimestre', TRIMESTRE_HEADER, rows())
+
+        self.stdout.write(self.style.SUCCESS(f'{count} facturas exportadas a {output}'))
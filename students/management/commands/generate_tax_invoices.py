@@ -0,0 +1,61 @@
+"""
+Comando para crear en bloque las facturas trimestrales de los pagos sin factura
+(una factura por alumno y trimestre, ver students/tax_invoice_batch.py)
+
+Uso:
+    python manage.py generate_tax_invoices --from 2025-01-01 --to 2025-03-31 --preview
+    python manage.py generate_tax_invoices --from 2025-01-01 --to 2025-03-31
+"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from students.tax_invoice_batch import generate_tax_invoices, preview_tax_invoices
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Fecha no válida: {value} (formato AAAA-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'Crea las facturas trimestrales de todos los pagos sin factura de un rango de fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='Primer día de pago (AAAA-MM-DD)')
+        parser.add_argument('--to', dest='date_to', required=True, help='Último día de pago (AAAA-MM-DD)')
+        parser.add_argument(
+            '--preview',
+            action='store_true',
+            help='Solo mostrar las facturas que se crearían (números provisionales)'
+        )
+
+    def handle(self, *args, **options):
+        date_from, date_to = parse_date(options['date_from']), parse_date(options['date_to'])
+        if date_from > date_to:
+            raise CommandError('--from no puede ser posterior a --to')
+
+        start = time.monotonic()
+        if options['preview']:
+            invoices = preview_tax_invoices(date_from, date_to)
+            for tax_invoice in invoices:
+                self.stdout.write(
+                    f'  [PREVIEW] {tax_invoice.invoice_number} {tax_invoice.fecha} {tax_invoice.client_name} '
+                    f'({tax_invoice.curso}, {len(tax_invoice.batch_payments)} pagos): {tax_invoice.total}€'
+                )
+        else:
+            invoices = generate_tax_invoices(date_from, date_to)
+
+        if not invoices:
+            self.stdout.write(self.style.WARNING('No hay pagos sin factura en ese periodo.'))
+            return
+
+        total = sum(tax_invoice.total for tax_invoice in invoices)
+        payments = sum(len(tax_invoice.batch_payments) for tax_invoice in invoices)
+        action = 'se crearían' if options['preview'] else 'creadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(invoices)} facturas {action} con {payments} pagos ({total}€) '
+            f'en {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,87 @@
+"""
+Comando para reconstruir o verificar los saldos materializados (StudentBalance):
+totales de cargos y pagos y contador de minutos de prácticas del bono.
+
+Uso:
+    python manage.py rebuild_balances             # Reconstruye todos los saldos
+    python manage.py rebuild_balances --verify    # Solo compara y muestra diferencias
+    python manage.py rebuild_balances --student 12 --student 15
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from students.models import Student, StudentBalance
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye o verifica los saldos materializados (cargos, pagos y minutos de prácticas) desde el historial'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Solo verificar: mostrar saldos incorrectos sin modificarlos'
+        )
+        parser.add_argument(
+            '--student',
+            action='append',
+            type=int,
+            dest='students',
+            help='ID de alumno a procesar (se puede repetir)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Tamaño de lote para escritura (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        student_ids = options['students']
+
+        if options['verify']:
+            mismatches = self.verify(student_ids)
+            if mismatches:
+                raise CommandError(f'{mismatches} saldos incorrectos. Ejecutar sin --verify para corregirlos.')
+            self.stdout.write(self.style.SUCCESS('Todos los saldos son correctos.'))
+            return
+
+        with transaction.atomic():
+            written = StudentBalance.rebuild(student_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{written} saldos reconstruidos.'))
+
+    def verify(self, student_ids):
+        """Compara el saldo almacenado con el calculado. Retorna el número de diferencias."""
+        students = Student.objects.order_by('pk')
+        if student_ids:
+            students = students.filter(pk__in=student_ids)
+        rows = students.annotate(
+            debt=StudentBalance.debt_subquery(),
+            paid=StudentBalance.paid_subquery(),
+            minutes=StudentBalance.practice_minutes_subquery()
+        ).values_list(
+            'pk', 'debt', 'paid', 'minutes',
+            'ledger__total_debt', 'ledger__total_paid', 'ledger__practice_minutes'
+        )
+
+        checked = 0
+        mismatches = 0
+        for pk, debt, paid, minutes, stored_debt, stored_paid, stored_minutes in rows.iterator(chunk_size=1000):
+            checked += 1
+            debt = StudentBalance.to_money(debt)
+            paid = StudentBalance.to_money(paid)
+            if stored_debt is None:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'  Alumno #{pk}: sin saldo materializado'))
+            elif stored_debt != debt or stored_paid != paid:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f'  Alumno #{pk}: cargos {stored_debt}€ (real {debt}€), pagos {stored_paid}€ (real {paid}€)'
+                ))
+            elif stored_minutes != minutes:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f'  Alumno #{pk}: minutos de prácticas {stored_minutes}\' (real {minutes}\')'
+                ))
+
+        self.stdout.write(f'Alumnos verificados: {checked}')
+        return mismatches
@@ -0,0 +1,28 @@
+"""
+Comando para regenerar el índice de búsqueda de alumnos (StudentSearchToken)
+
+Uso:
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --student 12
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from students.models import StudentSearchToken
+
+
+class Command(BaseCommand):
+    help = 'Regenera los tokens de búsqueda normalizados (nombre sin tildes, DNI, teléfono) de los alumnos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--student',
+            action='append',
+            type=int,
+            dest='students',
+            help='ID de alumno a procesar (se puede repetir)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = StudentSearchToken.rebuild(options['students'])
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda regenerado para {count} alumnos.'))
@@ -0,0 +1,65 @@
+"""
+Comando para reconstruir o verificar el resumen trimestral de IVA
+(TaxInvoiceSummary) desde las facturas trimestrales.
+
+Uso:
+    python manage.py rebuild_tax_summary             # Reconstruye todo el resumen
+    python manage.py rebuild_tax_summary --verify    # Solo compara y muestra diferencias
+"""
+from django.core.management.base import BaseCommand, CommandError
+from students.models import TaxInvoice, TaxInvoiceSummary
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye o verifica el resumen trimestral de IVA desde las facturas trimestrales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Solo verificar: mostrar grupos incorrectos sin modificarlos'
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = self.verify()
+            if mismatches:
+                raise CommandError(f'{mismatches} grupos incorrectos. Ejecutar sin --verify para corregirlos.')
+            self.stdout.write(self.style.SUCCESS('El resumen trimestral es correcto.'))
+            return
+
+        written = TaxInvoiceSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{written} grupos (año, trimestre, curso) reconstruidos.'))
+
+    def verify(self):
+        """Compara el resumen almacenado con el calculado. Retorna el número de diferencias."""
+        fields = ['invoice_count'] + TaxInvoiceSummary.AMOUNT_FIELDS
+        stored = {
+            (summary.year, summary.quarter, summary.curso): summary
+            for summary in TaxInvoiceSummary.objects.all()
+        }
+        mismatches = 0
+        for totals in TaxInvoiceSummary.group_totals(TaxInvoice.objects.all()):
+            expected = TaxInvoiceSummary.from_totals(totals)
+            group = (expected.year, expected.quarter, expected.curso)
+            summary = stored.pop(group, None)
+            label = f'{expected.year} T{expected.quarter} {expected.curso}'
+            if summary is None:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'  {label}: sin resumen ({expected.invoice_count} facturas)'))
+                continue
+            differences = [
+                f'{field} {getattr(summary, field)} (real {getattr(expected, field)})'
+                for field in fields
+                if getattr(summary, field) != getattr(expected, field)
+            ]
+            if differences:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'  {label}: {", ".join(differences)}'))
+
+        for summary in stored.values():
+            mismatches += 1
+            self.stdout.write(self.style.WARNING(
+                f'  {summary.year} T{summary.quarter} {summary.curso}: resumen sin facturas'
+            ))
+        return mismatches
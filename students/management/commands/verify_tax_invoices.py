@@ -0,0 +1,91 @@
+"""
+Comando para verificar los importes de las facturas trimestrales guardadas.
+
+Recalcula cada factura desde su total, sus tasas (flags y renovaciones) y su
+curso con TaxInvoice.compute_components_batch y muestra las que no coinciden
+con la base, el IVA, las tasas o el total guardados. Una factura creada con
+compute_components siempre coincide: recalcularla desde su total da los
+mismos importes.
+
+Uso:
+    python manage.py verify_tax_invoices
+    python manage.py verify_tax_invoices --year 2025 --quarter 1
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from students.models import TaxInvoice
+
+# Facturas que se recalculan por lote
+CHUNK_SIZE = 5000
+
+# Facturas incorrectas que se muestran como máximo
+MAX_REPORTED = 100
+
+
+class Command(BaseCommand):
+    help = 'Verifica base, IVA, tasas y total de las facturas trimestrales guardadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Verificar solo las facturas de este año')
+        parser.add_argument('--quarter', type=int, choices=[1, 2, 3, 4], help='Verificar solo este trimestre')
+
+    def handle(self, *args, **options):
+        invoices = TaxInvoice.objects.all()
+        if options['year']:
+            invoices = invoices.filter(year=options['year'])
+        if options['quarter']:
+            invoices = invoices.filter(quarter=options['quarter'])
+        rows = invoices.order_by('year', 'invoice_number').values_list(
+            'invoice_number', 'curso', 'has_tasa_basica', 'has_tasa_a', 'has_traslado', 'renovaciones_count',
+            'base_imponible', 'iva_amount', 'tasas_amount', 'total'
+        )
+
+        start = time.monotonic()
+        checked = 0
+        mismatches = 0
+        chunk = []
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                mismatches += self.verify(chunk, mismatches)
+                checked += len(chunk)
+                chunk = []
+        if chunk:
+            mismatches += self.verify(chunk, mismatches)
+            checked += len(chunk)
+
+        self.stdout.write(f'Facturas verificadas: {checked} en {time.monotonic() - start:.1f}s')
+        if mismatches:
+            raise CommandError(f'{mismatches} facturas con importes incorrectos.')
+        self.stdout.write(self.style.SUCCESS('Todas las facturas son correctas.'))
+
+    def verify(self, chunk, reported):
+        """Recalcula un lote de facturas. Retorna el número de facturas incorrectas."""
+        to_cents = TaxInvoice.to_cents
+        (numbers, cursos, basicas, tasas_a, traslados, renovaciones,
+         bases, ivas, tasas, totals) = zip(*chunk)
+        stored = [
+            [to_cents(amount) for amount in column]
+            for column in (bases, ivas, tasas, totals)
+        ]
+        expected = TaxInvoice.compute_components_batch(
+            stored[3], basicas, tasas_a, traslados, renovaciones, cursos
+        )
+
+        mismatches = 0
+        labels = ('base', 'IVA', 'tasas', 'total')
+        for i, number in enumerate(numbers):
+            differences = [
+                f'{label} {TaxInvoice.from_cents(stored[column][i])} '
+                f'(calculado {TaxInvoice.from_cents(expected[column][i])})'
+                for column, label in enumerate(labels)
+                if stored[column][i] != expected[column][i]
+            ]
+            if differences:
+                mismatches += 1
+                if reported + mismatches <= MAX_REPORTED:
+                    self.stdout.write(self.style.WARNING(f'  {number} ({cursos[i]}): {", ".join(differences)}'))
+                elif reported + mismatches == MAX_REPORTED + 1:
+                    self.stdout.write(self.style.WARNING('  ... (solo se muestran las primeras)'))
+        return mismatches
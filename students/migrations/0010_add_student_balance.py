@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_balances(apps, schema_editor):
+    """Calcula el saldo inicial de todos los alumnos existentes"""
+    Student = apps.get_model('students', 'Student')
+    Voucher = apps.get_model('students', 'Voucher')
+    Payment = apps.get_model('students', 'Payment')
+    StudentBalance = apps.get_model('students', 'StudentBalance')
+
+    debts = dict(
+        Voucher.objects.order_by().values('student_id').annotate(total=Sum('amount')).values_list('student_id', 'total')
+    )
+    paid = dict(
+        Payment.objects.order_by().values('student_id').annotate(total=Sum('amount')).values_list('student_id', 'total')
+    )
+    StudentBalance.objects.bulk_create(
+        [
+            StudentBalance(
+                student_id=pk,
+                total_debt=debts.get(pk) or 0,
+                total_paid=paid.get(pk) or 0,
+            )
+            for pk in Student.objects.values_list('pk', flat=True)
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_add_tax_invoice_and_address_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='students.student', verbose_name='Alumno')),
+                ('total_debt', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total en cargos')),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total pagado')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Alumno',
+                'verbose_name_plural': 'Saldos de Alumnos',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
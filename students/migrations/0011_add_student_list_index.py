@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0010_add_student_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['-date_registered', '-id'], name='students_st_date_re_9f03d3_idx'),
+        ),
+    ]
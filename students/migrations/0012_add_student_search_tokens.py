@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:20
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de la normalización de students/search.py tal como estaba al crear
+# esta migración: si search.py cambia, la migración sigue generando lo mismo.
+MAX_TOKEN_LENGTH = 100
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_NON_DIGIT = re.compile(r'[^0-9]+')
+
+
+def fold(text):
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def name_tokens(text):
+    return [t[:MAX_TOKEN_LENGTH] for t in _NON_ALNUM.split(fold(text)) if t]
+
+
+def phone_tokens(phone):
+    digits = _NON_DIGIT.sub('', phone or '')
+    if not digits:
+        return []
+    tokens = [digits]
+    if digits.startswith('0034'):
+        tokens.append(digits[4:])
+    elif digits.startswith('34') and len(digits) > 9:
+        tokens.append(digits[2:])
+    return tokens
+
+
+def student_tokens(student):
+    tokens = set(name_tokens(student.first_name))
+    tokens.update(name_tokens(student.last_name))
+    dni = _NON_ALNUM.sub('', fold(student.dni))[:MAX_TOKEN_LENGTH]
+    if dni:
+        tokens.add(dni)
+    tokens.update(phone_tokens(student.phone))
+    return tokens
+
+
+def populate_search_tokens(apps, schema_editor):
+    """Genera los tokens de búsqueda de los alumnos existentes"""
+    Student = apps.get_model('students', 'Student')
+    StudentSearchToken = apps.get_model('students', 'StudentSearchToken')
+
+    batch = []
+    for student in Student.objects.only('pk', 'first_name', 'last_name', 'dni', 'phone').iterator():
+        batch.extend(
+            StudentSearchToken(student_id=student.pk, token=token)
+            for token in student_tokens(student)
+        )
+    StudentSearchToken.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0011_add_student_list_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100, verbose_name='Token')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='students.student', verbose_name='Alumno')),
+            ],
+            options={
+                'verbose_name': 'Token de búsqueda',
+                'verbose_name_plural': 'Tokens de búsqueda',
+                'indexes': [models.Index(fields=['token', 'student'], name='students_st_token_fb82f5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'token'), name='unique_student_search_token')],
+            },
+        ),
+        migrations.RunPython(populate_search_tokens, migrations.RunPython.noop),
+    ]
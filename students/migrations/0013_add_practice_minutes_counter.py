@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:23
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+PRACTICE_CONCEPTS = ['PRACTICE_90', 'PRACTICE_60', 'PRACTICE_45', 'PRACTICE_30']
+
+
+def populate_practice_minutes(apps, schema_editor):
+    """Calcula los minutos de prácticas facturadas individualmente de cada alumno"""
+    Practice = apps.get_model('students', 'Practice')
+    StudentBalance = apps.get_model('students', 'StudentBalance')
+
+    minutes = (
+        Practice.objects.filter(is_billed=True, billed_voucher__concept_type__in=PRACTICE_CONCEPTS)
+        .order_by().values('student_id').annotate(total=Sum('duration')).values_list('student_id', 'total')
+    )
+    for student_id, total in minutes:
+        StudentBalance.objects.filter(student_id=student_id).update(practice_minutes=total or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0012_add_student_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentbalance',
+            name='practice_minutes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Minutos de prácticas (bono)'),
+        ),
+        migrations.RunPython(populate_practice_minutes, migrations.RunPython.noop),
+    ]
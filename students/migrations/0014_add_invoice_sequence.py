@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:39
+
+from django.db import migrations, models
+
+
+def import_invoice_numbers(apps, schema_editor):
+    """Inicializa cada secuencia con el mayor número ya emitido en su serie y año"""
+    Invoice = apps.get_model('students', 'Invoice')
+    TaxInvoice = apps.get_model('students', 'TaxInvoice')
+    InvoiceSequence = apps.get_model('students', 'InvoiceSequence')
+
+    last_numbers = {}
+
+    def register(series, year, number):
+        key = (series, year)
+        last_numbers[key] = max(last_numbers.get(key, 0), number)
+
+    # Facturas de pago con tarjeta: AAAA-XXXXX
+    for invoice_number in Invoice.objects.values_list('invoice_number', flat=True).iterator():
+        try:
+            year, number = invoice_number.split('-')
+            register('INVOICE', int(year), int(number))
+        except ValueError:
+            continue
+
+    # Facturas trimestrales: AAAA/NNNN (el año de la secuencia es el campo year)
+    for year, invoice_number in TaxInvoice.objects.values_list('year', 'invoice_number').iterator():
+        try:
+            register('TAX_INVOICE', year, int(invoice_number.split('/')[1]))
+        except (IndexError, ValueError):
+            continue
+
+    InvoiceSequence.objects.bulk_create([
+        InvoiceSequence(series=series, year=year, last_number=number)
+        for (series, year), number in last_numbers.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0013_add_practice_minutes_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(choices=[('INVOICE', 'Facturas de pago con tarjeta (AAAA-XXXXX)'), ('TAX_INVOICE', 'Facturas trimestrales (AAAA/NNNN)')], max_length=20, verbose_name='Serie')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Año')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Último número emitido')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de facturas',
+                'verbose_name_plural': 'Secuencias de facturas',
+                'constraints': [models.UniqueConstraint(fields=('series', 'year'), name='unique_invoice_sequence')],
+            },
+        ),
+        migrations.RunPython(import_invoice_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:40
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_tax_invoice_summary(apps, schema_editor):
+    """Calcula el resumen de cada (año, trimestre, curso) desde las facturas existentes"""
+    TaxInvoice = apps.get_model('students', 'TaxInvoice')
+    TaxInvoiceSummary = apps.get_model('students', 'TaxInvoiceSummary')
+
+    def to_money(value):
+        return Decimal(str(value or 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    groups = TaxInvoice.objects.order_by().values('year', 'quarter', 'curso').annotate(
+        count=Count('pk'),
+        base=Sum('base_imponible'),
+        iva=Sum('iva_amount'),
+        tasas=Sum('tasas_amount'),
+        sum_total=Sum('total')
+    )
+    TaxInvoiceSummary.objects.bulk_create([
+        TaxInvoiceSummary(
+            year=group['year'],
+            quarter=group['quarter'],
+            curso=group['curso'],
+            invoice_count=group['count'],
+            base_imponible=to_money(group['base']),
+            iva_amount=to_money(group['iva']),
+            tasas_amount=to_money(group['tasas']),
+            total=to_money(group['sum_total'])
+        )
+        for group in groups
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0014_add_invoice_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxInvoiceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='Año')),
+                ('quarter', models.PositiveSmallIntegerField(choices=[(1, 'T1'), (2, 'T2'), (3, 'T3'), (4, 'T4')], verbose_name='Trimestre')),
+                ('curso', models.CharField(choices=[('AM', 'AM - Ciclomotores'), ('A1', 'A1 - Motocicletas hasta 125cc'), ('A2', 'A2 - Motocicletas hasta 35kW'), ('A', 'A - Motocicletas sin límite'), ('B', 'B - Automóviles'), ('C', 'C - Camiones'), ('C+E', 'C+E - Camión con remolque')], max_length=5, verbose_name='Tipo de curso')),
+                ('invoice_count', models.PositiveIntegerField(default=0, verbose_name='Facturas')),
+                ('base_imponible', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Base imponible')),
+                ('iva_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='IVA')),
+                ('tasas_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Tasas DGT (exento)')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total facturado')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Resumen trimestral de IVA',
+                'verbose_name_plural': 'Resúmenes trimestrales de IVA',
+                'ordering': ['-year', 'quarter', 'curso'],
+                'constraints': [models.UniqueConstraint(fields=('year', 'quarter', 'curso'), name='unique_tax_invoice_summary')],
+            },
+        ),
+        migrations.RunPython(populate_tax_invoice_summary, migrations.RunPython.noop),
+    ]
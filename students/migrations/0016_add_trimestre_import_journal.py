@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0015_add_tax_invoice_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrimestreImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Hash del contenido')),
+                ('sheet', models.CharField(max_length=100, verbose_name='Hoja')),
+                ('file_name', models.CharField(max_length=255, verbose_name='Fichero')),
+                ('row_count', models.PositiveIntegerField(default=0, verbose_name='Filas importadas')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Inicio')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+            ],
+            options={
+                'verbose_name': 'Importación trimestral',
+                'verbose_name_plural': 'Importaciones trimestrales',
+                'ordering': ['-started_at'],
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'sheet'), name='unique_trimestre_import')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrimestreImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_num', models.PositiveIntegerField(verbose_name='Fila')),
+                ('invoice_number', models.CharField(blank=True, max_length=20, verbose_name='Número de factura')),
+                ('row_hash', models.CharField(max_length=64, verbose_name='Huella de la fila')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='students.payment', verbose_name='Pago')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='students.student', verbose_name='Alumno')),
+                ('tax_invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='students.taxinvoice', verbose_name='Factura trimestral')),
+                ('trimestre_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='students.trimestreimport', verbose_name='Importación')),
+            ],
+            options={
+                'verbose_name': 'Fila importada',
+                'verbose_name_plural': 'Filas importadas',
+                'indexes': [models.Index(fields=['invoice_number'], name='students_tr_invoice_c30e6a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trimestre_import', 'row_num', 'invoice_number'), name='unique_trimestre_import_row')],
+            },
+        ),
+    ]
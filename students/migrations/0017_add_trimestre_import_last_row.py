@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0016_add_trimestre_import_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trimestreimport',
+            name='last_row',
+            field=models.PositiveIntegerField(default=0, verbose_name='Última fila escrita'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:10
+
+from django.db import migrations
+
+LIKE_INDEX_NAME = 'students_searchtoken_token_like'
+
+
+def create_like_index(apps, schema_editor):
+    """
+    Índice varchar_pattern_ops para token LIKE 'prefijo%' en PostgreSQL
+    (con una collation distinta de C el índice normal no sirve para prefijos).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {LIKE_INDEX_NAME} '
+        f'ON students_studentsearchtoken (token varchar_pattern_ops)'
+    )
+
+
+def drop_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {LIKE_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0017_add_trimestre_import_last_row'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_like_index, drop_like_index),
+    ]
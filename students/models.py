@@ -13,9 +13,13 @@ El modelo Student incluye métodos para cálculo automático de:
 - get_balance(): Diferencia entre pagos y deuda
 - get_pending_amount(): Cantidad pendiente de pago
 
-Relaciones: LicenseType → Student → (Voucher + Payment)
+Estos métodos leen del saldo materializado (StudentBalance), que se
+mantiene actualizado desde students/signals.py en cada alta, modificación
+o borrado de Voucher/Payment.
+
+Relaciones: LicenseType → Student → (Voucher + Payment) → StudentBalance
 """
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
@@ -93,23 +97,31 @@ class Student(models.Model):
         verbose_name = "Alumno"
         verbose_name_plural = "Alumnos"
         ordering = ['-date_registered']
+        indexes = [
+            # Paginación por cursor del panel principal (date_registered, id)
+            models.Index(fields=['-date_registered', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def get_ledger(self):
+        """Retorna el saldo materializado del alumno (lo crea si no existe)"""
+        try:
+            return self.ledger
+        except StudentBalance.DoesNotExist:
+            if self.pk is None:
+                return StudentBalance(total_debt=0, total_paid=0)
+            self.ledger = StudentBalance.refresh(self.pk)
+            return self.ledger
+
     def get_total_debt(self):
         """Calcula el total que debe pagar el alumno"""
-        total_vouchers = self.vouchers.aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        return total_vouchers
+        return self.get_ledger().total_debt
 
     def get_total_paid(self):
         """Calcula el total pagado por el alumno"""
-        total_payments = self.payments.aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        return total_payments
+        return self.get_ledger().total_paid
 
     def get_balance(self):
         """Calcula el saldo pendiente (negativo = debe, positivo = crédito)"""
@@ -154,6 +166,14 @@ class Voucher(models.Model):
         'OTHER': 0.00,  # Para "Otros" el usuario ingresa el importe
     }
 
+    # Prácticas individuales: concepto → duración en minutos
+    PRACTICE_DURATIONS = {
+        'PRACTICE_90': 90,
+        'PRACTICE_60': 60,
+        'PRACTICE_45': 45,
+        'PRACTICE_30': 30,
+    }
+
     student = models.ForeignKey(
         Student,
         on_delete=models.CASCADE,
@@ -319,6 +339,267 @@ class Payment(models.Model):
         return whatsapp_url
 
 
+class StudentBalance(models.Model):
+    """
+    Saldo materializado por alumno.
+
+    Guarda la suma de cargos y pagos para que Student.get_balance() sea una
+    lectura directa. Se recalcula desde las señales de Voucher/Payment
+    (ver students/signals.py) y se puede reconstruir con el comando
+    rebuild_balances.
+
+    practice_minutes acumula los minutos de prácticas facturadas
+    individualmente y lo mantiene students/bonus.py para decidir los
+    descuentos de bono de forma incremental.
+
+    updated_at cambia con cualquier modificación de cargos, pagos, prácticas
+    o facturas trimestrales del alumno y sirve como versión de la caché de
+    fragmentos de la ficha (ver cache_version).
+    """
+    student = models.OneToOneField(
+        Student,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ledger',
+        verbose_name="Alumno"
+    )
+    total_debt = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total en cargos"
+    )
+    total_paid = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total pagado"
+    )
+    practice_minutes = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Minutos de prácticas (bono)"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
+
+    class Meta:
+        verbose_name = "Saldo de Alumno"
+        verbose_name_plural = "Saldos de Alumnos"
+
+    def __str__(self):
+        return f"Saldo {self.student_id}: {self.total_paid - self.total_debt}€"
+
+    @property
+    def cache_version(self):
+        """Versión de la caché de la ficha del alumno (microsegundos de updated_at)"""
+        if self.updated_at is None:
+            return 0
+        return int(self.updated_at.timestamp() * 1000000)
+
+    @classmethod
+    def touch(cls, student_id):
+        """Invalida la caché de la ficha del alumno sin recalcular el saldo"""
+        if not cls.objects.filter(student_id=student_id).update(updated_at=timezone.now()):
+            cls.refresh(student_id)
+
+    @staticmethod
+    def debt_subquery(outer_ref='pk'):
+        """Subconsulta SUM(amount) de cargos del alumno referenciado"""
+        from django.db.models import OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        totals = Voucher.objects.filter(
+            student_id=OuterRef(outer_ref)
+        ).order_by().values('student_id').annotate(total=Sum('amount')).values('total')
+        return Coalesce(
+            Subquery(totals, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )
+
+    @staticmethod
+    def paid_subquery(outer_ref='pk'):
+        """Subconsulta SUM(amount) de pagos del alumno referenciado"""
+        from django.db.models import OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        totals = Payment.objects.filter(
+            student_id=OuterRef(outer_ref)
+        ).order_by().values('student_id').annotate(total=Sum('amount')).values('total')
+        return Coalesce(
+            Subquery(totals, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )
+
+    @staticmethod
+    def practice_minutes_subquery(outer_ref='pk'):
+        """Subconsulta SUM(duration) de prácticas facturadas individualmente"""
+        from django.db.models import OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        totals = Practice.objects.filter(
+            student_id=OuterRef(outer_ref),
+            is_billed=True,
+            billed_voucher__concept_type__in=list(Voucher.PRACTICE_DURATIONS)
+        ).order_by().values('student_id').annotate(total=Sum('duration')).values('total')
+        return Coalesce(
+            Subquery(totals, output_field=models.PositiveIntegerField()),
+            Value(0, output_field=models.PositiveIntegerField())
+        )
+
+    @staticmethod
+    def to_money(value):
+        """Normaliza una suma de la base de datos a Decimal con 2 decimales"""
+        from decimal import Decimal, ROUND_HALF_UP
+        return Decimal(str(value or 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def refresh(cls, student_id):
+        """
+        Recalcula el saldo de un alumno desde sus cargos y pagos y lo retorna.
+        Si el registro no existe lo crea (calculando también los minutos de
+        prácticas desde el historial). Student.DoesNotExist si el alumno no existe.
+
+        La fila se bloquea (SELECT ... FOR UPDATE) antes de sumar: dos
+        transacciones que cambian pagos o cargos del mismo alumno a la vez
+        recalculan una detrás de otra, y la segunda ya ve lo que ha
+        confirmado la primera (con el UPDATE solo, su subconsulta usaría la
+        foto del inicio de la sentencia y pisaría el total con uno antiguo).
+        """
+        with transaction.atomic():
+            created = False
+            if not cls.objects.select_for_update().filter(student_id=student_id).exists():
+                if not Student.objects.filter(pk=student_id).exists():
+                    raise Student.DoesNotExist(f'No existe el alumno {student_id}')
+                # Si otra transacción lo crea a la vez, el INSERT espera y se ignora
+                created = bool(cls.objects.bulk_create([cls(student_id=student_id)], ignore_conflicts=True))
+                cls.objects.select_for_update().filter(student_id=student_id).exists()
+
+            fields = {
+                'total_debt': cls.debt_subquery('student_id'),
+                'total_paid': cls.paid_subquery('student_id'),
+                'updated_at': timezone.now(),
+            }
+            if created:
+                fields['practice_minutes'] = cls.practice_minutes_subquery('student_id')
+            cls.objects.filter(student_id=student_id).update(**fields)
+            return cls.objects.get(student_id=student_id)
+
+    @classmethod
+    def refresh_many(cls, student_ids):
+        """
+        Recalcula cargos y pagos de varios alumnos con un único UPDATE
+        (bloqueando antes las filas, como refresh()).
+        Para escrituras en bloque (bulk_create no dispara las señales).
+        """
+        with transaction.atomic():
+            list(cls.objects.select_for_update().filter(student_id__in=student_ids).order_by('pk').values_list('pk'))
+            return cls.objects.filter(student_id__in=student_ids).update(
+                total_debt=cls.debt_subquery('student_id'),
+                total_paid=cls.paid_subquery('student_id'),
+                updated_at=timezone.now()
+            )
+
+
+    @classmethod
+    def rebuild(cls, student_ids=None, batch_size=500):
+        """
+        Reconstruye en bloque los saldos y minutos de prácticas
+        (todos o los de student_ids) desde el historial.
+        Retorna el número de saldos escritos.
+        """
+        students = Student.objects.order_by('pk')
+        if student_ids is not None:
+            students = students.filter(pk__in=student_ids)
+        rows = students.annotate(
+            debt=cls.debt_subquery(),
+            paid=cls.paid_subquery(),
+            minutes=cls.practice_minutes_subquery()
+        ).values_list('pk', 'debt', 'paid', 'minutes')
+
+        now = timezone.now()
+        written = 0
+        batch = []
+        for pk, debt, paid, minutes in rows.iterator(chunk_size=batch_size):
+            batch.append(cls(
+                student_id=pk,
+                total_debt=cls.to_money(debt),
+                total_paid=cls.to_money(paid),
+                practice_minutes=minutes,
+                updated_at=now
+            ))
+            if len(batch) >= batch_size:
+                written += cls._upsert(batch)
+                batch = []
+        if batch:
+            written += cls._upsert(batch)
+        return written
+
+    @classmethod
+    def _upsert(cls, balances):
+        cls.objects.bulk_create(
+            balances,
+            update_conflicts=True,
+            unique_fields=['student'],
+            update_fields=['total_debt', 'total_paid', 'practice_minutes', 'updated_at']
+        )
+        return len(balances)
+
+
+class StudentSearchToken(models.Model):
+    """
+    Índice de búsqueda de alumnos: un token normalizado por fila.
+    Ver students/search.py para la normalización y la consulta.
+    """
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name="Alumno"
+    )
+    token = models.CharField(max_length=100, verbose_name="Token")
+
+    class Meta:
+        verbose_name = "Token de búsqueda"
+        verbose_name_plural = "Tokens de búsqueda"
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'token'], name='unique_student_search_token'),
+        ]
+        indexes = [
+            models.Index(fields=['token', 'student']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} → {self.student_id}"
+
+    @classmethod
+    def refresh(cls, student):
+        """Regenera los tokens de un alumno"""
+        from .search import student_tokens
+        cls.objects.filter(student_id=student.pk).delete()
+        cls.objects.bulk_create(
+            [cls(student_id=student.pk, token=token) for token in student_tokens(student)]
+        )
+
+    @classmethod
+    def rebuild(cls, student_ids=None, batch_size=1000):
+        """Regenera en bloque los tokens (todos o los de student_ids). Retorna el número de alumnos."""
+        from .search import student_tokens
+        students = Student.objects.order_by('pk').only('pk', 'first_name', 'last_name', 'dni', 'phone')
+        existing = cls.objects.all()
+        if student_ids is not None:
+            students = students.filter(pk__in=student_ids)
+            existing = existing.filter(student_id__in=student_ids)
+        existing.delete()
+
+        count = 0
+        batch = []
+        for student in students.iterator(chunk_size=batch_size):
+            count += 1
+            batch.extend(cls(student_id=student.pk, token=token) for token in student_tokens(student))
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            cls.objects.bulk_create(batch)
+        return count
+
+
 class AuditLog(models.Model):
     """Modelo de Auditoría - Registro de todas las acciones en el sistema"""
 
@@ -403,25 +684,32 @@ class AuditLog(models.Model):
             entity_name: Nombre o descripción del objeto
             description: Descripción detallada de la acción
             request: Request HTTP (opcional, para obtener IP)
-        """
-        ip_address = None
-        if request:
-            # Obtener IP del usuario
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                ip_address = x_forwarded_for.split(',')[0]
-            else:
-                ip_address = request.META.get('REMOTE_ADDR')
 
-        return AuditLog.objects.create(
+        La entrada se guarda de forma diferida en bloque (ver students/audit.py),
+        así que la instancia devuelta puede no tener todavía pk.
+        """
+        from .audit import audit_buffer
+        entry = AuditLog(
             user=user,
             action=action,
             entity_type=entity_type,
             entity_id=entity_id,
             entity_name=entity_name,
             description=description,
-            ip_address=ip_address
+            ip_address=AuditLog.get_client_ip(request)
         )
+        audit_buffer.add(entry)
+        return entry
+
+    @staticmethod
+    def get_client_ip(request):
+        """IP del usuario que hace la petición (None si no hay request)"""
+        if not request:
+            return None
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            return x_forwarded_for.split(',')[0]
+        return request.META.get('REMOTE_ADDR')
 
 
 class Vehicle(models.Model):
@@ -482,9 +770,53 @@ class Vehicle(models.Model):
         return self.maintenances.first()
 
     def get_maintenance_count(self):
-        """Retorna el número total de mantenimientos"""
+        """Retorna el número total de mantenimientos (usa la anotación si existe)"""
+        if hasattr(self, 'maintenance_count'):
+            return self.maintenance_count
         return self.maintenances.count()
 
+    def get_last_maintenance_type_display(self):
+        """Nombre del tipo del último mantenimiento (requiere with_maintenance_stats)"""
+        return dict(Maintenance.MAINTENANCE_TYPES).get(self.last_maintenance_type, self.last_maintenance_type)
+
+    @staticmethod
+    def with_maintenance_stats(queryset=None):
+        """
+        Anota cada vehículo con el resumen de mantenimientos en una sola consulta:
+        last_maintenance_date, last_maintenance_type, last_mileage,
+        maintenance_count, maintenance_total_cost y maintenance_cost_year.
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        if queryset is None:
+            queryset = Vehicle.objects.all()
+
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        maintenances = Maintenance.objects.filter(vehicle_id=OuterRef('pk'))
+        latest = maintenances.order_by('-maintenance_date', '-date_created')
+
+        return queryset.annotate(
+            last_maintenance_date=Subquery(latest.values('maintenance_date')[:1]),
+            last_maintenance_type=Subquery(latest.values('maintenance_type')[:1]),
+            last_mileage=Subquery(latest.filter(mileage__isnull=False).values('mileage')[:1]),
+            maintenance_count=Coalesce(
+                Subquery(maintenances.order_by().values('vehicle_id').annotate(total=Count('pk')).values('total'),
+                         output_field=IntegerField()),
+                Value(0)
+            ),
+            maintenance_total_cost=Coalesce(
+                Subquery(maintenances.order_by().values('vehicle_id').annotate(total=Sum('cost')).values('total'),
+                         output_field=money),
+                Value(0, output_field=money)
+            ),
+            maintenance_cost_year=Coalesce(
+                Subquery(maintenances.filter(maintenance_date__year=timezone.localdate().year)
+                         .order_by().values('vehicle_id').annotate(total=Sum('cost')).values('total'),
+                         output_field=money),
+                Value(0, output_field=money)
+            ),
+        )
+
 
 class Maintenance(models.Model):
     """Modelo de Mantenimiento de vehículos"""
@@ -724,20 +1056,37 @@ class Invoice(models.Model):
 
     @staticmethod
     def generate_invoice_number():
-        """Genera un número de factura único: AAAA-XXXXX"""
+        """
+        Reserva el siguiente número de factura: AAAA-XXXXX.
+        Llamar dentro de la transacción que crea la factura (ver InvoiceSequence).
+        """
         from datetime import datetime
         year = datetime.now().year
-        # Contar facturas del año actual
-        count = Invoice.objects.filter(
-            invoice_number__startswith=f"{year}-"
-        ).count()
-        return f"{year}-{str(count + 1).zfill(5)}"
+        number = InvoiceSequence.next_number(InvoiceSequence.SERIES_INVOICE, year)
+        return Invoice.format_invoice_number(year, number)
+
+    @staticmethod
+    def format_invoice_number(year, number):
+        """Número de factura AAAA-XXXXX"""
+        return f"{year}-{str(number).zfill(5)}"
+
+    @staticmethod
+    def split_amount(total):
+        """Base imponible e IVA de un importe con IVA incluido (Base = Total / 1.21)"""
+        from decimal import Decimal, ROUND_HALF_UP
+        base = (total / Decimal('1.21')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return base, total - base
+
+    @staticmethod
+    def concept_for(concept_type):
+        """Concepto de la factura según el tipo del último cargo antes del pago (o None)"""
+        if concept_type is None:
+            return "Servicios de formación vial"
+        return f"Servicios de formación vial - {dict(Voucher.CONCEPT_CHOICES).get(concept_type, concept_type)}"
 
     @classmethod
     def create_from_payment(cls, payment):
         """Crea una factura a partir de un pago con tarjeta"""
-        from decimal import Decimal, ROUND_HALF_UP
-
         # Solo para pagos con tarjeta
         if payment.payment_method != 'CARD':
             return None
@@ -748,31 +1097,27 @@ class Invoice(models.Model):
 
         # Calcular importes (el pago incluye IVA)
         total = payment.amount
-        # Base = Total / 1.21
-        base = (total / Decimal('1.21')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        iva = total - base
+        base, iva = cls.split_amount(total)
 
         # Obtener concepto del último voucher o descripción genérica
-        vouchers = payment.student.vouchers.filter(
+        concept_type = payment.student.vouchers.filter(
             date_created__lte=payment.date_paid
-        ).order_by('-date_created')
-
-        if vouchers.exists():
-            concept = f"Servicios de formación vial - {vouchers.first().get_concept_type_display()}"
-        else:
-            concept = "Servicios de formación vial"
-
-        invoice = cls.objects.create(
-            payment=payment,
-            invoice_number=cls.generate_invoice_number(),
-            client_name=f"{payment.student.first_name} {payment.student.last_name}",
-            client_dni=payment.student.dni,
-            client_address=payment.student.address or "",
-            base_amount=base,
-            iva_amount=iva,
-            total_amount=total,
-            concept=concept
-        )
+        ).order_by('-date_created').values_list('concept_type', flat=True).first()
+        concept = cls.concept_for(concept_type)
+
+        # Número y factura en la misma transacción: si falla el alta, el número se libera
+        with transaction.atomic():
+            invoice = cls.objects.create(
+                payment=payment,
+                invoice_number=cls.generate_invoice_number(),
+                client_name=f"{payment.student.first_name} {payment.student.last_name}",
+                client_dni=payment.student.dni,
+                client_address=payment.student.address or "",
+                base_amount=base,
+                iva_amount=iva,
+                total_amount=total,
+                concept=concept
+            )
         return invoice
 
 
@@ -795,6 +1140,12 @@ class TaxInvoice(models.Model):
         ('C+E', 'C+E - Camión con remolque'),
     ]
 
+    # Curso de la factura según el tipo de carnet del alumno
+    LICENSE_TO_CURSO = {
+        'B': 'B', 'A': 'A', 'A1': 'A1', 'A2': 'A2', 'AM': 'AM',
+        'C': 'C', 'D': 'B', 'BE': 'B'
+    }
+
     # Constantes de tasas DGT (del proyecto Carrasco)
     TASA_BASICA = Decimal('94.05')
     TASA_A = Decimal('28.87')
@@ -802,6 +1153,9 @@ class TaxInvoice(models.Model):
     RENOVACION = Decimal('94.05')
     IVA_RATE = Decimal('0.21')
 
+    # Cursos exentos de IVA
+    IVA_EXEMPT_CURSOS = ('C', 'C+E')
+
     # Relaciones principales
     student = models.ForeignKey(
         Student,
@@ -926,17 +1280,36 @@ class TaxInvoice(models.Model):
 
     @classmethod
     def generate_invoice_number(cls, year):
-        """Genera el siguiente número de factura para el año: YYYY/NNNN"""
-        last_invoice = cls.objects.filter(year=year).order_by('-invoice_number').first()
-        if last_invoice:
-            try:
-                last_num = int(last_invoice.invoice_number.split('/')[1])
-                next_num = last_num + 1
-            except (IndexError, ValueError):
-                next_num = 1
-        else:
-            next_num = 1
-        return f"{year}/{next_num:04d}"
+        """
+        Reserva el siguiente número de factura para el año: YYYY/NNNN.
+        Llamar dentro de la transacción que crea la factura (ver InvoiceSequence).
+        """
+        number = InvoiceSequence.next_number(InvoiceSequence.SERIES_TAX_INVOICE, year)
+        return f"{year}/{number:04d}"
+
+    @classmethod
+    def curso_for_student(cls, student):
+        """Curso por defecto de la factura del alumno (según su tipo de carnet)"""
+        license_name = student.license_type.name if student.license_type else 'B'
+        return cls.LICENSE_TO_CURSO.get(license_name, 'B')
+
+    def copy_client_data(self, student):
+        """Copia los datos del alumno en la factura (snapshot para cumplimiento legal)"""
+        self.client_name = f"{student.first_name} {student.last_name}"
+        self.client_dni = student.dni
+        self.client_street = student.street_address or student.address
+        self.client_postal_code = student.postal_code
+        self.client_municipality = student.municipality
+        self.client_province = student.province
+
+    @staticmethod
+    def parse_invoice_number(invoice_number):
+        """Retorna (año, número) de un número YYYY/NNNN, o None si no tiene ese formato"""
+        try:
+            year, number = str(invoice_number).split('/')
+            return int(year), int(number)
+        except ValueError:
+            return None
 
     @classmethod
     def compute_components(cls, total_paid, tasa_basica, tasa_a, traslado, renovaciones, curso):
@@ -961,7 +1334,7 @@ class TaxInvoice(models.Model):
             iva = Decimal('0.00')
         else:
             # Cursos C y C+E están exentos de IVA
-            if curso in ('C', 'C+E'):
+            if curso in cls.IVA_EXEMPT_CURSOS:
                 base = importe_after
                 iva = Decimal('0.00')
             else:
@@ -971,6 +1344,54 @@ class TaxInvoice(models.Model):
         total = base + iva + sum_tasas
         return base, iva, sum_tasas, total
 
+    @staticmethod
+    def to_cents(amount):
+        """Importe (Decimal, int o str) a céntimos enteros, redondeando a 2 decimales (ROUND_HALF_UP)"""
+        from decimal import Decimal, ROUND_HALF_UP
+        return int(Decimal(amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+
+    @staticmethod
+    def from_cents(cents):
+        """Céntimos enteros a Decimal con 2 decimales"""
+        from decimal import Decimal
+        return Decimal(cents).scaleb(-2)
+
+    @classmethod
+    def compute_components_batch(cls, totals_paid, tasas_basicas, tasas_a, traslados, renovaciones, cursos):
+        """
+        compute_components() para muchas facturas a la vez.
+        Recibe una lista por columna (totals_paid en céntimos) y retorna cuatro
+        listas en céntimos: bases, IVA, tasas y totales.
+
+        Usa aritmética entera en céntimos con el mismo redondeo que la versión
+        Decimal: base = ROUND_HALF_UP(importe / 1,21) e IVA = ROUND_HALF_UP(base * 0,21),
+        calculados como divisiones enteras. El resultado es idéntico.
+        """
+        basica, tasa_a, traslado, renovacion = (
+            cls.to_cents(amount) for amount in (cls.TASA_BASICA, cls.TASA_A, cls.TRASLADO, cls.RENOVACION)
+        )
+        rate = int(cls.IVA_RATE * 100)  # 21 (%)
+        divisor = 2 * (100 + rate)
+
+        sums_tasas = [
+            basica * bool(has_basica) + tasa_a * bool(has_a) + traslado * bool(has_traslado) + renovacion * count
+            for has_basica, has_a, has_traslado, count in zip(tasas_basicas, tasas_a, traslados, renovaciones)
+        ]
+        afters = [paid - tasas for paid, tasas in zip(totals_paid, sums_tasas)]
+        exempt = cls.IVA_EXEMPT_CURSOS
+
+        # Redondeo ROUND_HALF_UP de a / b (a >= 0) en enteros: (2a + b) // 2b
+        bases = [
+            0 if after <= 0 else after if curso in exempt else (200 * after + 100 + rate) // divisor
+            for after, curso in zip(afters, cursos)
+        ]
+        ivas = [
+            0 if after <= 0 or curso in exempt else (2 * rate * base + 100) // 200
+            for after, base, curso in zip(afters, bases, cursos)
+        ]
+        totals = [base + iva + tasas for base, iva, tasas in zip(bases, ivas, sums_tasas)]
+        return bases, ivas, sums_tasas, totals
+
     def save(self, *args, **kwargs):
         # Auto-establecer trimestre y año desde fecha si no están establecidos
         if self.fecha:
@@ -979,3 +1400,288 @@ class TaxInvoice(models.Model):
             if not self.year:
                 self.year = self.fecha.year
         super().save(*args, **kwargs)
+
+
+class InvoiceSequence(models.Model):
+    """
+    Contador de numeración de facturas por serie y año.
+
+    Cada número se reserva con un UPDATE last_number = last_number + 1 sobre
+    la fila de (serie, año). La fila queda bloqueada hasta que termina la
+    transacción que emite la factura, así que dos peticiones simultáneas no
+    pueden recibir el mismo número, y si la emisión falla el rollback
+    devuelve el número (numeración sin huecos). Reservar un número no
+    recorre las facturas existentes.
+
+    La migración 0014 importó los números ya emitidos; los números que
+    llegan de fuera (import_trimestre) se registran con observe().
+    """
+    SERIES_INVOICE = 'INVOICE'
+    SERIES_TAX_INVOICE = 'TAX_INVOICE'
+    SERIES_CHOICES = [
+        (SERIES_INVOICE, 'Facturas de pago con tarjeta (AAAA-XXXXX)'),
+        (SERIES_TAX_INVOICE, 'Facturas trimestrales (AAAA/NNNN)'),
+    ]
+
+    series = models.CharField(max_length=20, choices=SERIES_CHOICES, verbose_name="Serie")
+    year = models.PositiveSmallIntegerField(verbose_name="Año")
+    last_number = models.PositiveIntegerField(default=0, verbose_name="Último número emitido")
+
+    class Meta:
+        verbose_name = "Secuencia de facturas"
+        verbose_name_plural = "Secuencias de facturas"
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'year'], name='unique_invoice_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_series_display()} {self.year}: {self.last_number}"
+
+    @classmethod
+    def next_number(cls, series, year):
+        """
+        Reserva y retorna el siguiente número de la serie en el año.
+        La fila queda bloqueada hasta el final de la transacción en curso.
+        """
+        return cls.reserve(series, year, 1)
+
+    @classmethod
+    def reserve(cls, series, year, count):
+        """
+        Reserva count números consecutivos de la serie en el año con un solo
+        UPDATE. Retorna el primero; los reservados son primero..primero+count-1.
+        """
+        from django.db.models import F
+
+        with transaction.atomic():
+            sequences = cls.objects.filter(series=series, year=year)
+            if not sequences.update(last_number=F('last_number') + count):
+                # Primera factura de la serie en el año
+                cls.objects.get_or_create(series=series, year=year)
+                sequences.update(last_number=F('last_number') + count)
+            return sequences.values_list('last_number', flat=True).get() - count + 1
+
+    @classmethod
+    def peek(cls, series, year):
+        """Siguiente número de la serie sin reservarlo (vista previa)"""
+        last_number = cls.objects.filter(series=series, year=year).values_list('last_number', flat=True).first()
+        return (last_number or 0) + 1
+
+    @classmethod
+    def observe(cls, series, year, number):
+        """Registra un número asignado fuera de la secuencia (no se volverá a emitir)"""
+        cls.objects.get_or_create(series=series, year=year)
+        cls.objects.filter(series=series, year=year, last_number__lt=number).update(last_number=number)
+
+
+class TaxInvoiceSummary(models.Model):
+    """
+    Resumen trimestral de IVA materializado: una fila por (año, trimestre,
+    curso) con el número de facturas trimestrales y la suma de sus importes.
+
+    Cada alta, modificación o borrado de una TaxInvoice recalcula solo su
+    grupo (y el anterior si la factura cambia de trimestre o de curso) desde
+    students/signals.py. El grupo se vuelve a sumar desde sus facturas, no se
+    aplican diferencias, así que el resumen coincide siempre con las
+    facturas. Se puede reconstruir con el comando rebuild_tax_summary.
+    """
+    year = models.PositiveIntegerField(verbose_name="Año")
+    quarter = models.PositiveSmallIntegerField(
+        verbose_name="Trimestre",
+        choices=[(1, 'T1'), (2, 'T2'), (3, 'T3'), (4, 'T4')]
+    )
+    curso = models.CharField(
+        max_length=5,
+        choices=TaxInvoice.CURSO_CHOICES,
+        verbose_name="Tipo de curso"
+    )
+    invoice_count = models.PositiveIntegerField(default=0, verbose_name="Facturas")
+    base_imponible = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Base imponible"
+    )
+    iva_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="IVA"
+    )
+    tasas_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Tasas DGT (exento)"
+    )
+    total = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total facturado"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
+
+    AMOUNT_FIELDS = ['base_imponible', 'iva_amount', 'tasas_amount', 'total']
+
+    class Meta:
+        verbose_name = "Resumen trimestral de IVA"
+        verbose_name_plural = "Resúmenes trimestrales de IVA"
+        ordering = ['-year', 'quarter', 'curso']
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'quarter', 'curso'], name='unique_tax_invoice_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.year} T{self.quarter} {self.curso}: {self.invoice_count} facturas, {self.total}€"
+
+    @staticmethod
+    def group_totals(invoices):
+        """Agrupa invoices por (año, trimestre, curso) con el número de facturas y las sumas"""
+        from django.db.models import Count, Sum
+        return invoices.order_by().values('year', 'quarter', 'curso').annotate(
+            count=Count('pk'),
+            sum_base_imponible=Sum('base_imponible'),
+            sum_iva_amount=Sum('iva_amount'),
+            sum_tasas_amount=Sum('tasas_amount'),
+            sum_total=Sum('total')
+        )
+
+    @classmethod
+    def from_totals(cls, totals):
+        """Fila de resumen a partir de un grupo de group_totals()"""
+        summary = cls(
+            year=totals['year'],
+            quarter=totals['quarter'],
+            curso=totals['curso'],
+            invoice_count=totals['count']
+        )
+        for field in cls.AMOUNT_FIELDS:
+            setattr(summary, field, StudentBalance.to_money(totals[f'sum_{field}']))
+        return summary
+
+    @classmethod
+    def refresh(cls, year, quarter, curso):
+        """
+        Recalcula un grupo desde sus facturas. La fila del grupo se bloquea
+        antes de sumar: dos facturas guardadas a la vez en el mismo grupo se
+        suman una detrás de otra y ninguna queda fuera del resumen.
+        Retorna el resumen, o None si el grupo se ha quedado sin facturas.
+        """
+        with transaction.atomic():
+            cls.objects.get_or_create(year=year, quarter=quarter, curso=curso)
+            summary = cls.objects.select_for_update().get(year=year, quarter=quarter, curso=curso)
+            totals = next(iter(cls.group_totals(
+                TaxInvoice.objects.filter(year=year, quarter=quarter, curso=curso)
+            )), None)
+            if totals is None:
+                summary.delete()
+                return None
+            fresh = cls.from_totals(totals)
+            summary.invoice_count = fresh.invoice_count
+            for field in cls.AMOUNT_FIELDS:
+                setattr(summary, field, getattr(fresh, field))
+            summary.save()
+            return summary
+
+    @classmethod
+    def rebuild(cls):
+        """Reconstruye todo el resumen desde las facturas. Retorna el número de grupos."""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            summaries = [cls.from_totals(totals) for totals in cls.group_totals(TaxInvoice.objects.all())]
+            cls.objects.bulk_create(summaries)
+        return len(summaries)
+
+
+class TrimestreImport(models.Model):
+    """
+    Fichero Trimestre-X.xlsx importado con import_trimestre: uno por
+    contenido (hash SHA-256 del fichero) y hoja.
+
+    completed_at se rellena al terminar la importación: volver a importar
+    el mismo fichero no hace nada (se reconoce por el hash aunque cambie de
+    nombre). Las filas y lo que produjo cada una están en TrimestreImportRow.
+
+    last_row es el punto de control: hasta esa fila del Excel todas están
+    escritas (cada lote se guarda en su transacción). Si la importación se
+    interrumpe, import_trimestre --resume continúa desde ahí.
+    """
+    content_hash = models.CharField(max_length=64, verbose_name="Hash del contenido")
+    sheet = models.CharField(max_length=100, verbose_name="Hoja")
+    file_name = models.CharField(max_length=255, verbose_name="Fichero")
+    row_count = models.PositiveIntegerField(default=0, verbose_name="Filas importadas")
+    last_row = models.PositiveIntegerField(default=0, verbose_name="Última fila escrita")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="Inicio")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Fin")
+
+    class Meta:
+        verbose_name = "Importación trimestral"
+        verbose_name_plural = "Importaciones trimestrales"
+        ordering = ['-started_at']
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'sheet'], name='unique_trimestre_import'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.sheet}) - {self.row_count} filas"
+
+
+class TrimestreImportRow(models.Model):
+    """
+    Diario de importación: una fila del Excel ya importada y los objetos que
+    produjo o con los que se identificó (alumno, pago, factura trimestral).
+
+    row_hash es la huella de los datos normalizados de la fila: si el mismo
+    número de factura llega después con otros datos, import_trimestre lo
+    detecta y lo informa (o lo actualiza con --update) en vez de ignorarlo.
+    """
+    trimestre_import = models.ForeignKey(
+        TrimestreImport,
+        on_delete=models.CASCADE,
+        related_name='rows',
+        verbose_name="Importación"
+    )
+    row_num = models.PositiveIntegerField(verbose_name="Fila")
+    invoice_number = models.CharField(max_length=20, blank=True, verbose_name="Número de factura")
+    row_hash = models.CharField(max_length=64, verbose_name="Huella de la fila")
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Alumno"
+    )
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Pago"
+    )
+    tax_invoice = models.ForeignKey(
+        TaxInvoice,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Factura trimestral"
+    )
+
+    class Meta:
+        verbose_name = "Fila importada"
+        verbose_name_plural = "Filas importadas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['trimestre_import', 'row_num', 'invoice_number'],
+                name='unique_trimestre_import_row'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['invoice_number']),
+        ]
+
+    def __str__(self):
+        return f"{self.trimestre_import.file_name} fila {self.row_num}: {self.invoice_number or 'sin número'}"
@@ -0,0 +1,110 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+A diferencia de django.core.paginator.Paginator no ejecuta COUNT(*) ni usa
+OFFSET: cada página filtra por el último valor visto de (campo, id), de modo
+que el coste de cualquier página es el mismo y puede servirse desde un índice
+sobre (campo, id).
+
+Uso:
+    page = keyset_paginate(queryset, 'date_registered',
+                           after=request.GET.get('after'),
+                           before=request.GET.get('before'),
+                           per_page=50)
+    page.object_list, page.has_next, page.next_cursor, ...
+
+El orden es siempre descendente (más recientes primero).
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+CURSOR_SEPARATOR = '_'
+
+# Mayor id válido en un cursor (bigint): uno mayor haría fallar la consulta en PostgreSQL
+MAX_CURSOR_PK = 2 ** 63 - 1
+
+
+class KeysetPage:
+    """Página de resultados con cursores para la página anterior/siguiente"""
+
+    def __init__(self, object_list, field, has_next, has_previous):
+        self.object_list = object_list
+        self.field = field
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _cursor(self, obj):
+        value = getattr(obj, self.field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return f'{value}{CURSOR_SEPARATOR}{obj.pk}'
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return ''
+        return self._cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return ''
+        return self._cursor(self.object_list[0])
+
+
+def parse_cursor(queryset, field, cursor):
+    """Convierte un cursor 'valor_id' en (valor, id). Retorna None si no es válido."""
+    if not cursor or CURSOR_SEPARATOR not in cursor:
+        return None
+    raw_value, raw_pk = cursor.rsplit(CURSOR_SEPARATOR, 1)
+    try:
+        value = queryset.model._meta.get_field(field).to_python(raw_value)
+        pk = int(raw_pk)
+    except (ValueError, ValidationError):
+        return None
+    if value is None or not 0 < pk <= MAX_CURSOR_PK:
+        return None
+    return value, pk
+
+
+def keyset_paginate(queryset, field, after=None, before=None, per_page=50):
+    """
+    Devuelve una KeysetPage ordenada por (-field, -id).
+
+    after: cursor del último elemento de la página anterior (avanzar)
+    before: cursor del primer elemento de la página siguiente (retroceder)
+    """
+    after_key = parse_cursor(queryset, field, after)
+    before_key = parse_cursor(queryset, field, before)
+
+    if before_key:
+        value, pk = before_key
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            .order_by(field, 'pk')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        return KeysetPage(rows, field, has_next=True, has_previous=has_previous)
+
+    if after_key:
+        value, pk = after_key
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+
+    rows = list(queryset.order_by(f'-{field}', '-pk')[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], field, has_next=has_next, has_previous=after_key is not None)
@@ -0,0 +1,197 @@
+"""
+Recursos de ReportLab compartidos por todas las facturas del proceso.
+
+Las hojas de estilo, los TableStyle fijos y el logo decodificado se
+construyen la primera vez que se piden y se reutilizan en las siguientes
+facturas (una vez por worker). Son de solo lectura: los flowables
+(Paragraph, Table) se siguen creando en cada PDF.
+
+El logo se lee una sola vez, con sus bytes originales sin modificar (la
+imagen de la factura es exactamente la del fichero), en un ImageReader
+compartido: ReportLab guarda en él la imagen decodificada, así que las
+siguientes facturas no vuelven a leer ni decodificar el PNG. Si el fichero
+cambia, se vuelve a cargar.
+
+reset() descarta todo (benchmark y tests).
+"""
+import io
+import os
+from functools import lru_cache
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'static', 'students', 'logo.png')
+
+# Datos del emisor de las facturas trimestrales (David Carrasco)
+TAX_INVOICE_ISSUER = {
+    'nombre': 'David Carrasco Sanchez',
+    'dni': '52648389 D',
+    'domicilio': 'C/ Beniparrell, 31 - Bajo 9',
+    'cp': '46470',
+    'municipio': 'Albal (Valencia)'
+}
+
+
+@lru_cache(maxsize=None)
+def invoice_stylesheet():
+    """Hoja de estilos de la factura de pago con tarjeta"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        name='CompanyName',
+        fontSize=18,
+        fontName='Helvetica-Bold',
+        textColor=colors.HexColor('#27ae60'),
+        alignment=TA_LEFT
+    ))
+    styles.add(ParagraphStyle(
+        name='InvoiceTitle',
+        fontSize=24,
+        fontName='Helvetica-Bold',
+        textColor=colors.HexColor('#333333'),
+        alignment=TA_RIGHT
+    ))
+    styles.add(ParagraphStyle(
+        name='SectionTitle',
+        fontSize=12,
+        fontName='Helvetica-Bold',
+        textColor=colors.HexColor('#27ae60'),
+        spaceAfter=6
+    ))
+    styles.add(ParagraphStyle(
+        name='Normal_Right',
+        fontSize=10,
+        alignment=TA_RIGHT
+    ))
+    return styles
+
+
+@lru_cache(maxsize=None)
+def invoice_table_styles():
+    """TableStyle fijos de la factura de pago con tarjeta"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return {
+        'header': TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ]),
+        'client': TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+        'detail': TableStyle([
+            # Cabecera
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            # Contenido
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+            ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+            # Bordes
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ]),
+        'totals': TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f0f0')),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ]),
+    }
+
+
+@lru_cache(maxsize=None)
+def invoice_static_text():
+    """Textos fijos de la factura de pago (datos de la empresa y pie)"""
+    from .models import Invoice
+
+    return {
+        'company_name': f"<b>{Invoice.COMPANY_NAME}</b>",
+        'company_details': (
+            f"CIF: {Invoice.COMPANY_CIF}<br/>{Invoice.COMPANY_ADDRESS}<br/>{Invoice.COMPANY_CITY}"
+            f"<br/>Tel: {Invoice.COMPANY_PHONE}<br/>{Invoice.COMPANY_EMAIL}"
+        ),
+        'footer': f"""
+    <para align="center">
+    <font size="8" color="#666666">
+    {Invoice.COMPANY_NAME} - CIF: {Invoice.COMPANY_CIF}<br/>
+    {Invoice.COMPANY_ADDRESS}, {Invoice.COMPANY_CITY}<br/>
+    Este documento sirve como justificante de pago.
+    </font>
+    </para>
+    """,
+    }
+
+
+@lru_cache(maxsize=None)
+def tax_invoice_table_styles():
+    """TableStyle fijos de la factura trimestral"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return {
+        'concepts': TableStyle([
+            ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 9),
+            ('FONT', (0, 1), (-1, -1), 'Helvetica', 9),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (3, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]),
+        'totals': TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+            ('FONT', (0, -1), (-1, -1), 'Helvetica-Bold', 10),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ]),
+    }
+
+
+def logo_signature():
+    """Tamaño y fecha del logo, o None si no hay logo"""
+    try:
+        stat = os.stat(LOGO_PATH)
+    except OSError:
+        return None
+    return stat.st_size, int(stat.st_mtime)
+
+
+def logo_image():
+    """ImageReader del logo (compartido por todos los PDF), o None si no hay logo o no se puede leer"""
+    return _load_logo(logo_signature())
+
+
+@lru_cache(maxsize=1)
+def _load_logo(signature):
+    # signature forma parte de la clave: un logo nuevo invalida el anterior
+    if signature is None:
+        return None
+    from reportlab.lib.utils import ImageReader
+
+    try:
+        with open(LOGO_PATH, 'rb') as file:
+            reader = ImageReader(io.BytesIO(file.read()))
+        reader.getSize()
+    except Exception:
+        return None
+    return reader
+
+
+def reset():
+    """Descarta todos los recursos (se reconstruyen en la siguiente factura)"""
+    for cached in (invoice_stylesheet, invoice_table_styles, invoice_static_text, tax_invoice_table_styles, _load_logo):
+        cached.cache_clear()
@@ -0,0 +1,112 @@
+"""
+Alta de prácticas en bloque.
+
+register_practices() registra de una vez muchas prácticas individuales
+(de uno o varios alumnos) con el mismo resultado que voucher_create
+práctica a práctica, pero en una sola transacción:
+
+1. Bloquea los saldos de los alumnos afectados (en orden de ID)
+2. bulk_create de los cargos, las prácticas y las entradas de auditoría
+3. Un único UPDATE para recalcular cargos y pagos de todos los alumnos
+4. Aplica el bono una vez por alumno con la suma de minutos
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .bonus import apply_practice_minutes
+from .models import AuditLog, Practice, StudentBalance, Voucher
+
+# Concepto de cargo para cada duración de práctica
+DURATION_TO_CONCEPT = {minutes: concept for concept, minutes in Voucher.PRACTICE_DURATIONS.items()}
+
+
+class PracticeEntry:
+    """Una práctica a registrar: alumno, fecha, duración y notas"""
+
+    def __init__(self, student, practice_date, duration, notes=''):
+        self.student = student
+        self.practice_date = practice_date
+        self.duration = duration
+        self.notes = notes or ''
+
+
+def register_practices(entries, user=None, request=None):
+    """
+    Registra las prácticas de entries (lista de PracticeEntry).
+    Retorna un diccionario {alumno: BonusResult} con el resultado del bono.
+    """
+    if not entries:
+        return {}
+
+    students = {entry.student.pk: entry.student for entry in entries}
+    ip_address = AuditLog.get_client_ip(request)
+
+    with transaction.atomic():
+        _lock_balances(sorted(students))
+
+        vouchers = Voucher.objects.bulk_create([
+            Voucher(
+                student=entry.student,
+                concept_type=DURATION_TO_CONCEPT[entry.duration],
+                amount=Voucher.CONCEPT_PRICES[DURATION_TO_CONCEPT[entry.duration]],
+                description=f'Práctica {entry.practice_date.strftime("%d/%m/%Y")}',
+                created_by=user
+            )
+            for entry in entries
+        ])
+
+        Practice.objects.bulk_create([
+            Practice(
+                student=entry.student,
+                duration=entry.duration,
+                practice_date=entry.practice_date,
+                notes=entry.notes,
+                is_billed=True,  # Ya está facturada con el cargo individual
+                billed_voucher=voucher,
+                created_by=user
+            )
+            for entry, voucher in zip(entries, vouchers)
+        ])
+
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                user=user,
+                action='CREATE',
+                entity_type='VOUCHER',
+                entity_id=voucher.id,
+                entity_name=f'Práctica {entry.duration}\' - {entry.student}',
+                description=f'Práctica de {entry.duration} minutos ({voucher.amount}€) registrada para {entry.student} (fecha: {entry.practice_date})',
+                ip_address=ip_address
+            )
+            for entry, voucher in zip(entries, vouchers)
+        ])
+
+        # bulk_create no dispara las señales: recalcular saldos e invalidar la caché de las fichas
+        StudentBalance.refresh_many(list(students))
+
+        minutes = defaultdict(int)
+        for entry in entries:
+            minutes[entry.student.pk] += entry.duration
+
+        return {
+            students[pk]: apply_practice_minutes(students[pk], delta, user=user, request=request)
+            for pk, delta in sorted(minutes.items())
+        }
+
+
+def _lock_balances(student_ids):
+    """
+    Bloquea las filas de saldo de los alumnos antes de insertar.
+    Crea las que falten ahora, para que su contador de minutos se calcule
+    sin las prácticas nuevas.
+    """
+    existing = set(
+        StudentBalance.objects.select_for_update()
+        .filter(student_id__in=student_ids)
+        .order_by('student_id')
+        .values_list('student_id', flat=True)
+    )
+    for student_id in student_ids:
+        if student_id not in existing:
+            StudentBalance.refresh(student_id)
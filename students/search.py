@@ -0,0 +1,132 @@
+"""
+Búsqueda de alumnos por índice de tokens normalizados.
+
+Cada alumno tiene filas en StudentSearchToken con:
+- Cada palabra del nombre y apellidos sin tildes y en minúsculas ("García" → "garcia")
+- El DNI sin espacios ni guiones ("12.345.678-Z" → "12345678z")
+- El teléfono solo con dígitos (y sin prefijo 34 si lo tiene)
+
+La búsqueda normaliza igual el texto introducido y busca cada término por
+prefijo (ver _prefix_match):
+- PostgreSQL: token LIKE 't%' (token__startswith), con el índice
+  varchar_pattern_ops de la migración 0018. Un rango de cadenas no equivale
+  a un prefijo con una collation distinta de C.
+- SQLite: rango token >= t AND token < t + U+FFFF sobre el índice de token.
+  SQLite compara por bytes (BINARY), así que el rango es exactamente el
+  prefijo; LIKE no usaría el índice (no distingue mayúsculas).
+Un alumno coincide si todos los términos coinciden con alguno de sus tokens,
+o si el texto completo sin separadores ("612 34 56 78") coincide con uno.
+
+El total de alumnos de cada búsqueda se cachea (count_cache_key) con una
+versión que sale de la base de datos (counts_version): el número de saldos
+de alumno y el último StudentBalance.updated_at, que cambian con cada alta,
+edición o borrado de un alumno desde cualquier proceso (vistas, admin,
+import_trimestre). La caché por defecto es local a cada proceso, así que
+una versión guardada en ella no llegaría a los demás.
+"""
+import hashlib
+import re
+import unicodedata
+
+from django.db.models import Q
+
+# Longitud máxima de un token (ver StudentSearchToken.token)
+MAX_TOKEN_LENGTH = 100
+# Límite superior para búsquedas por prefijo por rango (solo SQLite, ver _prefix_match)
+PREFIX_UPPER_BOUND = '\uffff'
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_NON_DIGIT = re.compile(r'[^0-9]+')
+
+
+def fold(text):
+    """Quita tildes y pasa a minúsculas: 'García Núñez' → 'garcia nunez'"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def normalize_key(text):
+    """Clave compacta sin separadores: '12 345-678 Z' → '12345678z'"""
+    return _NON_ALNUM.sub('', fold(text))[:MAX_TOKEN_LENGTH]
+
+
+def name_tokens(text):
+    """Palabras normalizadas de un nombre"""
+    return [t[:MAX_TOKEN_LENGTH] for t in _NON_ALNUM.split(fold(text)) if t]
+
+
+def phone_tokens(phone):
+    """Dígitos del teléfono, con y sin prefijo internacional 34"""
+    digits = _NON_DIGIT.sub('', phone or '')
+    if not digits:
+        return []
+    tokens = [digits]
+    if digits.startswith('0034'):
+        tokens.append(digits[4:])
+    elif digits.startswith('34') and len(digits) > 9:
+        tokens.append(digits[2:])
+    return tokens
+
+
+def student_tokens(student):
+    """Conjunto de tokens de búsqueda de un alumno"""
+    tokens = set(name_tokens(student.first_name))
+    tokens.update(name_tokens(student.last_name))
+    dni = normalize_key(student.dni)
+    if dni:
+        tokens.add(dni)
+    tokens.update(phone_tokens(student.phone))
+    return tokens
+
+
+def query_terms(query):
+    """Términos normalizados del texto de búsqueda"""
+    return name_tokens(query)
+
+
+def counts_version():
+    """
+    Versión de los totales de búsqueda: número de saldos (uno por alumno) y
+    último updated_at. Una sola consulta agregada sobre StudentBalance.
+    """
+    from django.db.models import Count, Max
+    from .models import StudentBalance
+    state = StudentBalance.objects.aggregate(count=Count('pk'), changed=Max('updated_at'))
+    changed = int(state['changed'].timestamp() * 1000000) if state['changed'] else 0
+    return f"{state['count']}.{changed}"
+
+
+def count_cache_key(query):
+    """Clave de caché del total de alumnos que encuentra query (con la versión actual)"""
+    terms = ' '.join(query_terms(query))
+    return f'student_count:{counts_version()}:' + hashlib.md5(terms.encode()).hexdigest()
+
+
+
+def _prefix_match(term):
+    """Subconsulta de IDs de alumno con algún token que empiece por term"""
+    from django.db import connection
+    from .models import StudentSearchToken
+    if connection.vendor == 'sqlite':
+        tokens = StudentSearchToken.objects.filter(token__gte=term, token__lt=term + PREFIX_UPPER_BOUND)
+    else:
+        tokens = StudentSearchToken.objects.filter(token__startswith=term)
+    return tokens.values('student_id')
+
+
+def search_students(queryset, query):
+    """Filtra el queryset de alumnos por el texto de búsqueda"""
+    terms = query_terms(query)
+    if not terms:
+        return queryset
+
+    all_terms = Q()
+    for term in terms:
+        all_terms &= Q(pk__in=_prefix_match(term))
+
+    compact = normalize_key(query)
+    if len(terms) > 1 and compact:
+        return queryset.filter(all_terms | Q(pk__in=_prefix_match(compact)))
+    return queryset.filter(all_terms)
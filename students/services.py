@@ -0,0 +1,109 @@
+"""
+Servicios de consulta para las vistas de alumnos.
+
+StudentSummary reúne todo lo que necesita la ficha del alumno
+(student_detail.html) en un número fijo de consultas:
+
+1. Alumno + tipo de carnet + saldo materializado (select_related)
+2. Cargos
+3. Pagos
+4. Prácticas + cargo asociado (select_related)
+5. Facturas trimestrales
+
+Las consultas 2-5 se ejecutan solo cuando la plantilla accede al listado,
+así que los fragmentos servidos desde caché no las lanzan. Los totales y
+los minutos de prácticas salen del saldo materializado. Todo se memoriza
+en la instancia (cached_property), por lo que la plantilla nunca repite
+una consulta.
+"""
+from functools import cached_property
+
+from .bonus import BONUS_MINUTES
+from .models import Student
+
+
+class StudentSummary:
+    """Resumen financiero y de actividad de un alumno"""
+
+    def __init__(self, student):
+        self.student = student
+
+    @staticmethod
+    def queryset():
+        """Queryset de alumnos con tipo de carnet y saldo materializado"""
+        return Student.objects.select_related('license_type', 'ledger')
+
+    @cached_property
+    def cache_version(self):
+        """Versión de caché de la ficha (cambia con cualquier cargo, pago, práctica o factura)"""
+        return self.student.get_ledger().cache_version
+
+    # ----- Listados -----
+
+    @cached_property
+    def vouchers(self):
+        return list(self.student.vouchers.all())
+
+    @cached_property
+    def payments(self):
+        # El related manager asigna payment.student, que usa el enlace de WhatsApp
+        return list(self.student.payments.all())
+
+    @cached_property
+    def practices(self):
+        return list(
+            self.student.practices.select_related('billed_voucher').order_by('-practice_date', '-date_created')
+        )
+
+    @cached_property
+    def tax_invoices(self):
+        return list(self.student.tax_invoices.all())
+
+    # ----- Totales -----
+
+    @cached_property
+    def total_debt(self):
+        return self.student.get_total_debt()
+
+    @cached_property
+    def total_paid(self):
+        return self.student.get_total_paid()
+
+    @cached_property
+    def balance(self):
+        return self.total_paid - self.total_debt
+
+    @cached_property
+    def pending_amount(self):
+        return abs(self.balance) if self.balance < 0 else 0
+
+    # ----- Prácticas y bono -----
+
+    @cached_property
+    def total_practice_minutes(self):
+        """Minutos de prácticas facturadas individualmente (contador del bono)"""
+        return self.student.get_ledger().practice_minutes
+
+    @cached_property
+    def unbilled_minutes(self):
+        """Minutos acumulados hacia el próximo descuento"""
+        return self.total_practice_minutes % BONUS_MINUTES
+
+    @cached_property
+    def minutes_for_bonus(self):
+        """Minutos que faltan para el próximo descuento"""
+        if self.total_practice_minutes > 0:
+            return BONUS_MINUTES - self.unbilled_minutes
+        return BONUS_MINUTES
+
+    def as_context(self):
+        """
+        Contexto para students/student_detail.html.
+        La plantilla lee todo desde summary para que los datos se consulten
+        solo al renderizar fragmentos que no están en caché.
+        """
+        return {
+            'student': self.student,
+            'summary': self,
+            'cache_version': self.cache_version,
+        }
@@ -0,0 +1,171 @@
+"""
+Señales para mantener datos derivados de los alumnos:
+- Saldo materializado (StudentBalance)
+- Versión de caché de la ficha (StudentBalance.updated_at)
+- Índice de búsqueda (StudentSearchToken)
+- Resumen trimestral de IVA (TaxInvoiceSummary)
+
+Saldo:
+
+Cada alta, modificación o borrado de un Voucher o Payment recalcula el
+saldo del alumno afectado. Si el alumno cambia (modificación que mueve el
+cargo/pago a otro alumno) se recalculan ambos.
+
+Los borrados en cascada desde el propio alumno se ignoran: el saldo se
+elimina junto con el alumno.
+
+Borrar un cargo de práctica individual (PRACTICE_DURATIONS) descuenta del
+contador del bono (practice_minutes, ver bonus.py) los minutos de las
+prácticas que quedan sin facturar.
+
+Caché de la ficha: recalcular el saldo ya cambia updated_at. Los cambios en
+prácticas, facturas trimestrales (y sus pagos) o en el propio alumno lo
+cambian con StudentBalance.touch().
+
+Búsqueda: cada vez que se guarda un alumno se regeneran sus tokens.
+
+Resumen de IVA: cada alta, modificación o borrado de una TaxInvoice
+recalcula su grupo (año, trimestre, curso); si la factura cambia de grupo
+se recalcula también el anterior.
+
+Nota: bulk_create() y QuerySet.update() no disparan señales. Quien los use
+debe llamar a StudentBalance.refresh_many(student_ids) (o rebuild() para
+los alumnos sin saldo: rebuild() también recalcula practice_minutes, el
+contador de bonus.py), StudentSearchToken.rebuild(student_ids) y/o
+TaxInvoiceSummary.rebuild() al terminar.
+"""
+from django.db.models import QuerySet, Sum
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .bonus import apply_practice_minutes
+
+from .models import (
+    Student, StudentBalance, StudentSearchToken, Voucher, Payment, Practice, TaxInvoice, TaxInvoiceSummary
+)
+
+
+def _deleting_student(origin):
+    """True si el borrado viene en cascada desde un Student"""
+    if isinstance(origin, Student):
+        return True
+    return isinstance(origin, QuerySet) and origin.model is Student
+
+
+@receiver(pre_save, sender=Voucher)
+@receiver(pre_save, sender=Payment)
+def remember_previous_student(sender, instance, raw=False, **kwargs):
+    """Guarda el alumno anterior para recalcularlo si el registro cambia de alumno"""
+    instance._ledger_previous_student_id = None
+    if raw or instance.pk is None:
+        return
+    instance._ledger_previous_student_id = (
+        sender.objects.filter(pk=instance.pk).values_list('student_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_save, sender=Payment)
+def refresh_balance_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    StudentBalance.refresh(instance.student_id)
+    previous = getattr(instance, '_ledger_previous_student_id', None)
+    if previous and previous != instance.student_id:
+        StudentBalance.refresh(previous)
+
+
+@receiver(post_delete, sender=Voucher)
+@receiver(post_delete, sender=Payment)
+def refresh_balance_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_student(origin):
+        return
+    StudentBalance.refresh(instance.student_id)
+
+
+@receiver(pre_delete, sender=Voucher)
+def remember_practice_minutes(sender, instance, origin=None, **kwargs):
+    """Guarda los minutos de las prácticas facturadas con un cargo de práctica individual que se borra"""
+    instance._bonus_practice_minutes = 0
+    if _deleting_student(origin) or instance.concept_type not in Voucher.PRACTICE_DURATIONS:
+        return
+    instance._bonus_practice_minutes = (
+        Practice.objects.filter(billed_voucher=instance).aggregate(total=Sum('duration'))['total'] or 0
+    )
+
+
+@receiver(post_delete, sender=Voucher)
+def release_practice_minutes(sender, instance, **kwargs):
+    """
+    Borrar un cargo de práctica individual (por ejemplo desde el admin) deja
+    sus prácticas sin facturar: sus minutos salen del contador del bono y se
+    revierten los descuentos si baja de un umbral.
+    """
+    minutes = getattr(instance, '_bonus_practice_minutes', 0)
+    if minutes:
+        apply_practice_minutes(instance.student, -minutes)
+
+
+@receiver(post_save, sender=Practice)
+@receiver(post_save, sender=TaxInvoice)
+def touch_balance_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    StudentBalance.touch(instance.student_id)
+
+
+@receiver(post_delete, sender=Practice)
+@receiver(post_delete, sender=TaxInvoice)
+def touch_balance_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_student(origin):
+        return
+    StudentBalance.touch(instance.student_id)
+
+
+@receiver(pre_save, sender=TaxInvoice)
+def remember_previous_summary_group(sender, instance, raw=False, **kwargs):
+    """Guarda el grupo (año, trimestre, curso) anterior por si la factura cambia de grupo"""
+    instance._summary_previous_group = None
+    if raw or instance.pk is None:
+        return
+    instance._summary_previous_group = (
+        sender.objects.filter(pk=instance.pk).values_list('year', 'quarter', 'curso').first()
+    )
+
+
+@receiver(post_save, sender=TaxInvoice)
+def refresh_summary_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    group = (instance.year, instance.quarter, instance.curso)
+    TaxInvoiceSummary.refresh(*group)
+    previous = getattr(instance, '_summary_previous_group', None)
+    if previous and previous != group:
+        TaxInvoiceSummary.refresh(*previous)
+
+
+@receiver(post_delete, sender=TaxInvoice)
+def refresh_summary_on_delete(sender, instance, **kwargs):
+    TaxInvoiceSummary.refresh(instance.year, instance.quarter, instance.curso)
+
+
+@receiver(m2m_changed, sender=TaxInvoice.payments.through)
+def touch_balance_on_invoice_payments(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    student_ids = {instance.student_id}
+    if reverse and pk_set:
+        # instance es un Payment: tocar también a los alumnos de las facturas
+        student_ids.update(
+            TaxInvoice.objects.filter(pk__in=pk_set).values_list('student_id', flat=True)
+        )
+    for student_id in student_ids:
+        StudentBalance.touch(student_id)
+
+
+@receiver(post_save, sender=Student)
+def refresh_student_derived_data(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    StudentSearchToken.refresh(instance)
+    StudentBalance.touch(instance.pk)
@@ -0,0 +1,127 @@
+"""
+Descarga de tablas en CSV o Excel (.xlsx) con memoria constante.
+
+Las filas son un iterable de listas de valores (puede ser un generador
+sobre QuerySet.iterator()): no se cargan todas a la vez.
+- CSV: StreamingHttpResponse, se envía por trozos según se escriben las filas
+- Excel: libro de openpyxl en modo write_only (las filas van directamente a
+  disco) guardado en un fichero temporal que se envía con FileResponse
+
+Los Decimal se escriben como número en Excel (con formato de 2 decimales) y
+con punto decimal en el CSV; las fechas como fecha. El CSV lleva BOM UTF-8
+para que Excel muestre bien los acentos.
+
+Uso:
+    return table_response('xlsx', 'resumen_iva_2025', 'Resumen IVA', header, rows)
+"""
+import csv
+import datetime
+import tempfile
+from decimal import Decimal
+
+from django.http import FileResponse, StreamingHttpResponse
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Formato de las celdas con importes y fechas en Excel
+MONEY_FORMAT = '#,##0.00'
+DATE_FORMAT = 'DD/MM/YYYY'
+
+# Bytes de CSV que se acumulan antes de enviar un trozo
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+class _Echo:
+    """Fichero para csv.writer que devuelve la línea en vez de guardarla"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    """Genera el CSV por trozos de unos CSV_CHUNK_SIZE caracteres"""
+    writer = csv.writer(_Echo())
+    chunk = ['\ufeff', writer.writerow(header)]
+    size = 0
+    for row in rows:
+        line = writer.writerow(row)
+        chunk.append(line)
+        size += len(line)
+        if size >= CSV_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_xlsx(output, title, header, rows):
+    """Escribe la tabla en output (ruta o fichero) como libro write_only de una hoja"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    for column, name in enumerate(header, start=1):
+        sheet.column_dimensions[get_column_letter(column)].width = max(12, len(name) + 2)
+
+    bold = Font(bold=True)
+    header_cells = []
+    for name in header:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = bold
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+    for row in rows:
+        sheet.append([_xlsx_cell(sheet, value) for value in row])
+    workbook.save(output)
+
+
+def _xlsx_cell(sheet, value):
+    from openpyxl.cell import WriteOnlyCell
+
+    if isinstance(value, Decimal):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.number_format = MONEY_FORMAT
+        return cell
+    if isinstance(value, datetime.date):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.number_format = DATE_FORMAT
+        return cell
+    return value
+
+
+def csv_response(filename, header, rows):
+    """Respuesta con la tabla en CSV (en streaming)"""
+    response = StreamingHttpResponse(iter_csv(header, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(filename, title, header, rows):
+    """Respuesta con la tabla en una hoja de Excel"""
+    output = tempfile.TemporaryFile()
+    try:
+        write_xlsx(output, title, header, rows)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    # FileResponse envía el fichero por bloques y lo cierra (y se borra) al terminar
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def table_response(export_format, filename, title, header, rows):
+    """Respuesta CSV o Excel según export_format ('csv' o 'xlsx')"""
+    if export_format == 'csv':
+        return csv_response(filename, header, rows)
+    return xlsx_response(filename, title, header, rows)
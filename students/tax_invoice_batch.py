@@ -0,0 +1,155 @@
+"""
+Generación en bloque de facturas trimestrales para los pagos sin factura.
+
+generate_tax_invoices() hace de una vez lo mismo que tax_invoice_create
+factura a factura, para todos los pagos de un rango de fechas que aún no
+están en ninguna factura trimestral:
+
+1. Busca los pagos sin factura (NOT EXISTS sobre la tabla de vínculos)
+2. Agrupa los pagos por alumno y trimestre: una factura por grupo, con la
+   fecha del último pago y el curso del carnet del alumno
+3. Calcula los importes con TaxInvoice.compute_components (sin tasas DGT:
+   el pago completo es base + IVA)
+4. Reserva los números de cada año de un bloque (InvoiceSequence.reserve)
+   y los asigna por orden de fecha
+5. bulk_create de las facturas y de los vínculos con los pagos
+6. Recalcula los resúmenes de IVA y los saldos afectados (bulk_create no
+   dispara las señales)
+
+Todo ocurre en una transacción: si algo falla no se crea ninguna factura
+ni se consume ningún número. preview_tax_invoices() calcula lo mismo sin
+escribir nada, con números provisionales.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import InvoiceSequence, Payment, StudentBalance, TaxInvoice, TaxInvoiceSummary
+
+# Facturas por INSERT en bulk_create
+BATCH_SIZE = 500
+
+
+def uninvoiced_payments(payments=None):
+    """Pagos (de payments o todos) que no están en ninguna factura trimestral"""
+    if payments is None:
+        payments = Payment.objects.all()
+    links = TaxInvoice.payments.through.objects.filter(payment_id=OuterRef('pk'))
+    return payments.filter(~Exists(links))
+
+
+def payments_in_range(date_from, date_to):
+    """Pagos sin factura trimestral entre date_from y date_to (incluidas)"""
+    return uninvoiced_payments(
+        Payment.objects.filter(date_paid__date__gte=date_from, date_paid__date__lte=date_to)
+    ).select_related('student__license_type').order_by('student_id', 'date_paid', 'pk')
+
+
+def plan_tax_invoices(payments):
+    """
+    Facturas (sin guardar ni numerar) para payments: una por alumno y
+    trimestre. Cada factura lleva sus pagos en batch_payments.
+    Retorna la lista ordenada por fecha, alumno.
+    """
+    groups = defaultdict(list)
+    for payment in payments:
+        paid_on = timezone.localtime(payment.date_paid).date()
+        groups[(payment.student_id, paid_on.year, TaxInvoice.get_quarter_from_date(paid_on))].append(payment)
+
+    invoices = []
+    for group_payments in groups.values():
+        total_paid = sum(payment.amount for payment in group_payments)
+        if total_paid <= 0:
+            continue
+        student = group_payments[0].student
+        fecha = max(timezone.localtime(payment.date_paid).date() for payment in group_payments)
+        curso = TaxInvoice.curso_for_student(student)
+        base, iva, tasas, total = TaxInvoice.compute_components(total_paid, False, False, False, 0, curso)
+
+        tax_invoice = TaxInvoice(
+            student=student,
+            fecha=fecha,
+            quarter=TaxInvoice.get_quarter_from_date(fecha),
+            year=fecha.year,
+            curso=curso,
+            base_imponible=base,
+            iva_amount=iva,
+            tasas_amount=tasas,
+            total=total
+        )
+        tax_invoice.copy_client_data(student)
+        tax_invoice.batch_payments = group_payments
+        invoices.append(tax_invoice)
+
+    invoices.sort(key=lambda tax_invoice: (tax_invoice.fecha, tax_invoice.client_name, tax_invoice.student_id))
+    return invoices
+
+
+def _assign_numbers(invoices, first_number):
+    """Numera las facturas de cada año en orden a partir de first_number(año, cuántas)"""
+    by_year = defaultdict(list)
+    for tax_invoice in invoices:
+        by_year[tax_invoice.year].append(tax_invoice)
+    for year in sorted(by_year):
+        number = first_number(year, len(by_year[year]))
+        for tax_invoice in by_year[year]:
+            tax_invoice.invoice_number = f"{year}/{number:04d}"
+            number += 1
+
+
+def preview_tax_invoices(date_from, date_to):
+    """Facturas que generaría generate_tax_invoices(), con números provisionales (no se guarda nada)"""
+    invoices = plan_tax_invoices(payments_in_range(date_from, date_to))
+    _assign_numbers(
+        invoices,
+        lambda year, count: InvoiceSequence.peek(InvoiceSequence.SERIES_TAX_INVOICE, year)
+    )
+    return invoices
+
+
+def generate_tax_invoices(date_from, date_to, user=None):
+    """
+    Crea las facturas trimestrales de todos los pagos sin factura del rango.
+    Retorna la lista de facturas creadas.
+    """
+    with transaction.atomic():
+        payments = list(payments_in_range(date_from, date_to))
+        if not payments:
+            return []
+
+        # Bloquear los pagos y descartar los que otra petición haya facturado mientras tanto
+        locked = set(
+            uninvoiced_payments(Payment.objects.select_for_update().filter(pk__in=[payment.pk for payment in payments]))
+            .values_list('pk', flat=True)
+        )
+        invoices = plan_tax_invoices([payment for payment in payments if payment.pk in locked])
+        if not invoices:
+            return []
+
+        _assign_numbers(
+            invoices,
+            lambda year, count: InvoiceSequence.reserve(InvoiceSequence.SERIES_TAX_INVOICE, year, count)
+        )
+        for tax_invoice in invoices:
+            tax_invoice.created_by = user
+            tax_invoice.notes = 'Generada en bloque'
+
+        TaxInvoice.objects.bulk_create(invoices, batch_size=BATCH_SIZE)
+        Link = TaxInvoice.payments.through
+        Link.objects.bulk_create(
+            [
+                Link(taxinvoice_id=tax_invoice.pk, payment_id=payment.pk)
+                for tax_invoice in invoices
+                for payment in tax_invoice.batch_payments
+            ],
+            batch_size=BATCH_SIZE
+        )
+
+        # bulk_create no dispara las señales: resúmenes de IVA y caché de las fichas
+        for group in sorted({(tax_invoice.year, tax_invoice.quarter, tax_invoice.curso) for tax_invoice in invoices}):
+            TaxInvoiceSummary.refresh(*group)
+        StudentBalance.refresh_many({tax_invoice.student_id for tax_invoice in invoices})
+
+    return invoices
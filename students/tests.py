@@ -1,3 +1,1201 @@
-from django.test import TestCase
+import importlib
+import os
+import re
+
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from itertools import product
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+
+from .audit import AuditBuffer
+from .bonus import BONUS_MINUTES, apply_practice_minutes
+from .invoice_export import default_workers, stream_zip
+from . import pdf_resources
+from .invoice_pdf import render_tax_invoice_pdf, tax_invoice_filename
+
+from .pagination import keyset_paginate
+from .models import (
+    AuditLog, Invoice, InvoiceSequence, LicenseType, Maintenance,
+ Payment, Practice, Student, StudentBalance,
+    StudentSearchToken, TaxInvoice, TaxInvoiceSummary, TrimestreImport, TrimestreImportRow, Vehicle, Voucher
+
+
+)
+from .practices import PracticeEntry, register_practices
+from .invoice_backfill import preview_card_invoices
+from .search import search_students, student_tokens
+from .tax_invoice_batch import generate_tax_invoices, preview_tax_invoices
+
+
+from .trimestre_export import trimestre_rows
+from .trimestre_writer import TrimestreWriter
+
+
+
+def make_student(dni, first_name='Ana', last_name='Ruiz Gil', license_name='B'):
+    license_type, _ = LicenseType.objects.get_or_create(name=license_name)
+    return Student.objects.create(
+        first_name=first_name, last_name=last_name, dni=dni, phone='600000000', license_type=license_type
+    )
+
+
+def make_tax_invoice(student, invoice_number, fecha, total='121.00', curso='B', **flags):
+    """Factura trimestral con el desglose de compute_components()"""
+    base, iva, tasas, total = TaxInvoice.compute_components(
+        Decimal(total), flags.get('has_tasa_basica', False), flags.get('has_tasa_a', False),
+        flags.get('has_traslado', False), flags.get('renovaciones_count', 0), curso
+    )
+    tax_invoice = TaxInvoice(
+        student=student, invoice_number=invoice_number, fecha=fecha, curso=curso,
+        base_imponible=base, iva_amount=iva, tasas_amount=tasas, total=total, **flags
+    )
+    tax_invoice.copy_client_data(student)
+    tax_invoice.save()
+    return tax_invoice
+
+
+@override_settings(AUDIT_LOG_SYNC=False, AUDIT_LOG_BATCH_SIZE=3, AUDIT_LOG_MAX_PENDING=5)
+class AuditBufferTests(TestCase):
+    """Escritura diferida del registro de auditoría (students/audit.py)"""
+
+    def setUp(self):
+        self.buffer = AuditBuffer()
+        patcher = mock.patch('students.audit.audit_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def log(self, number, action='CREATE'):
+        return AuditLog.log_action(
+            user=None, action=action, entity_type='STUDENT', entity_id=number,
+            entity_name=f'Alumno {number}', description=f'Entrada {number}'
+        )
+
+    def saved_ids(self):
+        return sorted(AuditLog.objects.values_list('entity_id', flat=True))
+
+    def test_saved_on_commit_outside_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(1)
+            self.assertEqual(self.saved_ids(), [])
+        self.assertEqual(self.saved_ids(), [1])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_rollback_discards_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.log(1)
+                    raise RuntimeError
+        self.assertEqual(self.saved_ids(), [])
+
+    def test_request_entries_flushed_at_request_end_or_full_batch(self):
+        self.buffer.request_started()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(1)
+            self.log(2)
+        self.assertEqual((self.saved_ids(), len(self.buffer)), ([], 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(3)
+        self.assertEqual(self.saved_ids(), [1, 2, 3])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(4)
+        self.assertEqual(self.saved_ids(), [1, 2, 3])
+        self.buffer.request_finished()
+        self.assertEqual(self.saved_ids(), [1, 2, 3, 4])
+
+    def test_failed_batch_retried_row_by_row(self):
+        self.buffer.request_started()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(1)
+            self.log(2, action=None)  # NOT NULL: falla por sus datos
+        with self.assertLogs('students.audit', 'ERROR') as logs:
+            self.buffer.request_finished()
+        self.assertIn('descartada', logs.output[-1])
+
+        self.assertEqual(self.saved_ids(), [1])
+        self.assertEqual([entry.entity_id for entry in self.buffer.dead_letter], [2])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_connection_errors_requeue_entries(self):
+        self.buffer.request_started()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(1)
+            self.log(2)
+        error = OperationalError('database is locked')
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=error), \
+                mock.patch.object(AuditLog, 'save', side_effect=error), \
+                self.assertLogs('students.audit', 'ERROR'):
+            self.buffer.request_finished()
+        self.assertEqual((self.saved_ids(), len(self.buffer)), ([], 2))
+        self.assertEqual(len(self.buffer.dead_letter), 0)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.saved_ids(), [1, 2])
+
+    def test_queue_is_capped(self):
+        self.buffer.request_started()
+        error = OperationalError('database is locked')
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=error), \
+                mock.patch.object(AuditLog, 'save', side_effect=error), \
+                self.assertLogs('students.audit', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                for number in range(1, 9):
+                    self.log(number)
+        self.assertTrue(any('Cola de auditoría llena' in line for line in logs.output))
+
+        # Se conservan las AUDIT_LOG_MAX_PENDING más recientes
+        self.assertEqual([entry.entity_id for entry in self.buffer._entries], [4, 5, 6, 7, 8])
+        self.buffer.request_finished()
+        self.assertEqual(self.saved_ids(), [4, 5, 6, 7, 8])
+
+
+class InvoiceSequenceTests(TestCase):
+
+    """Numeración de facturas (InvoiceSequence)"""
+    SERIES = InvoiceSequence.SERIES_TAX_INVOICE
+
+    def test_reserve_is_consecutive_per_year(self):
+        self.assertEqual(InvoiceSequence.reserve(self.SERIES, 2025, 1), 1)
+        self.assertEqual(InvoiceSequence.reserve(self.SERIES, 2025, 3), 2)
+        self.assertEqual(InvoiceSequence.reserve(self.SERIES, 2025, 1), 5)
+        self.assertEqual(InvoiceSequence.reserve(self.SERIES, 2024, 1), 1)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 6)
+
+    def test_rolled_back_reservation_returns_its_number(self):
+        InvoiceSequence.reserve(self.SERIES, 2025, 1)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(TaxInvoice.generate_invoice_number(2025), '2025/0002')
+                raise RuntimeError('fallo al emitir la factura')
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 2)
+        self.assertEqual(TaxInvoice.generate_invoice_number(2025), '2025/0002')
+
+    def test_observe_never_moves_backwards(self):
+        InvoiceSequence.observe(self.SERIES, 2025, 10)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 11)
+        InvoiceSequence.observe(self.SERIES, 2025, 4)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 11)
+        self.assertEqual(TaxInvoice.generate_invoice_number(2025), '2025/0011')
+        InvoiceSequence.observe(self.SERIES, 2025, 11)
+        self.assertEqual(TaxInvoice.generate_invoice_number(2025), '2025/0012')
+
+
+class TaxInvoiceBatchTests(TestCase):
+    """Facturación trimestral en bloque (tax_invoice_batch.generate_tax_invoices)"""
+
+    SERIES = InvoiceSequence.SERIES_TAX_INVOICE
+
+    def setUp(self):
+        self.ana = make_student('11111111H', first_name='Ana', last_name='Abad')
+        self.luis = make_student('22222222J', first_name='Luis', last_name='Bravo')
+        self.pay(self.ana, '2024-12-20', '121.00')
+        self.pay(self.ana, '2025-02-10', '60.50')
+        self.pay(self.ana, '2025-01-15', '60.50')
+        self.pay(self.luis, '2025-01-20', '242.00')
+        self.pay(self.luis, '2025-04-02', '100.00')
+        # Números ya emitidos a mano este año
+        InvoiceSequence.observe(self.SERIES, 2025, 3)
+
+    def pay(self, student, day, amount):
+        return Payment.objects.create(
+            student=student, amount=Decimal(amount), payment_method='CASH',
+            date_paid=timezone.make_aware(datetime.fromisoformat(day).replace(hour=12))
+        )
+
+    def numbers(self):
+        return list(TaxInvoice.objects.order_by('invoice_number').values_list('invoice_number', 'fecha', 'student__dni'))
+
+    def test_numbers_are_consecutive_in_date_order(self):
+        preview = [invoice.invoice_number for invoice in preview_tax_invoices(date(2024, 1, 1), date(2025, 12, 31))]
+        created = generate_tax_invoices(date(2024, 1, 1), date(2025, 12, 31))
+
+        self.assertEqual([invoice.invoice_number for invoice in created], preview)
+        self.assertEqual(self.numbers(), [
+            ('2024/0001', date(2024, 12, 20), '11111111H'),
+            ('2025/0004', date(2025, 1, 20), '22222222J'),
+            ('2025/0005', date(2025, 2, 10), '11111111H'),  # Dos pagos del T1 en una factura
+            ('2025/0006', date(2025, 4, 2), '22222222J'),
+        ])
+        self.assertEqual(TaxInvoice.objects.get(invoice_number='2025/0005').payments.count(), 2)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 7)
+        self.assertEqual(TaxInvoiceSummary.objects.get(year=2025, quarter=1).invoice_count, 2)
+
+        # Los pagos ya facturados no se vuelven a facturar
+        self.assertEqual(generate_tax_invoices(date(2024, 1, 1), date(2025, 12, 31)), [])
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 7)
+
+    def test_failure_consumes_no_numbers(self):
+        with mock.patch.object(TaxInvoiceSummary, 'refresh', side_effect=OperationalError('fallo')):
+            with self.assertRaises(OperationalError):
+                generate_tax_invoices(date(2024, 1, 1), date(2025, 12, 31))
+
+        self.assertEqual(TaxInvoice.objects.count(), 0)
+        self.assertEqual(TaxInvoice.payments.through.objects.count(), 0)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2025), 4)
+        self.assertEqual(InvoiceSequence.peek(self.SERIES, 2024), 1)
+
+        # El reintento usa los mismos números, sin huecos
+        generate_tax_invoices(date(2024, 1, 1), date(2025, 12, 31))
+        self.assertEqual([number for number, *_ in self.numbers()], ['2024/0001', '2025/0004', '2025/0005', '2025/0006'])
+
+
+class CardInvoiceBackfillTests(TestCase):
+    """Emisión en bloque de facturas de pagos con tarjeta (invoice_backfill, backfill_invoices)"""
+
+    def setUp(self):
+        self.student = make_student('12345678Z')
+
+    def pay(self, when, amount='121.00', method='CARD'):
+        return Payment.objects.create(
+            student=self.student, amount=Decimal(amount), payment_method=method,
+            date_paid=timezone.make_aware(datetime.fromisoformat(when))
+        )
+
+    def issued(self):
+        return [
+            (invoice.invoice_number, timezone.localtime(invoice.date_issued).date())
+            for invoice in Invoice.objects.order_by('invoice_number')
+        ]
+
+    def test_numbers_follow_payment_dates_and_rerun_is_noop(self):
+        # Pagos creados fuera de orden, en varios trimestres y dos años
+        self.pay('2025-05-03 10:00')
+        self.pay('2025-02-11 18:00')
+        self.pay('2024-11-30 09:00')
+        self.pay('2025-02-11 09:30')
+        self.pay('2025-01-07 12:00', method='CASH')
+        # Uno ya facturado al descargar su PDF (con la fecha de la descarga)
+        downloaded = Invoice.create_from_payment(self.pay('2025-03-01 08:00'))
+        today = timezone.localdate()
+        self.assertEqual(self.issued(), [(f'{today.year}-00001', today)])
+
+        preview = [invoice.invoice_number for invoice in preview_card_invoices()]
+        call_command('backfill_invoices', stdout=StringIO())
+
+        self.assertEqual(self.issued(), [
+            ('2024-00001', date(2024, 11, 30)),
+            ('2025-00001', date(2025, 2, 11)),
+            ('2025-00002', date(2025, 2, 11)),
+            ('2025-00003', date(2025, 5, 3)),
+            (downloaded.invoice_number, today),
+        ])
+        # Mismo día: por hora de pago
+        self.assertEqual(
+            list(Invoice.objects.filter(invoice_number__in=['2025-00001', '2025-00002'])
+                 .order_by('invoice_number').values_list('payment__amount', 'payment__date_paid')),
+            list(Payment.objects.filter(date_paid__date=date(2025, 2, 11)).order_by('date_paid')
+                 .values_list('amount', 'date_paid'))
+        )
+        self.assertEqual(preview, ['2024-00001', '2025-00001', '2025-00002', '2025-00003'])
+
+        # Una segunda ejecución no emite nada ni consume números
+        out = StringIO()
+        call_command('backfill_invoices', stdout=out)
+        self.assertIn('Todos los pagos con tarjeta tienen factura', out.getvalue())
+        self.assertEqual(len(self.issued()), 5)
+        self.assertEqual(InvoiceSequence.peek(InvoiceSequence.SERIES_INVOICE, 2025), 4)
+
+
+class StudentBalanceTests(TestCase):
+    """Saldo materializado del alumno (StudentBalance) mantenido por las señales"""
+
+    def setUp(self):
+        self.student = make_student('12345678Z')
+
+    def ledger(self):
+        return StudentBalance.objects.get(student=self.student)
+
+    def assertLedger(self, debt, paid):
+        ledger = self.ledger()
+        self.assertEqual((ledger.total_debt, ledger.total_paid), (Decimal(debt), Decimal(paid)))
+        return ledger
+
+    def test_follows_vouchers_and_payments(self):
+        voucher = Voucher.objects.create(student=self.student, concept_type='OTHER', amount=Decimal('300.00'))
+        self.assertLedger('300.00', '0.00')
+        payment = Payment.objects.create(student=self.student, amount=Decimal('120.50'), payment_method='CASH')
+        self.assertLedger('300.00', '120.50')
+        self.assertEqual(self.student.get_total_debt(), Decimal('300.00'))
+
+        payment.amount = Decimal('100.00')
+        payment.save()
+        self.assertLedger('300.00', '100.00')
+
+        payment.delete()
+        self.assertLedger('300.00', '0.00')
+        voucher.delete()
+        self.assertLedger('0.00', '0.00')
+
+    def test_payment_moved_to_other_student(self):
+        other = make_student('87654321X', first_name='Luis')
+        payment = Payment.objects.create(student=self.student, amount=Decimal('50.00'), payment_method='CARD')
+        payment.student = other
+        payment.save()
+        self.assertLedger('0.00', '0.00')
+        self.assertEqual(StudentBalance.objects.get(student=other).total_paid, Decimal('50.00'))
+
+    def test_follows_practices(self):
+        before = self.ledger().cache_version
+        voucher = Voucher.objects.create(student=self.student, concept_type='PRACTICE_90', amount=Decimal('45.00'))
+        practice = Practice.objects.create(student=self.student, duration=90, is_billed=True, billed_voucher=voucher)
+        ledger = self.assertLedger('45.00', '0.00')
+        self.assertGreater(ledger.cache_version, before)
+
+        # Las prácticas no cambian importes, pero invalidan la caché de la ficha
+        before = ledger.cache_version
+        practice.delete()
+        ledger = self.assertLedger('45.00', '0.00')
+        self.assertGreater(ledger.cache_version, before)
+
+        voucher.delete()
+        self.assertLedger('0.00', '0.00')
+
+    def test_refresh_recreates_missing_row(self):
+        voucher = Voucher.objects.create(student=self.student, concept_type='PRACTICE_60', amount=Decimal('30.00'))
+        Practice.objects.create(student=self.student, duration=60, is_billed=True, billed_voucher=voucher)
+        Payment.objects.create(student=self.student, amount=Decimal('10.00'), payment_method='CASH')
+        StudentBalance.objects.filter(student=self.student).delete()
+
+        ledger = StudentBalance.refresh(self.student.pk)
+        self.assertEqual(ledger.pk, self.ledger().pk)
+        self.assertEqual((ledger.total_debt, ledger.total_paid, ledger.practice_minutes), (Decimal('30.00'), Decimal('10.00'), 60))
+
+        # Refrescar una fila existente la retorna también, sin tocar los minutos
+        StudentBalance.objects.filter(pk=ledger.pk).update(total_paid=0, practice_minutes=15)
+        ledger = StudentBalance.refresh(self.student.pk)
+        self.assertEqual((ledger.total_paid, ledger.practice_minutes), (Decimal('10.00'), 15))
+
+    def test_get_ledger_creates_row(self):
+        StudentBalance.objects.filter(student=self.student).delete()
+        student = Student.objects.get(pk=self.student.pk)
+        self.assertIsNotNone(student.get_ledger().pk)
+        self.assertEqual(student.get_total_debt(), Decimal('0.00'))
+
+    def test_refresh_unknown_student(self):
+        with self.assertRaises(Student.DoesNotExist):
+            StudentBalance.refresh(self.student.pk + 1000)
+        self.assertFalse(StudentBalance.objects.filter(student_id=self.student.pk + 1000).exists())
+
+
+class BonusDiscountTests(TestCase):
+
+    """Descuentos de bono por prácticas acumuladas (students/bonus.py)"""
+
+    def setUp(self):
+        self.student = Student.objects.create(
+            first_name='Ana', last_name='Ruiz', dni='12345678Z', phone='600000000',
+            license_type=LicenseType.objects.create(name='B')
+        )
+
+    def discounts(self):
+        return Voucher.objects.filter(student=self.student, concept_type='BONUS_DISCOUNT')
+
+    def test_crossing_threshold_up_and_down(self):
+        result = apply_practice_minutes(self.student, BONUS_MINUTES - 30)
+        self.assertEqual(result.created, [])
+        self.assertEqual(result.minutes_for_next_bonus, 30)
+        self.assertEqual(self.discounts().count(), 0)
+
+        result = apply_practice_minutes(self.student, 60)
+        self.assertEqual(len(result.created), 1)
+        self.assertEqual(self.discounts().get().amount, Decimal('-25.00'))
+
+        # Moverse por encima del umbral no emite ni revierte nada
+        result = apply_practice_minutes(self.student, -20)
+        self.assertEqual((result.created, result.reversed_count), ([], 0))
+        self.assertEqual(self.discounts().count(), 1)
+
+        result = apply_practice_minutes(self.student, -90)
+        self.assertEqual(result.reversed_count, 1)
+        self.assertEqual(self.discounts().count(), 0)
+        self.assertEqual(StudentBalance.objects.get(student=self.student).practice_minutes, BONUS_MINUTES - 80)
+
+    def test_minutes_never_go_negative(self):
+        apply_practice_minutes(self.student, 90)
+        result = apply_practice_minutes(self.student, -180)
+        self.assertEqual(result.total_minutes, 0)
+        self.assertEqual(result.reversed_count, 0)
+
+
+class RegisterPracticesTests(TestCase):
+    """Alta de prácticas en bloque (practices.register_practices) frente a voucher_create"""
+
+    DURATIONS = [90, 90, 60, 90, 45, 90, 30, 60]
+
+    def setUp(self):
+        self.user = User.objects.create_user('admin', password='x')
+        self.client.force_login(self.user)
+
+    def create_one_by_one(self, student):
+        for day, duration in enumerate(self.DURATIONS, start=1):
+            response = self.client.post(reverse('voucher_create', args=[student.pk]), {
+                'concept_type': f'PRACTICE_{duration}', 'amount': '0', 'description': f'Clase {day}',
+                'practice_date': f'2026-03-{day:02d}',
+            })
+            self.assertEqual(response.status_code, 302)
+
+    def entries(self, student):
+        return [
+            PracticeEntry(student, date(2026, 3, day), duration, f'Clase {day}')
+            for day, duration in enumerate(self.DURATIONS, start=1)
+        ]
+
+    def state(self, student):
+        ledger = StudentBalance.objects.get(student=student)
+        return {
+            'ledger': (ledger.total_debt, ledger.total_paid, ledger.practice_minutes),
+            # La descripción del descuento lleva los minutos acumulados al emitirlo (distintos en bloque)
+            'vouchers': sorted(student.vouchers.values_list('concept_type', 'amount')),
+            'practice_vouchers': sorted(
+                student.vouchers.filter(concept_type__startswith='PRACTICE_').values_list('description', flat=True)
+            ),
+            'practices': sorted(student.practices.values_list('practice_date', 'duration', 'notes', 'is_billed')),
+        }
+
+    def test_bulk_matches_one_by_one(self):
+        one_by_one = make_student('11111111H')
+        bulk = make_student('22222222J')
+        other = make_student('33333333P')
+        for student in (one_by_one, bulk, other):
+            apply_practice_minutes(student, 60)
+            Payment.objects.create(student=student, amount=Decimal('100.00'), payment_method='CASH')
+
+        self.create_one_by_one(one_by_one)
+        # Varios alumnos mezclados en la misma llamada
+        results = register_practices(self.entries(bulk) + self.entries(other), user=self.user)
+
+        expected = self.state(one_by_one)
+        self.assertEqual(expected['ledger'][2], 60 + sum(self.DURATIONS))
+        self.assertEqual(len([v for v in expected['vouchers'] if v[0] == 'BONUS_DISCOUNT']), 1)
+        self.assertEqual(self.state(bulk), expected)
+        self.assertEqual(self.state(other), expected)
+        self.assertEqual(len(results[bulk].created), 1)
+        self.assertEqual(results[bulk].total_minutes, expected['ledger'][2])
+
+
+class VehicleMaintenanceStatsTests(TestCase):
+    """Resumen de mantenimientos anotado en una consulta (Vehicle.with_maintenance_stats)"""
+
+    def test_stats_across_years(self):
+        year = timezone.localdate().year
+        car = Vehicle.objects.create(license_plate='1234ABC', brand='Seat', model='Ibiza')
+        Vehicle.objects.create(license_plate='5678DEF', brand='Honda', model='CB500')
+
+        def add(day, kind, cost=None, mileage=None, created=None):
+            Maintenance.objects.create(
+                vehicle=car, maintenance_type=kind, maintenance_date=day, cost=cost, mileage=mileage,
+                date_created=created or timezone.now()
+            )
+
+        add(date(year - 1, 5, 1), 'OIL_CHANGE', Decimal('80.00'), 90000)
+        add(date(year - 1, 11, 20), 'ITV', Decimal('45.50'), 95000)
+        add(date(year, 2, 1), 'REPAIR', Decimal('300.25'), 100000, created=timezone.now() - timedelta(hours=1))
+        # Mismo día que la anterior pero creado después, sin kilometraje ni coste
+        add(date(year, 2, 1), 'CLEANING')
+
+        with self.assertNumQueries(1):
+            vehicles = {vehicle.license_plate: vehicle for vehicle in Vehicle.with_maintenance_stats()}
+
+        stats = vehicles['1234ABC']
+        self.assertEqual(stats.last_maintenance_date, date(year, 2, 1))
+        self.assertEqual(stats.last_maintenance_type, 'CLEANING')
+        self.assertEqual(stats.get_last_maintenance_type_display(), 'Limpieza')
+        self.assertEqual(stats.last_mileage, 100000)
+        self.assertEqual(stats.maintenance_count, 4)
+        self.assertEqual(stats.maintenance_total_cost, Decimal('425.75'))
+        self.assertEqual(stats.maintenance_cost_year, Decimal('300.25'))
+
+        empty = vehicles['5678DEF']
+        self.assertIsNone(empty.last_maintenance_date)
+        self.assertIsNone(empty.last_maintenance_type)
+        self.assertIsNone(empty.last_mileage)
+        self.assertEqual(empty.maintenance_count, 0)
+        self.assertEqual(empty.maintenance_total_cost, Decimal('0'))
+        self.assertEqual(empty.maintenance_cost_year, Decimal('0'))
+
+
+class ComputeComponentsBatchTests(TestCase):
+    """compute_components_batch() da lo mismo que compute_components()"""
+
+    def test_batch_matches_decimal_version(self):
+        sum_tasas = TaxInvoice.TASA_BASICA + TaxInvoice.TASA_A + TaxInvoice.TRASLADO + 2 * TaxInvoice.RENOVACION
+        totals = [
+            Decimal('0.00'), Decimal('0.01'), Decimal('0.60'), Decimal('1.21'), Decimal('1.82'),
+            Decimal('100.00'), Decimal('121.00'), Decimal('999999.99'),
+            TaxInvoice.TASA_BASICA, TaxInvoice.TASA_BASICA + Decimal('0.01'), sum_tasas, sum_tasas - Decimal('0.01'),
+        ]
+        # Importes pequeños: muchos casos de redondeo (0,60 da base 0,50 e IVA 0,105 -> 0,11)
+        totals += [Decimal(cents).scaleb(-2) for cents in range(1, 400, 11)]
+        cases = list(product(
+            totals, [False, True], [False, True], [False, True], [0, 2], ['B', 'A2', 'C', 'C+E']
+        ))
+
+        bases, ivas, tasas, results = TaxInvoice.compute_components_batch(
+            [TaxInvoice.to_cents(total) for total, *_ in cases],
+            *[[case[column] for case in cases] for column in range(1, 6)]
+        )
+
+        for i, case in enumerate(cases):
+            expected = TaxInvoice.compute_components(*case)
+            batch = tuple(TaxInvoice.from_cents(cents[i]) for cents in (bases, ivas, tasas, results))
+            self.assertEqual(batch, expected, case)
+
+
+class TaxInvoiceSummaryTests(TestCase):
+    """Resumen trimestral de IVA mantenido por las señales (TaxInvoiceSummary)"""
+
+    def setUp(self):
+        self.student = make_student('12345678Z')
+
+    def summaries(self):
+        return {
+            (s.year, s.quarter, s.curso): (s.invoice_count, s.base_imponible, s.iva_amount, s.tasas_amount, s.total)
+            for s in TaxInvoiceSummary.objects.all()
+        }
+
+    def expected(self):
+        """Sumas hechas a mano desde las facturas, céntimo a céntimo"""
+        groups = {}
+        for invoice in TaxInvoice.objects.all():
+            key = (invoice.year, invoice.quarter, invoice.curso)
+            count, *amounts = groups.get(key, (0, Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0')))
+            values = (invoice.base_imponible, invoice.iva_amount, invoice.tasas_amount, invoice.total)
+            groups[key] = (count + 1, *[a + v for a, v in zip(amounts, values)])
+        return groups
+
+    def assertSummaryMatches(self):
+        self.assertEqual(self.summaries(), self.expected())
+        # La reconstrucción completa da lo mismo que el mantenimiento incremental
+        incremental = self.summaries()
+        TaxInvoiceSummary.rebuild()
+        self.assertEqual(self.summaries(), incremental)
+
+    def test_totals_follow_invoices(self):
+        # Importes pequeños y grandes con redondeo del IVA a céntimos
+        first = make_tax_invoice(self.student, '2025/0001', date(2025, 1, 10), total='0.60')
+        make_tax_invoice(self.student, '2025/0002', date(2025, 2, 3), total='1.21')
+        make_tax_invoice(self.student, '2025/0003', date(2025, 3, 31), total='999.99', has_tasa_basica=True)
+        make_tax_invoice(self.student, '2025/0004', date(2025, 3, 31), total='0.01', curso='A2')
+        last = make_tax_invoice(self.student, '2025/0005', date(2025, 4, 1), total='333.33')
+        self.assertEqual(set(self.summaries()), {(2025, 1, 'B'), (2025, 1, 'A2'), (2025, 2, 'B')})
+        self.assertEqual(self.summaries()[(2025, 1, 'B')][0], 3)
+        self.assertSummaryMatches()
+
+        # Edición del importe
+        base, iva, tasas, total = TaxInvoice.compute_components(Decimal('1.82'), False, False, False, 0, 'B')
+        first.base_imponible, first.iva_amount, first.tasas_amount, first.total = base, iva, tasas, total
+        first.save()
+        self.assertSummaryMatches()
+
+        # Cambio de trimestre y de curso: se recalculan el grupo nuevo y el anterior
+        last.fecha, last.quarter, last.curso = date(2025, 3, 15), 1, 'A2'
+        last.save()
+        self.assertNotIn((2025, 2, 'B'), self.summaries())
+        self.assertSummaryMatches()
+
+        first.delete()
+        self.assertSummaryMatches()
+        TaxInvoice.objects.filter(curso='A2').delete()
+        self.assertEqual(set(self.summaries()), {(2025, 1, 'B')})
+        self.assertSummaryMatches()
+
+
+class StudentListCountTests(TestCase):
+
+    """Total cacheado de la lista de alumnos (search.count_cache_key)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+
+    def total_count(self, query=''):
+        return self.client.get(reverse('student_list'), {'q': query}).context['total_count']
+
+    def test_total_follows_database_without_signals(self):
+        make_student('11111111H', first_name='Ana')
+        self.assertEqual(self.total_count(), 1)
+        self.assertEqual(self.total_count('ana'), 1)
+
+        # Alta en bloque sin señales, como import_trimestre en otro proceso:
+        # solo cambian las tablas, no la caché de este proceso
+        created = Student.objects.bulk_create([
+            Student(first_name='Ana', last_name='Vidal', dni='22222222J', phone='1', license_type=LicenseType.objects.get()),
+        ])
+        StudentBalance.rebuild([student.pk for student in created])
+        StudentSearchToken.rebuild([student.pk for student in created])
+        self.assertEqual(self.total_count(), 2)
+        self.assertEqual(self.total_count('ana'), 2)
+
+        Student.objects.filter(pk=created[0].pk).delete()
+        self.assertEqual(self.total_count('ana'), 1)
+
+    def test_cached_count_is_reused(self):
+        make_student('11111111H')
+        self.total_count()
+        with mock.patch.object(type(Student.objects.all()), 'count', side_effect=AssertionError('COUNT repetido')):
+            self.assertEqual(self.total_count(), 1)
+
+
+class StudentDetailCacheTests(TestCase):
+    """Fragmentos {% cache %} de la ficha del alumno (versión = StudentBalance.cache_version)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+        self.student = make_student('12345678Z')
+
+    def detail(self):
+        response = self.client.get(reverse('student_detail', args=[self.student.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_fragments_are_cached(self):
+        self.detail()
+        # Un cambio sin señales no cambia la versión: se sirve el fragmento guardado
+        Voucher.objects.bulk_create([Voucher(student=self.student, concept_type='OTHER', amount=Decimal('77.00'))])
+        html = self.detail()
+        self.assertIn('Cargos (0)', html)
+        self.assertNotIn('77,00€', html)
+
+    def test_payment_busts_fragments(self):
+        self.assertIn('Pagos (0)', self.detail())
+        payment = Payment.objects.create(student=self.student, amount=Decimal('123.45'), payment_method='CASH')
+        html = self.detail()
+        self.assertIn('Pagos (1)', html)
+        self.assertIn('<span class="amount-positive">123,45€</span>', html)
+
+        payment.delete()
+        html = self.detail()
+        self.assertIn('Pagos (0)', html)
+        self.assertNotIn('123,45€', html)
+
+    def test_practice_busts_fragments(self):
+        self.assertIn('Prácticas (0)', self.detail())
+        practice = Practice.objects.create(student=self.student, duration=60, notes='Rotondas')
+        html = self.detail()
+        self.assertIn('Prácticas (1)', html)
+        self.assertIn('Rotondas', html)
+
+        practice.notes = 'Aparcamiento'
+        practice.save()
+        html = self.detail()
+        self.assertIn('Aparcamiento', html)
+        self.assertNotIn('Rotondas', html)
+
+
+class StudentSearchTests(TestCase):
+
+    """Búsqueda de alumnos por tokens normalizados (students/search.py)"""
+
+    def setUp(self):
+        self.garcia = make_student('12.345.678-Z', first_name='José Ángel', last_name='García Núñez')
+        self.ruiz = make_student('87654321X', first_name='Ana', last_name='Ruiz Gil')
+        Student.objects.filter(pk=self.ruiz.pk).update(phone='+34 612 34 56 78')
+        StudentSearchToken.refresh(Student.objects.get(pk=self.ruiz.pk))
+
+    def found(self, query):
+        return set(search_students(Student.objects.all(), query).values_list('pk', flat=True))
+
+    def test_ignores_accents_and_case(self):
+        for query in ['garcia', 'GARCÍA', 'Nuñez', 'jose angel', 'ÁNG']:
+            self.assertEqual(self.found(query), {self.garcia.pk}, query)
+        self.assertEqual(self.found('12345678z'), {self.garcia.pk})
+        self.assertEqual(self.found('12 345 678-Z'), {self.garcia.pk})
+
+    def test_phone_with_and_without_prefix(self):
+        self.assertEqual(self.found('612345678'), {self.ruiz.pk})
+        self.assertEqual(self.found('612 34 56 78'), {self.ruiz.pk})
+        self.assertEqual(self.found('34612345678'), {self.ruiz.pk})
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.found('gar jos'), {self.garcia.pk})
+        self.assertEqual(self.found('ana gil'), {self.ruiz.pk})
+        self.assertEqual(self.found('ana garcia'), set())
+        self.assertEqual(self.found('ruiz'), {self.ruiz.pk})
+        self.assertEqual(self.found(''), {self.garcia.pk, self.ruiz.pk})
+
+    def test_tokens_follow_student_changes(self):
+        self.garcia.last_name = 'Pérez'
+        self.garcia.save()
+        self.assertEqual(self.found('garcia'), set())
+        self.assertEqual(self.found('perez'), {self.garcia.pk})
+
+        self.garcia.delete()
+        self.assertEqual(self.found('perez'), set())
+        self.assertFalse(StudentSearchToken.objects.filter(student_id=self.garcia.pk).exists())
+
+    def test_migration_tokens_match_search(self):
+        migration = importlib.import_module('students.migrations.0012_add_student_search_tokens')
+        for student in Student.objects.all():
+            self.assertEqual(migration.student_tokens(student), student_tokens(student))
+            self.assertEqual(
+                set(StudentSearchToken.objects.filter(student=student).values_list('token', flat=True)),
+                student_tokens(student)
+            )
+
+
+class KeysetPaginationTests(TestCase):
+    """Paginación por cursor (students/pagination.py)"""
+
+    def setUp(self):
+        # 7 alumnos; los 4 primeros con la misma fecha para forzar el desempate por id
+        same = timezone.make_aware(datetime(2026, 3, 1, 10, 0))
+        dates = [same] * 4 + [timezone.make_aware(datetime(2026, 3, day, 10, 0)) for day in (2, 3, 4)]
+        self.students = []
+        for i, registered in enumerate(dates):
+            student = make_student(f'{i:08d}A')
+            Student.objects.filter(pk=student.pk).update(date_registered=registered)
+            self.students.append(student.pk)
+        # Orden esperado: fecha descendente y, con la misma fecha, id descendente
+        self.expected = self.students[4:][::-1] + self.students[:4][::-1]
+
+    def page(self, **cursors):
+        return keyset_paginate(Student.objects.all(), 'date_registered', per_page=3, **cursors)
+
+    def ids(self, page):
+        return [student.pk for student in page]
+
+    def test_forward_and_back(self):
+        first = self.page()
+        self.assertEqual(self.ids(first), self.expected[:3])
+        self.assertEqual((first.has_previous, first.has_next), (False, True))
+
+        # La frontera entre la 1ª y 2ª página cae dentro del grupo de fechas iguales
+        second = self.page(after=first.next_cursor)
+        self.assertEqual(self.ids(second), self.expected[3:6])
+        third = self.page(after=second.next_cursor)
+        self.assertEqual(self.ids(third), self.expected[6:])
+        self.assertEqual((third.has_previous, third.has_next), (True, False))
+
+        back = self.page(before=third.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        self.assertEqual((back.next_cursor, back.previous_cursor), (second.next_cursor, second.previous_cursor))
+        back = self.page(before=back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous)
+
+    def test_cursor_stable_after_insert(self):
+        first = self.page()
+        second = self.page(after=first.next_cursor)
+        # Un alta nueva (más reciente) no desplaza las páginas ya calculadas
+        make_student('99999999R')
+        self.assertEqual(self.ids(self.page(after=first.next_cursor)), self.ids(second))
+        self.assertEqual(self.ids(self.page(before=second.previous_cursor))[-2:], self.ids(first)[-2:])
+
+    def test_invalid_cursor_shows_first_page(self):
+        expected = self.ids(self.page())
+        for cursor in ['', 'x', 'abc_1', '2026-03-01T10:00:00+00:00_x', '2026-13-45T10:00:00_1', '_5',
+                       '2026-03-01T10:00:00+00:00_-1', '2026-03-01T10:00:00+00:00_99999999999999999999999']:
+            self.assertEqual(self.ids(self.page(after=cursor)), expected, cursor)
+            self.assertEqual(self.ids(self.page(before=cursor)), expected, cursor)
+
+    def test_list_view_with_tampered_cursor(self):
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+        response = self.client.get(reverse('student_list'), {'after': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 7)
+
+
+class InvoiceExportTests(TestCase):
+
+    """ZIP con los PDF de un trimestre (students/invoice_export.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+
+    def test_stream_zip(self):
+        entries = [(f'fra {number:04d}.pdf', os.urandom(100 * 1024)) for number in range(1, 4)]
+        chunks = list(stream_zip(iter(entries)))
+        # Un trozo por fichero como mínimo: el ZIP sale según se añaden los ficheros
+        self.assertGreaterEqual(len(chunks), len(entries))
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual([(name, archive.read(name)) for name in archive.namelist()], entries)
+
+    def test_quarter_zip_contents(self):
+        student = make_student('12345678Z')
+        invoices = [
+            make_tax_invoice(student, '2025/0001', date(2025, 1, 10)),
+            make_tax_invoice(student, '2025/0002', date(2025, 2, 10), curso='C'),
+            make_tax_invoice(student, '2025/0003', date(2025, 3, 10)),
+        ]
+        make_tax_invoice(student, '2025/0004', date(2025, 4, 10))
+
+        response = self.client.get(reverse('tax_invoice_export_zip'), {'year': 2025, 'quarter': 1})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('facturas_2025_T1.zip', response['Content-Disposition'])
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(sorted(archive.namelist()), [tax_invoice_filename(invoice) for invoice in invoices])
+            for name in archive.namelist():
+                self.assertTrue(archive.read(name).startswith(b'%PDF'))
+
+        response = self.client.get(reverse('tax_invoice_export_zip'), {'year': 2025, 'quarter': 1, 'curso': 'C'})
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['fra 0002.pdf'])
+
+    def test_workers_follow_affinity_and_cap(self):
+        with mock.patch('os.sched_getaffinity', return_value=set(range(64)), create=True):
+            self.assertEqual(default_workers(), 4)
+            with override_settings(TAX_INVOICE_EXPORT_MAX_WORKERS=2):
+                self.assertEqual(default_workers(), 2)
+        with mock.patch('os.sched_getaffinity', return_value={0}, create=True):
+            self.assertEqual(default_workers(), 1)
+
+
+class PdfResourcesTests(TestCase):
+    """Logo compartido de las facturas trimestrales (students/pdf_resources.py)"""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.logo_path = os.path.join(tmp_dir.name, 'logo.png')
+        self.logo = Image.new('RGB', (40, 30), (200, 30, 60))
+        self.logo.putpixel((3, 4), (1, 2, 3))
+        self.logo.save(self.logo_path)
+        patcher = mock.patch.object(pdf_resources, 'LOGO_PATH', self.logo_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pdf_resources.reset()
+        self.addCleanup(pdf_resources.reset)
+
+    def test_logo_is_read_once_without_changes(self):
+        reader = pdf_resources.logo_image()
+        self.assertIs(pdf_resources.logo_image(), reader)
+        self.assertEqual(reader.getSize(), (40, 30))
+        self.assertEqual(bytes(reader.getRGBData()), self.logo.tobytes())
+
+        tax_invoice = make_tax_invoice(make_student('12345678Z'), '2025/0001', date(2025, 1, 10))
+        for _ in range(2):
+            self.assertTrue(render_tax_invoice_pdf(tax_invoice).startswith(b'%PDF'))
+        self.assertIs(pdf_resources.logo_image(), reader)
+
+    def test_new_logo_is_reloaded(self):
+        reader = pdf_resources.logo_image()
+        self.logo.resize((80, 60)).save(self.logo_path)
+        os.utime(self.logo_path, (0, 0))
+        self.assertIsNot(pdf_resources.logo_image(), reader)
+        self.assertEqual(pdf_resources.logo_image().getSize(), (80, 60))
+
+
+class PdfResponseTests(TestCase):
+    """Descarga de PDF con ETag y 304 (invoice_pdf.pdf_response)"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+        self.tax_invoice = make_tax_invoice(make_student('12345678Z'), '2025/0001', date(2025, 1, 10))
+        patcher = mock.patch('students.invoice_pdf.render_tax_invoice_pdf', return_value=b'%PDF-prueba')
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def download(self, **headers):
+        return self.client.get(reverse('tax_invoice_pdf', args=[self.tax_invoice.pk]), headers=headers)
+
+    def test_etag_and_not_modified(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'%PDF-prueba')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="fra 0001.pdf"')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"') and len(etag) > 2)
+
+        response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # Otra versión en el navegador: PDF completo, desde la caché
+        response = self.download(if_none_match='"otra"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_etag_changes_with_invoice(self):
+        etag = self.download()['ETag']
+        self.tax_invoice.client_street = 'Calle Nueva 1'
+        self.tax_invoice.save()
+
+        response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.render.call_count, 2)
+
+
+class PrintRunTests(TestCase):
+    """Tiradas de impresión: un solo PDF con una página por factura (print_run_response)"""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        logo_path = os.path.join(tmp_dir.name, 'logo.png')
+        Image.new('RGB', (40, 30), (200, 30, 60)).save(logo_path)
+        patcher = mock.patch.object(pdf_resources, 'LOGO_PATH', logo_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pdf_resources.reset()
+        self.addCleanup(pdf_resources.reset)
+
+        self.client.force_login(User.objects.create_user('admin', password='x'))
+        self.student = make_student('12345678Z')
+
+    def pages(self, pdf):
+        return len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+
+    def download(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def test_tax_invoice_run_shares_logo(self):
+        for number in range(1, 4):
+            make_tax_invoice(self.student, f'2025/{number:04d}', date(2025, 1, number))
+        make_tax_invoice(self.student, '2024/0001', date(2024, 12, 1))
+
+        response = self.client.get(reverse('tax_invoice_print'), {'year': '2025'})
+        pdf = self.download(response)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.pages(pdf), 3)
+        # El logo se incrusta una sola vez y todas las páginas reutilizan el formulario
+        self.assertEqual(pdf.count(b'/Subtype /Image'), 1)
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 1)
+
+        # El PDF de una sola factura reutiliza el mismo logo leído (clave: logo_signature)
+        reader = pdf_resources.logo_image()
+        single = render_tax_invoice_pdf(TaxInvoice.objects.get(invoice_number='2025/0001'))
+        self.assertEqual((self.pages(single), single.count(b'/Subtype /Image')), (1, 1))
+        self.assertIs(pdf_resources.logo_image(), reader)
+        self.assertEqual(pdf_resources._load_logo.cache_info().misses, 1)
+
+    def test_card_invoice_run(self):
+        for day in (3, 1, 2):
+            payment = Payment.objects.create(
+                student=self.student, amount=Decimal('121.00'), payment_method='CARD',
+                date_paid=timezone.make_aware(datetime(2025, 2, day, 10))
+            )
+            Invoice.create_from_payment(payment)
+
+        year = str(timezone.localdate().year)
+        pdf = self.download(self.client.get(reverse('invoice_print'), {'year': year}))
+        self.assertEqual(self.pages(pdf), 3)
+
+    def test_empty_run_redirects(self):
+        response = self.client.get(reverse('tax_invoice_print'), {'year': '2025'})
+        self.assertRedirects(response, reverse('tax_invoice_list'))
+        response = self.client.get(reverse('invoice_print'), {'year': '2025', 'quarter': '5'})
+        self.assertRedirects(response, reverse('tax_invoice_list'))
+
+
+class ImportTrimestreTests(TestCase):
+
+
+    """Diario, --resume y --update de import_trimestre"""
+    HEADER = ['CURSO', 'N FACTURA', 'FECHA', 'NOMBRE Y APELLIDOS', 'DNI', 'BASE IMPONIBLE', 'IVA', 'TASAS',
+              'TOTAL', 'DIRECCION', 'CP', 'MUNICIPIO', 'PROVINCIA']
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def row(self, number, fecha=datetime(2025, 2, 3), total=121):
+        """Fila del Excel para la factura 2025/<number> de un alumno propio"""
+        base = round(total / 1.21, 2)
+        return [
+            'B', f'2025/{number:04d}', fecha, f'PEREZ GOMEZ ALUMNO{number}', f'{number:08d}X',
+            base, round(total - base, 2), 0, total, 'C/ Mayor 1', '46000', 'VALENCIA', 'VALENCIA'
+        ]
+
+    def write_workbook(self, rows, name='Trimestre-1.xlsx'):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(self.HEADER)
+        for row in rows:
+            sheet.append(row)
+        path = os.path.join(self.tmp_dir, name)
+        workbook.save(path)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_trimestre', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_reimport_is_noop(self):
+        path = self.write_workbook([self.row(number) for number in range(1, 4)])
+        out = self.run_import(path)
+        self.assertIn('Facturas creadas: 3', out)
+
+        self.assertIn('Nada que importar', self.run_import(path))
+        # El mismo contenido con otro nombre tampoco se vuelve a importar
+        renamed = os.path.join(self.tmp_dir, 'copia.xlsx')
+        os.replace(path, renamed)
+        self.assertIn('Nada que importar', self.run_import(renamed))
+
+        self.assertEqual(TaxInvoice.objects.count(), 3)
+        self.assertEqual(Payment.objects.count(), 3)
+        self.assertEqual(Student.objects.count(), 3)
+        trimestre_import = TrimestreImport.objects.get()
+        self.assertEqual(trimestre_import.row_count, 3)
+        self.assertIsNotNone(trimestre_import.completed_at)
+
+    def test_changed_rows_are_reported_not_applied(self):
+        self.run_import(self.write_workbook([self.row(1), self.row(2)]))
+        out = self.run_import(self.write_workbook([self.row(1), self.row(2, total=242), self.row(3)]))
+        self.assertIn('Facturas creadas: 1', out)
+        self.assertIn('Filas ya importadas (sin cambios): 1', out)
+        self.assertIn('Factura 2025/0002 cambiada', out)
+        self.assertIn('Filas cambiadas sin actualizar: 1 (usar --update', out)
+        self.assertEqual(TaxInvoice.objects.get(invoice_number='2025/0002').total, Decimal('121.00'))
+        # Con cambios sin aplicar el fichero no queda como importado
+        self.assertIsNone(TrimestreImport.objects.latest('pk').completed_at)
+
+    def test_update_moves_invoice_across_quarters(self):
+        self.run_import(self.write_workbook([self.row(1), self.row(2)]))
+        self.assertEqual(TaxInvoiceSummary.objects.get(year=2025, quarter=1, curso='B').invoice_count, 2)
+
+        path = self.write_workbook([self.row(1), self.row(2, fecha=datetime(2025, 5, 6), total=242)])
+        out = self.run_import(path, '--update')
+        self.assertIn('Filas cambiadas actualizadas: 1', out)
+        self.assertNotIn('sin actualizar', out)
+
+        tax_invoice = TaxInvoice.objects.get(invoice_number='2025/0002')
+        self.assertEqual((tax_invoice.quarter, tax_invoice.total), (2, Decimal('242.00')))
+        self.assertEqual(tax_invoice.payments.get().amount, Decimal('242.00'))
+        self.assertEqual(TaxInvoiceSummary.objects.get(year=2025, quarter=1, curso='B').invoice_count, 1)
+        summary = TaxInvoiceSummary.objects.get(year=2025, quarter=2, curso='B')
+        self.assertEqual((summary.invoice_count, summary.total), (1, Decimal('242.00')))
+        self.assertEqual(StudentBalance.objects.get(student=tax_invoice.student).total_paid, Decimal('242.00'))
+        self.assertIsNotNone(TrimestreImport.objects.latest('pk').completed_at)
+        self.assertEqual(TaxInvoice.objects.count(), 2)
+
+    def test_resume_after_interrupted_batch(self):
+        path = self.write_workbook([self.row(number) for number in range(1, 7)])
+        save = TrimestreWriter.save
+        calls = []
+
+        def interrupted_save(writer, pending):
+            calls.append(pending)
+            if len(calls) == 2:
+                raise RuntimeError('importacion interrumpida')
+            return save(writer, pending)
+
+        with mock.patch.object(TrimestreWriter, 'save', interrupted_save):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, '--batch-size', '2')
+
+        # El primer lote queda guardado con su punto de control (fila 1 = cabecera)
+        trimestre_import = TrimestreImport.objects.get()
+        self.assertEqual(trimestre_import.last_row, 3)
+        self.assertIsNone(trimestre_import.completed_at)
+        self.assertEqual(TaxInvoice.objects.count(), 2)
+        self.assertEqual(TrimestreImportRow.objects.count(), 2)
+
+        out = self.run_import(path, '--resume', '--batch-size', '2')
+        self.assertIn('reanudando despues de la fila 3', out)
+        self.assertIn('Facturas creadas: 4', out)
+        self.assertNotIn('ya importadas', out)
+        self.assertEqual(TaxInvoice.objects.count(), 6)
+        self.assertEqual(Payment.objects.count(), 6)
+        self.assertEqual(TaxInvoiceSummary.objects.get(year=2025, quarter=1, curso='B').invoice_count, 6)
+        trimestre_import.refresh_from_db()
+        self.assertEqual(trimestre_import.row_count, 6)
+        self.assertIsNotNone(trimestre_import.completed_at)
+        self.assertIn('Nada que importar', self.run_import(path, '--resume'))
+
+    def test_multiple_files_in_one_run(self):
+        # Números intercalados entre ficheros: se escriben juntos por número de factura
+        self.write_workbook([self.row(number) for number in (1, 3, 5)], name='Trimestre-1.xlsx')
+        self.write_workbook([self.row(number) for number in (2, 4, 6)], name='Trimestre-2.xlsx')
+        out = self.run_import(self.tmp_dir, '--workers', '2', '--batch-size', '2')
+        self.assertIn('Leyendo 2 ficheros', out)
+        self.assertIn('Trimestre-1.xlsx: 3 filas, 3 alumnos nuevos, 3 pagos, 3 facturas', out)
+        self.assertIn('Trimestre-2.xlsx: 3 filas, 3 alumnos nuevos, 3 pagos, 3 facturas', out)
+        self.assertIn('Facturas creadas: 6', out)
+        self.assertEqual(
+            list(TaxInvoice.objects.order_by('pk').values_list('invoice_number', flat=True)),
+            [f'2025/{number:04d}' for number in range(1, 7)]
+        )
+        self.assertEqual(TrimestreImport.objects.filter(completed_at__isnull=False).count(), 2)
+        self.assertEqual(InvoiceSequence.peek(InvoiceSequence.SERIES_TAX_INVOICE, 2025), 7)
+        self.assertIn('Nada que importar', self.run_import(self.tmp_dir, '--workers', '2'))
+
+    def test_resume_with_workers(self):
+        self.write_workbook([self.row(number) for number in (1, 3, 5, 7)], name='Trimestre-1.xlsx')
+        self.write_workbook([self.row(number) for number in (2, 4, 6)], name='Trimestre-2.xlsx')
+        save = TrimestreWriter.save
+        calls = []
+
+        def interrupted_save(writer, pending):
+            calls.append(pending)
+            if len(calls) == 2:
+                raise RuntimeError('importacion interrumpida')
+            return save(writer, pending)
+
+        with mock.patch.object(TrimestreWriter, 'save', interrupted_save):
+            with self.assertRaises(RuntimeError):
+                self.run_import(self.tmp_dir, '--workers', '2', '--batch-size', '2')
+
+        # El primer lote (2025/0001 y 2025/0002) deja un punto de control en cada fichero
+        self.assertEqual(sorted(TrimestreImport.objects.values_list('file_name', 'last_row')), [
+            ('Trimestre-1.xlsx', 2), ('Trimestre-2.xlsx', 2)
+        ])
+        self.assertEqual(TaxInvoice.objects.count(), 2)
+
+        out = self.run_import(self.tmp_dir, '--resume', '--workers', '2', '--batch-size', '2')
+        self.assertIn('Trimestre-1.xlsx: reanudando despues de la fila 2', out)
+        self.assertIn('Trimestre-2.xlsx: reanudando despues de la fila 2', out)
+        self.assertIn('Facturas creadas: 5', out)
+        self.assertIn('Trimestre-1.xlsx: 3 filas, 3 alumnos nuevos, 3 pagos, 3 facturas, 0 duplicados', out)
+        self.assertIn('Trimestre-2.xlsx: 2 filas, 2 alumnos nuevos, 2 pagos, 2 facturas, 0 duplicados', out)
+        self.assertEqual(
+            sorted(TaxInvoice.objects.values_list('invoice_number', flat=True)),
+            [f'2025/{number:04d}' for number in range(1, 8)]
+        )
+        self.assertEqual(Payment.objects.count(), 7)
+        self.assertEqual(TrimestreImportRow.objects.count(), 7)
+        self.assertEqual(TrimestreImport.objects.filter(completed_at__isnull=False).count(), 2)
+
+    def test_export_import_round_trip(self):
+        """Lo exportado con export_trimestre (.xlsx o .csv) se vuelve a importar con las mismas filas"""
+        rows = [self.row(number) for number in range(1, 5)]
+        rows[1][3] = 'GARCIA LOPEZ MARIA JOSE'
+        rows[2][0], rows[2][5:9] = 'C', [Decimal('105.95'), 0, Decimal('94.05'), Decimal('200.00')]
+        rows[3][2] = datetime(2025, 4, 1)  # Otro trimestre: no se exporta
+        self.run_import(self.write_workbook(rows))
+        quarter = TaxInvoice.objects.filter(year=2025, quarter=1)
+        exported = list(trimestre_rows(quarter))
+        self.assertEqual(len(exported), 3)
+
+        for extension in ('xlsx', 'csv'):
+            with self.subTest(extension=extension):
+                path = os.path.join(self.tmp_dir, f'Trimestre-1-2025.{extension}')
+                call_command('export_trimestre', '--year', '2025', '--quarter', '1', '--output', path, stdout=StringIO())
+                TaxInvoice.objects.all().delete()
+                Student.objects.all().delete()
+                TrimestreImport.objects.all().delete()
+
+                out = self.run_import(path)
+                self.assertIn('Facturas creadas: 3', out)
+                self.assertEqual(list(trimestre_rows(quarter)), exported)
 
-# Create your tests here.
@@ -0,0 +1,63 @@
+"""
+Exportación de facturas trimestrales con las columnas de Trimestre-X.xlsx,
+el formato que lee import_trimestre:
+
+    A: CURSO, B: N FACTURA, C: FECHA, D: NOMBRE Y APELLIDOS, E: DNI,
+    F: BASE IMPONIBLE, G: IVA, H: TASAS, I: TOTAL,
+    J: DIRECCION, K: CP, L: MUNICIPIO, M: PROVINCIA
+
+El nombre es el de la factura emitida (client_name, NOMBRE APELLIDOS), no
+el del alumno actual, escrito como APELLIDOS NOMBRE (el orden que espera
+import_trimestre al separar el nombre completo, ver surname_first). Las filas se leen con
+QuerySet.iterator(): la memoria no crece con el número de facturas.
+
+Uso:
+    rows = trimestre_rows(TaxInvoice.objects.filter(year=2025, quarter=1))
+    write_xlsx('Trimestre-1.xlsx', 'Trimestre', TRIMESTRE_HEADER, rows)
+"""
+
+TRIMESTRE_HEADER = [
+    'CURSO', 'N FACTURA', 'FECHA', 'NOMBRE Y APELLIDOS', 'DNI',
+    'BASE IMPONIBLE', 'IVA', 'TASAS', 'TOTAL',
+    'DIRECCION', 'CP', 'MUNICIPIO', 'PROVINCIA',
+]
+
+# Facturas por lote de lectura
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def surname_first(client_name):
+    """
+    client_name (NOMBRE APELLIDO1 APELLIDO2) como APELLIDO1 APELLIDO2 NOMBRE.
+    Inversa de parse_name de trimestre_import: al reimportar, nombre y
+    apellidos vuelven a formar el mismo client_name.
+    """
+    parts = (client_name or '').split()
+    # parse_name toma un solo apellido si hay dos palabras, y dos si hay más
+    surnames = 1 if len(parts) == 2 else 2
+    return ' '.join(parts[-surnames:] + parts[:-surnames])
+
+
+def trimestre_rows(invoices):
+    """Filas (listas de valores) de invoices en el orden de TRIMESTRE_HEADER, por número de factura"""
+    rows = invoices.order_by('year', 'invoice_number').values_list(
+        'curso', 'invoice_number', 'fecha', 'client_name', 'client_dni',
+        'base_imponible', 'iva_amount', 'tasas_amount', 'total',
+        'client_street', 'client_postal_code', 'client_municipality', 'client_province'
+    )
+    for (curso, invoice_number, fecha, client_name, dni, base, iva, tasas, total,
+         street, postal_code, municipality, province) in rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [
+            curso, invoice_number, fecha, surname_first(client_name), dni,
+            base, iva, tasas, total,
+            street, postal_code, municipality, province,
+        ]
+
+
+def trimestre_filename(year=None, quarter=None):
+    """Nombre del fichero sin extensión: Trimestre-1-2025 / facturas_trimestrales_2025"""
+    if year and quarter:
+        return f'Trimestre-{quarter}-{year}'
+    if year:
+        return f'facturas_trimestrales_{year}'
+    return 'facturas_trimestrales'
@@ -0,0 +1,449 @@
+"""
+Lectura de los Excel Trimestre-X.xlsx (o su CSV) para import_trimestre.
+
+La importación es una cadena de generadores: la memoria no crece con el
+tamaño del fichero.
+
+1. read_rows(): lee las filas del libro en modo read_only con
+   iter_rows(values_only=True), en una sola pasada por el XML de la hoja
+   (ws.cell() en modo read_only vuelve a recorrer la hoja en cada llamada).
+   Un .csv se lee con read_csv_rows(), con el formato que escribe
+   spreadsheets.iter_csv (UTF-8 con BOM, punto decimal, fechas AAAA-MM-DD):
+   lo exportado con export_trimestre en .xlsx o .csv se puede volver a importar
+2. parse_rows(): normaliza cada fila (DNI, nombre, importes, fecha, curso)
+   en un ImportRow
+3. batched(): agrupa las filas en lotes de BATCH_SIZE
+4. TrimestreWriter.write_batch(): escribe cada lote (ver trimestre_writer.py)
+
+Varios ficheros (un directorio o un patrón glob, ver expand_paths): cada
+libro se lee en un proceso de un pool (parse_files) y las filas de todos se
+mezclan por número de factura (merge_rows) hacia un único escritor, que
+unifica los alumnos por DNI normalizado entre ficheros.
+
+Cada fichero es un SourceFile con el hash SHA-256 de su contenido: el
+diario de importación (TrimestreImport / TrimestreImportRow) lo usa para
+saltarse los ficheros ya importados y, con row_fingerprint(), las filas ya
+importadas o cambiadas desde entonces.
+
+Este módulo no importa los modelos al cargarse: los procesos del pool solo
+leen y normalizan filas, sin Django ni base de datos.
+
+Columnas: las de TRIMESTRE_HEADER (ver trimestre_export.py).
+
+Uso:
+    writer = TrimestreWriter()
+    for batch in batched(parse_rows(read_rows(path), source_file(path)), BATCH_SIZE):
+        writer.write_batch(batch)
+    writer.finish()
+"""
+import csv
+import glob
+import hashlib
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from multiprocessing import get_context
+from pathlib import Path
+from typing import NamedTuple
+
+from .trimestre_export import TRIMESTRE_HEADER
+
+# Filas por lote de escritura (y objetos por INSERT en bulk_create)
+BATCH_SIZE = 500
+
+# Tasas DGT (para deducir qué tasas lleva una factura a partir de su importe)
+TASA_BASICA = Decimal('94.05')
+TASA_A = Decimal('28.87')
+TRASLADO = Decimal('8.67')
+
+# Curso del Excel -> tipo de carnet / curso de TaxInvoice
+CURSO_MAPPING = {
+    'AM': 'AM',
+    'A1': 'A1',
+    'A2': 'A2',
+    'A': 'A',
+    'B': 'B',
+    'C': 'C',
+    'C+E': 'C+E',
+    'CE': 'C+E',
+}
+
+# Formatos de fecha aceptados cuando la celda es texto
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%y')
+
+# Extensiones de los ficheros que se importan
+IMPORT_SUFFIXES = ('.xlsx', '.csv')
+
+# Nombre de hoja de las filas de un CSV (TrimestreImport.sheet)
+CSV_SHEET = 'CSV'
+
+# Bytes por lectura al calcular el hash de un fichero
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Segundos mínimos entre dos líneas de progreso
+PROGRESS_INTERVAL = 5
+
+
+class SourceFile(NamedTuple):
+    """Libro del que vienen las filas (str() es el nombre del fichero)"""
+    path: str
+    name: str
+    content_hash: str
+
+    def __str__(self):
+        return self.name
+
+
+class ImportRow(NamedTuple):
+    """Fila del Excel ya normalizada"""
+    source: SourceFile
+    sheet: str
+    row_num: int
+    curso: str
+    invoice_number: str
+    fecha: datetime
+    first_name: str
+    last_name: str
+    dni: str
+    base_imponible: Decimal
+    iva_amount: Decimal
+    tasas_amount: Decimal
+    total: Decimal
+    street: str
+    postal_code: str
+    municipality: str
+    province: str
+
+
+def normalize_dni(dni):
+    """Normaliza el DNI para comparacion."""
+    if not dni:
+        return ''
+    return str(dni).upper().replace(' ', '').replace('-', '').strip()
+
+
+def parse_name(full_name):
+    """Separa nombre completo (APELLIDOS NOMBRE) en nombre y apellidos."""
+    if not full_name:
+        return '', ''
+
+    parts = str(full_name).strip().split()
+
+    if len(parts) == 0:
+        return '', ''
+    elif len(parts) == 1:
+        return parts[0], ''
+    elif len(parts) == 2:
+        # En España es más común APELLIDO NOMBRE
+        return parts[1], parts[0]
+    elif len(parts) == 3:
+        # APELLIDO1 APELLIDO2 NOMBRE
+        return parts[2], f"{parts[0]} {parts[1]}"
+    # APELLIDO1 APELLIDO2 NOMBRE1 NOMBRE2...
+    return ' '.join(parts[2:]), f"{parts[0]} {parts[1]}"
+
+
+def parse_amount(value):
+    """Convierte valor a Decimal (0.00 si está vacío o no es un importe)."""
+    if value is None:
+        return Decimal('0.00')
+
+    try:
+        if isinstance(value, (int, float, Decimal)):
+            return Decimal(str(value)).quantize(Decimal('0.01'))
+
+        value_str = str(value).strip().replace('€', '').replace(' ', '')
+        # Manejar formato español (1.234,56) vs inglés (1,234.56)
+        if ',' in value_str and '.' in value_str:
+            value_str = value_str.replace('.', '').replace(',', '.')
+        elif ',' in value_str:
+            # Solo coma: 1234,56 (español) si hay como mucho 2 decimales, si no 1,234 (miles)
+            parts = value_str.split(',')
+            if len(parts) == 2 and len(parts[1]) <= 2:
+                value_str = value_str.replace(',', '.')
+            else:
+                value_str = value_str.replace(',', '')
+
+        return Decimal(value_str).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+
+
+def parse_date(value):
+    """Convierte valor a datetime (None si no es una fecha)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if hasattr(value, 'year') and hasattr(value, 'month') and hasattr(value, 'day'):
+        return datetime(value.year, value.month, value.day)
+
+    value_str = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def license_name_for(curso):
+    """Nombre del tipo de carnet para un curso del Excel (B por defecto)."""
+    if not curso:
+        return 'B'
+    curso = str(curso).upper().strip()
+    return CURSO_MAPPING.get(curso, curso)
+
+
+def curso_code(curso):
+    """Código de curso de TaxInvoice para un curso del Excel (B si no se reconoce)."""
+    if not curso:
+        return 'B'
+    return CURSO_MAPPING.get(str(curso).upper().strip(), 'B')
+
+
+def detect_tasas(tasas_amount):
+    """
+    Detecta qué tasas están incluidas a partir del importe total de tasas.
+    Retorna (has_tasa_basica, has_tasa_a, has_traslado, renovaciones).
+    La renovación cuesta lo mismo que la tasa básica.
+    """
+    if tasas_amount <= 0:
+        return False, False, False, 0
+
+    has_tasa_basica = False
+    has_tasa_a = False
+    has_traslado = False
+    renovaciones = 0
+    remaining = tasas_amount
+
+    # Tasa A (motos) si el resto es múltiplo de la tasa básica
+    if remaining >= TASA_A and (remaining - TASA_A) % TASA_BASICA == 0:
+        has_tasa_a = True
+        remaining -= TASA_A
+
+    # Traslado, igual
+    if remaining >= TRASLADO and (remaining - TRASLADO) % TASA_BASICA == 0:
+        has_traslado = True
+        remaining -= TRASLADO
+
+    # El resto son tasas básicas / renovaciones
+    if remaining > 0:
+        num_basicas = int(remaining / TASA_BASICA)
+        if num_basicas > 0 and remaining == num_basicas * TASA_BASICA:
+            has_tasa_basica = True
+            renovaciones = num_basicas - 1
+
+    # Si no se reconoce nada pero hay tasas, asumir tasa básica (+ renovaciones)
+    if not has_tasa_basica and not has_tasa_a and not has_traslado:
+        if abs(tasas_amount - TASA_BASICA) < Decimal('1.00'):
+            has_tasa_basica = True
+        elif tasas_amount > TASA_BASICA:
+            has_tasa_basica = True
+            renovaciones = max(0, int((tasas_amount - TASA_BASICA) / TASA_BASICA))
+
+    return has_tasa_basica, has_tasa_a, has_traslado, renovaciones
+
+
+def _text(value):
+    return str(value).strip() if value else ''
+
+
+def file_hash(path):
+    """Hash SHA-256 (hexadecimal) del contenido de un fichero"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_file(path):
+    """SourceFile de un libro"""
+    path = Path(path)
+    return SourceFile(str(path), path.name, file_hash(path))
+
+
+class ImportProgress:
+    """
+    Progreso de una importación: filas procesadas, velocidad (filas/s) y
+    tiempo restante estimado (si se conoce el total).
+
+    report(mensaje) recibe una línea cada PROGRESS_INTERVAL segundos como
+    mucho, y la última con finish(). done es el número de filas ya hechas al
+    empezar (al reanudar una importación): no cuentan para la velocidad.
+    """
+
+    def __init__(self, report, total=None, done=0, interval=PROGRESS_INTERVAL):
+        self.report = report
+        self.total = total
+        self.done = done
+        self.start_done = done
+        self.interval = interval
+        self.started = self.reported = time.monotonic()
+
+    def advance(self, rows):
+        """Suma rows filas procesadas"""
+        self.done += rows
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report(self.message(now))
+
+    def finish(self):
+        self.report(self.message(time.monotonic()))
+
+    def message(self, now):
+        elapsed = now - self.started
+        rate = (self.done - self.start_done) / elapsed if elapsed > 0 else 0
+        message = f'Progreso: {self.done}'
+        if self.total:
+            message += f'/{self.total} filas ({min(self.done * 100 // self.total, 100)}%)'
+        else:
+            message += ' filas'
+        message += f' - {rate:.0f} filas/s - {timedelta(seconds=round(elapsed))} transcurrido'
+        if self.total and rate and self.done < self.total:
+            message += f', quedan {timedelta(seconds=round((self.total - self.done) / rate))}'
+        return message
+
+
+def read_rows(path, progress=None):
+    """
+    Genera (hoja, número de fila, valores) de la hoja activa, desde la fila 2.
+    progress (ImportProgress) recibe el total de filas al abrir el libro, si
+    el libro lo indica. Los .csv se leen con read_csv_rows().
+    """
+    if Path(path).suffix.lower() == '.csv':
+        yield from read_csv_rows(path)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        if progress is not None and sheet.max_row:
+            progress.total = sheet.max_row - 1
+        rows = sheet.iter_rows(min_row=2, max_col=len(TRIMESTRE_HEADER), values_only=True)
+        for row_num, values in enumerate(rows, start=2):
+            yield sheet.title, row_num, values
+    finally:
+        workbook.close()
+
+
+def read_csv_rows(path):
+    """
+    Genera (hoja, número de fila, valores) de un CSV con cabecera, como
+    read_rows(). Las celdas vacías son None, igual que en el libro.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for row_num, values in enumerate(reader, start=2):
+            yield CSV_SHEET, row_num, [value or None for value in values[:len(TRIMESTRE_HEADER)]]
+
+
+def parse_row(row_num, values, source=None, sheet=''):
+    """ImportRow de los valores de una fila"""
+    values = tuple(values) + (None,) * (len(TRIMESTRE_HEADER) - len(values))
+    (curso, n_factura, fecha, nombre_completo, dni, base_imponible, iva, tasas, total,
+     direccion, cp, municipio, provincia) = values[:len(TRIMESTRE_HEADER)]
+
+    first_name, last_name = parse_name(nombre_completo)
+    return ImportRow(
+        source=source,
+        sheet=sheet,
+        row_num=row_num,
+        curso=curso,
+        invoice_number=_text(n_factura),
+        fecha=parse_date(fecha),
+        first_name=first_name,
+        last_name=last_name,
+        dni=normalize_dni(dni),
+        base_imponible=parse_amount(base_imponible),
+        iva_amount=parse_amount(iva),
+        tasas_amount=parse_amount(tasas),
+        total=parse_amount(total),
+        street=_text(direccion),
+        postal_code=_text(cp),
+        municipality=_text(municipio),
+        province=_text(provincia),
+    )
+
+
+def parse_rows(rows, source=None):
+    """ImportRow de cada (hoja, número de fila, valores) de rows"""
+    for sheet, row_num, values in rows:
+        yield parse_row(row_num, values, source, sheet)
+
+
+# Campos de ImportRow que identifican el contenido de una fila (no su posición)
+FINGERPRINT_FIELDS = tuple(field for field in ImportRow._fields if field not in ('source', 'sheet', 'row_num'))
+
+
+def row_fingerprint(row):
+    """Hash SHA-256 de los datos normalizados de una fila (sin fichero, hoja ni número de fila)"""
+    values = ('' if getattr(row, field) is None else str(getattr(row, field)) for field in FINGERPRINT_FIELDS)
+    return hashlib.sha256('\x1f'.join(values).encode()).hexdigest()
+
+
+def expand_paths(pattern):
+    """Libros a importar: un fichero, los .xlsx y .csv de un directorio o los de un patrón glob"""
+    path = Path(pattern)
+    if path.is_dir():
+        paths = (path for path in path.iterdir() if path.suffix.lower() in IMPORT_SUFFIXES)
+    elif any(char in pattern for char in '*?['):
+        paths = (Path(name) for name in glob.glob(pattern))
+    else:
+        return [path] if path.is_file() else []
+    # ~$*.xlsx son los ficheros de bloqueo que deja Excel con el libro abierto
+    return sorted(path for path in paths if path.is_file() and not path.name.startswith('~$'))
+
+
+def parse_file(source):
+    """Todas las filas (ImportRow) de un libro (SourceFile)"""
+    return list(parse_rows(read_rows(source.path), source))
+
+
+def parse_files(sources, workers=None):
+    """
+    Lee los libros de sources (SourceFile) en un pool de procesos (uno por
+    CPU). Produce (source, filas) según van terminando.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    if workers <= 1:
+        for source in sources:
+            yield source, parse_file(source)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+        futures = {executor.submit(parse_file, source): source for source in sources}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def import_order(row):
+    """Clave de orden de una fila: por número de factura; las filas sin número (o con otro formato) al final"""
+    from .models import TaxInvoice
+    number = TaxInvoice.parse_invoice_number(row.invoice_number) if row.invoice_number else None
+    return (number is None, number or (0, 0))
+
+
+def merge_rows(rows_by_file):
+    """Mezcla las filas de varios libros (listas en el orden de los ficheros) por número de factura"""
+    return heapq.merge(*(sorted(rows, key=import_order) for rows in rows_by_file), key=import_order)
+
+
+def batched(rows, size):
+    """Agrupa rows en listas de como mucho size elementos"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
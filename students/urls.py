@@ -28,15 +28,23 @@ urlpatterns = [
     path('panel/mantenimiento/<int:pk>/eliminar/', views.maintenance_delete, name='maintenance_delete'),
 
     # Gestión de prácticas (editar/eliminar para correcciones)
+    path('panel/practicas/nuevas/', views.practice_bulk_create, name='practice_bulk_create'),
+    path('panel/<int:student_pk>/practicas/nuevas/', views.practice_bulk_create, name='practice_bulk_create_for_student'),
     path('panel/practica/<int:pk>/editar/', views.practice_edit, name='practice_edit'),
     path('panel/practica/<int:pk>/eliminar/', views.practice_delete, name='practice_delete'),
 
     # Facturas (solo pagos con tarjeta)
     path('panel/pago/<int:payment_pk>/factura/', views.generate_invoice_pdf, name='generate_invoice'),
+    path('panel/facturas/imprimir/', views.invoice_print, name='invoice_print'),
 
     # Facturas trimestrales (Tax Invoices)
     path('panel/facturas-trimestrales/', views.tax_invoice_list, name='tax_invoice_list'),
+    path('panel/facturas-trimestrales/exportar/', views.tax_invoice_export, name='tax_invoice_export'),
+    path('panel/facturas-trimestrales/exportar-zip/', views.tax_invoice_export_zip, name='tax_invoice_export_zip'),
+    path('panel/facturas-trimestrales/imprimir/', views.tax_invoice_print, name='tax_invoice_print'),
+    path('panel/facturas-trimestrales/resumen-iva/', views.tax_summary, name='tax_summary'),
     path('panel/facturas-trimestrales/nueva/', views.tax_invoice_create, name='tax_invoice_create'),
+    path('panel/facturas-trimestrales/generar/', views.tax_invoice_batch, name='tax_invoice_batch'),
     path('panel/<int:student_pk>/factura-trimestral/nueva/', views.tax_invoice_create, name='tax_invoice_create_for_student'),
     path('panel/factura-trimestral/<int:pk>/', views.tax_invoice_detail, name='tax_invoice_detail'),
     path('panel/factura-trimestral/<int:pk>/pdf/', views.generate_tax_invoice_pdf, name='tax_invoice_pdf'),
@@ -5,7 +5,7 @@ Este archivo contiene 10 vistas principales:
 0. landing_page - Página principal pública (sin @login_required)
 1. user_login - Login (sin @login_required)
 2. user_logout - Logout
-3. student_list - Lista de alumnos con búsqueda por nombre/DNI/teléfono
+3. student_list - Lista de alumnos con búsqueda por nombre/DNI/teléfono (índice de tokens, ver search.py)
 4. student_create - Crear nuevo alumno
 5. student_detail - Detalle del alumno con resumen financiero completo
 6. student_edit - Editar alumno existente
@@ -21,9 +21,35 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from .models import Student, LicenseType, Voucher, Payment, AuditLog, Vehicle, Maintenance, Practice, Invoice, TaxInvoice
-from .forms import StudentForm, VoucherForm, PaymentForm, VehicleForm, MaintenanceForm, PracticeForm, TaxInvoiceForm
+from .forms import StudentForm, VoucherForm, PaymentForm, VehicleForm, MaintenanceForm, PracticeForm, TaxInvoiceForm, BulkPracticeFormSet
+from .pagination import keyset_paginate
+from .search import count_cache_key, search_students
+from .services import StudentSummary
+from .bonus import apply_practice_minutes, BONUS_DISCOUNT_AMOUNT
+from .practices import PracticeEntry, register_practices
+
+# Alumnos por página en el panel principal
+STUDENTS_PER_PAGE = 50
+
+# Segundos que se guarda en caché el total de alumnos de cada búsqueda
+# (la clave incluye una versión que cambia con cada alta/edición/borrado)
+STUDENT_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# Segundos que se guardan en caché los fragmentos de la ficha del alumno.
+# La clave incluye la versión del alumno, así que los cambios se ven al instante.
+STUDENT_DETAIL_CACHE_TIMEOUT = 60 * 60
+
+# Registros por página del historial de auditoría
+AUDIT_LOGS_PER_PAGE = 50
+
+# Segundos que se guarda en caché el total de registros del historial
+AUDIT_LOG_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# Facturas que se muestran en la vista previa de la facturación en bloque
+TAX_INVOICE_BATCH_PREVIEW_ROWS = 200
 
 
 def landing_page(request):
@@ -85,20 +111,43 @@ def user_logout(request):
 
 @login_required
 def student_list(request):
-    """Lista de alumnos con búsqueda"""
+    """Lista de alumnos con búsqueda, saldo anotado y paginación por cursor"""
+    from django.core.cache import cache
+    from django.db.models import F, Value, DecimalField
+    from django.db.models.functions import Coalesce, Greatest
+
     query = request.GET.get('q', '')
-    students = Student.objects.all()
+    money = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(0, output_field=money)
+    students = Student.objects.select_related('license_type').annotate(
+        total_debt=Coalesce(F('ledger__total_debt'), zero),
+        total_paid=Coalesce(F('ledger__total_paid'), zero),
+    ).annotate(
+        pending_amount=Greatest(F('total_debt') - F('total_paid'), zero, output_field=money)
+    )
 
     if query:
-        students = students.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(dni__icontains=query) |
-            Q(phone__icontains=query)
-        )
+        students = search_students(students, query)
+
+    page = keyset_paginate(
+        students,
+        'date_registered',
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=STUDENTS_PER_PAGE
+    )
+
+    # El COUNT recorre todo el resultado: se cachea por búsqueda
+    count_key = count_cache_key(query)
+    total_count = cache.get(count_key)
+    if total_count is None:
+        total_count = students.count()
+        cache.set(count_key, total_count, STUDENT_COUNT_CACHE_TIMEOUT)
 
     context = {
-        'students': students,
+        'students': page,
+        'page': page,
+        'total_count': total_count,
         'query': query,
     }
     return render(request, 'students/student_list.html', context)
@@ -134,37 +183,10 @@ def student_create(request):
 @login_required
 def student_detail(request, pk):
     """Detalle del alumno con información financiera"""
-    from django.db.models import Sum
-
-    student = get_object_or_404(Student, pk=pk)
-    vouchers = student.vouchers.all()
-    payments = student.payments.all()
-    practices = student.practices.all().order_by('-practice_date')
-
-    # Calcular minutos de prácticas (todas las facturadas individualmente)
-    practices_for_bonus = Practice.objects.filter(
-        student=student,
-        is_billed=True,
-        billed_voucher__concept_type__in=['PRACTICE_90', 'PRACTICE_60', 'PRACTICE_45', 'PRACTICE_30']
-    )
-    total_practice_minutes = practices_for_bonus.aggregate(total=Sum('duration'))['total'] or 0
-
-    # Calcular minutos restantes para el próximo descuento
-    minutes_for_bonus = 450 - (total_practice_minutes % 450) if total_practice_minutes > 0 else 450
-
-    context = {
-        'student': student,
-        'vouchers': vouchers,
-        'payments': payments,
-        'practices': practices,
-        'unbilled_minutes': total_practice_minutes % 450,  # Minutos hacia el próximo bono
-        'total_practice_minutes': total_practice_minutes,
-        'minutes_for_bonus': minutes_for_bonus,
-        'total_debt': student.get_total_debt(),
-        'total_paid': student.get_total_paid(),
-        'balance': student.get_balance(),
-        'pending_amount': student.get_pending_amount(),
-    }
+    student = get_object_or_404(StudentSummary.queryset(), pk=pk)
+    summary = StudentSummary(student)
+    context = summary.as_context()
+    context['cache_timeout'] = STUDENT_DETAIL_CACHE_TIMEOUT
     return render(request, 'students/student_detail.html', context)
 
 
@@ -224,18 +246,9 @@ def student_delete(request, pk):
 def voucher_create(request, student_pk):
     """Añadir cargo/concepto a un alumno"""
     import json
-    from decimal import Decimal
 
     student = get_object_or_404(Student, pk=student_pk)
 
-    # Mapeo de tipos de concepto a duración en minutos
-    PRACTICE_DURATION_MAP = {
-        'PRACTICE_90': 90,
-        'PRACTICE_60': 60,
-        'PRACTICE_45': 45,
-        'PRACTICE_30': 30,
-    }
-
     if request.method == 'POST':
         form = VoucherForm(request.POST)
         if form.is_valid():
@@ -243,74 +256,28 @@ def voucher_create(request, student_pk):
             practice_date = form.cleaned_data.get('practice_date')
 
             # Si es una práctica individual, crear el registro de práctica Y el cargo
-            if concept_type in PRACTICE_DURATION_MAP:
-                duration = PRACTICE_DURATION_MAP[concept_type]
+            if concept_type in Voucher.PRACTICE_DURATIONS:
+                duration = Voucher.PRACTICE_DURATIONS[concept_type]
                 practice_price = Voucher.CONCEPT_PRICES[concept_type]
 
-                # Crear el cargo de la práctica individual
-                voucher = Voucher.objects.create(
-                    student=student,
-                    concept_type=concept_type,
-                    amount=practice_price,
-                    description=f'Práctica {practice_date.strftime("%d/%m/%Y")}',
-                    created_by=request.user
-                )
-
-                # Crear la práctica asociada al cargo
-                practice = Practice.objects.create(
-                    student=student,
-                    duration=duration,
-                    practice_date=practice_date,
-                    notes=form.cleaned_data.get('description', ''),
-                    is_billed=True,  # Ya está facturada con el cargo individual
-                    billed_voucher=voucher,
-                    created_by=request.user
-                )
-
-                # Registrar en auditoría
-                AuditLog.log_action(
-                    user=request.user,
-                    action='CREATE',
-                    entity_type='VOUCHER',
-                    entity_id=voucher.id,
-                    entity_name=f'Práctica {duration}\' - {student}',
-                    description=f'Práctica de {duration} minutos ({practice_price}€) registrada para {student} (fecha: {practice_date})',
-                    request=request
-                )
-
-                # Verificar si hay suficientes minutos para aplicar descuento de bono (450 min)
-                # Contar minutos de prácticas del alumno que NO tienen descuento aplicado
-                from django.db.models import Sum
-
-                # Obtener todas las prácticas que cuentan para el bono (las individuales facturadas)
-                practices_for_bonus = Practice.objects.filter(
-                    student=student,
-                    is_billed=True,
-                    billed_voucher__concept_type__in=['PRACTICE_90', 'PRACTICE_60', 'PRACTICE_45', 'PRACTICE_30']
-                )
-                total_practice_minutes = practices_for_bonus.aggregate(total=Sum('duration'))['total'] or 0
-
-                # Calcular cuántos bonos completos hay (cada 450 minutos)
-                # Contar descuentos ya aplicados
-                discounts_applied = Voucher.objects.filter(
-                    student=student,
-                    concept_type='BONUS_DISCOUNT'
-                ).count()
-
-                bonuses_earned = total_practice_minutes // 450
-                bonuses_pending = bonuses_earned - discounts_applied
-
-                if bonuses_pending > 0:
-                    # Calcular el descuento: precio de 5 prácticas de 90' (5 x 65€ = 325€) - precio bono (300€) = 25€ de ahorro
-                    # Pero ahora cobramos cada práctica, así que el descuento es la diferencia
-                    # 5 prácticas de 90' = 325€, bono = 300€, descuento = 25€
-                    discount_amount = Decimal('25.00')  # Descuento por alcanzar el bono
+                with transaction.atomic():
+                    # Crear el cargo de la práctica individual
+                    voucher = Voucher.objects.create(
+                        student=student,
+                        concept_type=concept_type,
+                        amount=practice_price,
+                        description=f'Práctica {practice_date.strftime("%d/%m/%Y")}',
+                        created_by=request.user
+                    )
 
-                    discount_voucher = Voucher.objects.create(
+                    # Crear la práctica asociada al cargo
+                    Practice.objects.create(
                         student=student,
-                        concept_type='BONUS_DISCOUNT',
-                        amount=-discount_amount,  # Importe negativo = descuento
-                        description=f'Descuento por bono 450\' (prácticas acumuladas: {total_practice_minutes}\')',
+                        duration=duration,
+                        practice_date=practice_date,
+                        notes=form.cleaned_data.get('description', ''),
+                        is_billed=True,  # Ya está facturada con el cargo individual
+                        billed_voucher=voucher,
                         created_by=request.user
                     )
 
@@ -319,21 +286,24 @@ def voucher_create(request, student_pk):
                         user=request.user,
                         action='CREATE',
                         entity_type='VOUCHER',
-                        entity_id=discount_voucher.id,
-                        entity_name=f'Descuento Bono - {student}',
-                        description=f'Descuento de {discount_amount}€ aplicado por alcanzar 450 minutos de prácticas',
+                        entity_id=voucher.id,
+                        entity_name=f'Práctica {duration}\' - {student}',
+                        description=f'Práctica de {duration} minutos ({practice_price}€) registrada para {student} (fecha: {practice_date})',
                         request=request
                     )
 
+                    # Sumar los minutos al contador del alumno y aplicar descuento de bono (450 min) si corresponde
+                    bonus = apply_practice_minutes(student, duration, user=request.user, request=request)
+
+                if bonus.created:
                     messages.success(
                         request,
-                        f'Práctica de {duration}\' ({practice_price}€) registrada. ¡Has alcanzado {total_practice_minutes}\' y se ha aplicado un descuento de {discount_amount}€!'
+                        f'Práctica de {duration}\' ({practice_price}€) registrada. ¡Has alcanzado {bonus.total_minutes}\' y se ha aplicado un descuento de {BONUS_DISCOUNT_AMOUNT}€!'
                     )
                 else:
-                    minutes_for_next_bonus = 450 - (total_practice_minutes % 450)
                     messages.success(
                         request,
-                        f'Práctica de {duration}\' ({practice_price}€) registrada. Acumulados: {total_practice_minutes}\' (faltan {minutes_for_next_bonus}\' para el próximo descuento)'
+                        f'Práctica de {duration}\' ({practice_price}€) registrada. Acumulados: {bonus.total_minutes}\' (faltan {bonus.minutes_for_next_bonus}\' para el próximo descuento)'
                     )
 
                 return redirect('student_detail', pk=student.pk)
@@ -416,8 +386,13 @@ def payment_create(request, student_pk):
 
 @login_required
 def audit_log_list(request):
-    """Vista para mostrar el historial de logs de auditoría"""
-    logs = AuditLog.objects.all().order_by('-timestamp')
+    """Vista para mostrar el historial de logs de auditoría (paginación por cursor)"""
+    import hashlib
+    from urllib.parse import urlencode
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+
+    logs = AuditLog.objects.select_related('user')
 
     # Filtros opcionales
     action_filter = request.GET.get('action', '')
@@ -428,17 +403,37 @@ def audit_log_list(request):
         logs = logs.filter(action=action_filter)
     if entity_filter:
         logs = logs.filter(entity_type=entity_filter)
+    user_ids = []
     if user_filter:
-        logs = logs.filter(user__username__icontains=user_filter)
+        # Resolver primero los IDs (tabla pequeña) para usar el índice (user, -timestamp)
+        user_ids = sorted(User.objects.filter(username__icontains=user_filter).values_list('pk', flat=True))
+        logs = logs.filter(user_id__in=user_ids)
+
+    page = keyset_paginate(
+        logs,
+        'timestamp',
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=AUDIT_LOGS_PER_PAGE
+    )
 
-    # Paginación (mostrar 50 logs por página)
-    from django.core.paginator import Paginator
-    paginator = Paginator(logs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # El total se cachea unos minutos por combinación de filtros (la tabla solo crece)
+    filters_key = f"{action_filter}:{entity_filter}:{','.join(map(str, user_ids)) if user_filter else '*'}"
+    count_key = 'audit_log_count:' + hashlib.md5(filters_key.encode()).hexdigest()
+    total_count = cache.get(count_key)
+    if total_count is None:
+        total_count = logs.count()
+        cache.set(count_key, total_count, AUDIT_LOG_COUNT_CACHE_TIMEOUT)
+
+    filter_query = urlencode({
+        key: value for key, value in
+        (('action', action_filter), ('entity_type', entity_filter), ('user', user_filter)) if value
+    })
 
     context = {
-        'page_obj': page_obj,
+        'page_obj': page,
+        'total_count': total_count,
+        'filter_query': filter_query,
         'action_filter': action_filter,
         'entity_filter': entity_filter,
         'user_filter': user_filter,
@@ -505,6 +500,8 @@ def vehicle_list(request):
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('student_list')
 
+    from django.utils import timezone
+
     query = request.GET.get('q', '')
     vehicles = Vehicle.objects.all()
 
@@ -515,9 +512,15 @@ def vehicle_list(request):
             Q(model__icontains=query)
         )
 
+    # Último mantenimiento y costes anotados en la misma consulta
+    vehicles = list(Vehicle.with_maintenance_stats(vehicles))
+
     context = {
         'vehicles': vehicles,
         'query': query,
+        'fleet_cost_year': sum(v.maintenance_cost_year for v in vehicles),
+        'fleet_total_cost': sum(v.maintenance_total_cost for v in vehicles),
+        'current_year': timezone.localdate().year,
     }
     return render(request, 'students/vehicle_list.html', context)
 
@@ -550,12 +553,15 @@ def vehicle_detail(request, pk):
         messages.error(request, 'No tienes permisos para acceder a esta sección.')
         return redirect('student_list')
 
-    vehicle = get_object_or_404(Vehicle, pk=pk)
+    from django.utils import timezone
+
+    vehicle = get_object_or_404(Vehicle.with_maintenance_stats(), pk=pk)
     maintenances = vehicle.maintenances.all()
 
     context = {
         'vehicle': vehicle,
         'maintenances': maintenances,
+        'current_year': timezone.localdate().year,
     }
     return render(request, 'students/vehicle_detail.html', context)
 
@@ -670,6 +676,62 @@ def maintenance_delete(request, pk):
 
 # ==================== PRÁCTICAS ====================
 
+@login_required
+def practice_bulk_create(request, student_pk=None):
+    """
+    Registrar muchas prácticas de una vez (por ejemplo, el cierre del día).
+    Con student_pk todas las filas son de ese alumno; sin él cada fila elige alumno.
+    """
+    student = get_object_or_404(Student, pk=student_pk) if student_pk else None
+
+    form_kwargs = {}
+    if student is None:
+        form_kwargs['student_choices'] = [
+            (pk, f'{first_name} {last_name} ({dni})')
+            for pk, first_name, last_name, dni in Student.objects.filter(is_active=True)
+            .order_by('last_name', 'first_name').values_list('pk', 'first_name', 'last_name', 'dni')
+        ]
+
+    if request.method == 'POST':
+        formset = BulkPracticeFormSet(request.POST, form_kwargs=form_kwargs)
+        if formset.is_valid():
+            rows = [form.cleaned_data for form in formset if form.has_changed() and form.cleaned_data]
+            if student is None:
+                students = Student.objects.in_bulk({row['student'] for row in rows})
+            entries = [
+                PracticeEntry(
+                    student=student or students[row['student']],
+                    practice_date=row['practice_date'],
+                    duration=row['duration'],
+                    notes=row['notes']
+                )
+                for row in rows
+            ]
+
+            if not entries:
+                messages.error(request, 'No hay ninguna práctica para registrar')
+            else:
+                results = register_practices(entries, user=request.user, request=request)
+                discounts = sum(len(bonus.created) for bonus in results.values())
+                total_minutes = sum(entry.duration for entry in entries)
+
+                message = f'{len(entries)} prácticas registradas ({total_minutes}\') para {len(results)} alumnos'
+                if discounts:
+                    message += f'. Se han aplicado {discounts} descuentos de {BONUS_DISCOUNT_AMOUNT}€ por bono'
+                messages.success(request, message)
+
+                if student:
+                    return redirect('student_detail', pk=student.pk)
+                return redirect('student_list')
+    else:
+        formset = BulkPracticeFormSet(form_kwargs=form_kwargs)
+
+    return render(request, 'students/practice_bulk_form.html', {
+        'formset': formset,
+        'student': student,
+    })
+
+
 @login_required
 def practice_edit(request, pk):
     """Editar una práctica existente"""
@@ -682,25 +744,31 @@ def practice_edit(request, pk):
         return redirect('student_detail', pk=student.pk)
 
     if request.method == 'POST':
+        old_duration = practice.duration
         form = PracticeForm(request.POST, instance=practice)
         if form.is_valid():
-            old_duration = practice.duration
             new_duration = form.cleaned_data['duration']
 
-            # Si cambió la duración y tiene cargo individual, actualizar el cargo
-            if practice.billed_voucher and practice.billed_voucher.concept_type in ['PRACTICE_90', 'PRACTICE_60', 'PRACTICE_45', 'PRACTICE_30']:
-                # Determinar el nuevo tipo de concepto según la duración
-                duration_to_concept = {90: 'PRACTICE_90', 60: 'PRACTICE_60', 45: 'PRACTICE_45', 30: 'PRACTICE_30'}
-                new_concept = duration_to_concept.get(new_duration)
-
-                if new_concept:
-                    voucher = practice.billed_voucher
-                    voucher.concept_type = new_concept
-                    voucher.amount = Voucher.CONCEPT_PRICES[new_concept]
-                    voucher.description = f'Práctica {form.cleaned_data["practice_date"].strftime("%d/%m/%Y")}'
-                    voucher.save()
+            with transaction.atomic():
+                # Si tiene cargo individual, actualizar el cargo y el contador de minutos del bono
+                if practice.billed_voucher and practice.billed_voucher.concept_type in Voucher.PRACTICE_DURATIONS:
+                    # Determinar el nuevo tipo de concepto según la duración
+                    duration_to_concept = {minutes: concept for concept, minutes in Voucher.PRACTICE_DURATIONS.items()}
+                    new_concept = duration_to_concept.get(new_duration)
+
+                    if new_concept:
+                        voucher = practice.billed_voucher
+                        voucher.concept_type = new_concept
+                        voucher.amount = Voucher.CONCEPT_PRICES[new_concept]
+                        voucher.description = f'Práctica {form.cleaned_data["practice_date"].strftime("%d/%m/%Y")}'
+                        voucher.save()
+
+                    form.save()
+                    if new_duration != old_duration:
+                        apply_practice_minutes(student, new_duration - old_duration, user=request.user, request=request)
+                else:
+                    form.save()
 
-            form.save()
             messages.success(request, 'Práctica actualizada correctamente')
             return redirect('student_detail', pk=student.pk)
     else:
@@ -729,11 +797,15 @@ def practice_delete(request, pk):
         return redirect('student_detail', pk=student_pk)
 
     if request.method == 'POST':
-        # Si tiene cargo individual asociado, eliminarlo también
-        if practice.billed_voucher and practice.billed_voucher.concept_type in ['PRACTICE_90', 'PRACTICE_60', 'PRACTICE_45', 'PRACTICE_30']:
-            practice.billed_voucher.delete()
-
-        practice.delete()
+        with transaction.atomic():
+            # Si tiene cargo individual asociado, eliminarlo también y descontar sus minutos del bono
+            # (la práctica primero: así el borrado del cargo no vuelve a descontarlos en signals.py)
+            if practice.billed_voucher and practice.billed_voucher.concept_type in Voucher.PRACTICE_DURATIONS:
+                practice.delete()
+                practice.billed_voucher.delete()
+                apply_practice_minutes(practice.student, -practice.duration, user=request.user, request=request)
+            else:
+                practice.delete()
         messages.success(request, 'Práctica y cargo asociado eliminados correctamente')
         return redirect('student_detail', pk=student_pk)
 
@@ -745,14 +817,7 @@ def practice_delete(request, pk):
 @login_required
 def generate_invoice_pdf(request, payment_pk):
     """Genera y descarga la factura en PDF para un pago con tarjeta"""
-    from django.http import HttpResponse
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    import io
+    from .invoice_pdf import invoice_fingerprint, pdf_response, render_invoice_pdf
 
     payment = get_object_or_404(Payment, pk=payment_pk)
 
@@ -764,189 +829,88 @@ def generate_invoice_pdf(request, payment_pk):
     # Crear o recuperar la factura
     invoice = Invoice.create_from_payment(payment)
 
-    # Crear el PDF en memoria
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
+    # PDF desde caché (o 304 si el navegador ya lo tiene)
+    return pdf_response(
+        request,
+        invoice_fingerprint(invoice),
+        lambda: render_invoice_pdf(invoice),
+        filename=f'factura_{invoice.invoice_number}.pdf',
+        last_modified=invoice.date_issued
     )
 
-    # Estilos
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(
-        name='CompanyName',
-        fontSize=18,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#27ae60'),
-        alignment=TA_LEFT
-    ))
-    styles.add(ParagraphStyle(
-        name='InvoiceTitle',
-        fontSize=24,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#333333'),
-        alignment=TA_RIGHT
-    ))
-    styles.add(ParagraphStyle(
-        name='SectionTitle',
-        fontSize=12,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#27ae60'),
-        spaceAfter=6
-    ))
-    styles.add(ParagraphStyle(
-        name='Normal_Right',
-        fontSize=10,
-        alignment=TA_RIGHT
-    ))
-
-    elements = []
-
-    # ===== CABECERA =====
-    # Tabla con datos empresa a la izquierda y "FACTURA" a la derecha
-    header_data = [
-        [
-            Paragraph(f"<b>{Invoice.COMPANY_NAME}</b>", styles['CompanyName']),
-            Paragraph("FACTURA", styles['InvoiceTitle'])
-        ],
-        [
-            Paragraph(f"CIF: {Invoice.COMPANY_CIF}<br/>{Invoice.COMPANY_ADDRESS}<br/>{Invoice.COMPANY_CITY}<br/>Tel: {Invoice.COMPANY_PHONE}<br/>{Invoice.COMPANY_EMAIL}", styles['Normal']),
-            Paragraph(f"<b>Nº:</b> {invoice.invoice_number}<br/><b>Fecha:</b> {invoice.date_issued.strftime('%d/%m/%Y')}", styles['Normal_Right'])
-        ]
-    ]
-
-    header_table = Table(header_data, colWidths=[10*cm, 7*cm])
-    header_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 1*cm))
-
-    # ===== DATOS DEL CLIENTE =====
-    elements.append(Paragraph("DATOS DEL CLIENTE", styles['SectionTitle']))
-
-    client_data = [
-        ['Nombre:', invoice.client_name],
-        ['DNI:', invoice.client_dni],
-    ]
-    if invoice.client_address:
-        client_data.append(['Dirección:', invoice.client_address])
-
-    client_table = Table(client_data, colWidths=[3*cm, 14*cm])
-    client_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(client_table)
-    elements.append(Spacer(1, 1*cm))
-
-    # ===== DETALLE DE LA FACTURA =====
-    elements.append(Paragraph("DETALLE", styles['SectionTitle']))
-
-    detail_data = [
-        ['Concepto', 'Base Imponible', f'IVA ({Invoice.IVA_RATE}%)', 'Total'],
-        [invoice.concept, f'{invoice.base_amount:.2f} €', f'{invoice.iva_amount:.2f} €', f'{invoice.total_amount:.2f} €'],
-    ]
-
-    detail_table = Table(detail_data, colWidths=[8*cm, 3*cm, 3*cm, 3*cm])
-    detail_table.setStyle(TableStyle([
-        # Cabecera
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        # Contenido
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        # Bordes
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-    ]))
-    elements.append(detail_table)
-    elements.append(Spacer(1, 0.5*cm))
-
-    # ===== TOTALES =====
-    totals_data = [
-        ['Base Imponible:', f'{invoice.base_amount:.2f} €'],
-        [f'IVA ({Invoice.IVA_RATE}%):', f'{invoice.iva_amount:.2f} €'],
-        ['TOTAL:', f'{invoice.total_amount:.2f} €'],
-    ]
-
-    totals_table = Table(totals_data, colWidths=[13*cm, 4*cm])
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f0f0')),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(totals_table)
-    elements.append(Spacer(1, 1.5*cm))
-
-    # ===== MÉTODO DE PAGO =====
-    elements.append(Paragraph("INFORMACIÓN DE PAGO", styles['SectionTitle']))
-    elements.append(Paragraph(f"<b>Método de pago:</b> Tarjeta", styles['Normal']))
-    elements.append(Paragraph(f"<b>Fecha de pago:</b> {payment.date_paid.strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 2*cm))
-
-    # ===== PIE =====
-    footer_text = f"""
-    <para align="center">
-    <font size="8" color="#666666">
-    {Invoice.COMPANY_NAME} - CIF: {Invoice.COMPANY_CIF}<br/>
-    {Invoice.COMPANY_ADDRESS}, {Invoice.COMPANY_CITY}<br/>
-    Este documento sirve como justificante de pago.
-    </font>
-    </para>
-    """
-    elements.append(Paragraph(footer_text, styles['Normal']))
 
-    # Construir el PDF
-    doc.build(elements)
+@login_required
+def invoice_print(request):
+    """
+    Tirada de impresión de las facturas de pago con tarjeta de un año (y
+    trimestre opcional): un solo PDF con una página por factura, por número.
+    """
+    from .invoice_pdf import PRINT_RUN_CHUNK_SIZE, draw_invoices, print_run_response
+
+    year = request.GET.get('year', '')
+    quarter = request.GET.get('quarter', '')
+    if not year.isdigit():
+        messages.error(request, 'Selecciona un año para imprimir las facturas.')
+        return redirect('tax_invoice_list')
+
+    invoices = Invoice.objects.filter(date_issued__year=year)
+    filename = f'facturas_tarjeta_{year}.pdf'
+    if quarter:
+        if quarter not in ('1', '2', '3', '4'):
+            messages.error(request, 'Trimestre no válido.')
+            return redirect('tax_invoice_list')
+        first_month = (int(quarter) - 1) * 3 + 1
+        invoices = invoices.filter(date_issued__month__gte=first_month, date_issued__month__lte=first_month + 2)
+        filename = f'facturas_tarjeta_{year}_T{quarter}.pdf'
 
-    # Preparar respuesta
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="factura_{invoice.invoice_number}.pdf"'
+    if not invoices.exists():
+        messages.error(request, 'No hay facturas de pago con tarjeta para imprimir en ese periodo.')
+        return redirect('tax_invoice_list')
 
-    return response
+    invoices = invoices.select_related('payment').order_by('invoice_number')
+    return print_run_response(filename, draw_invoices, invoices.iterator(chunk_size=PRINT_RUN_CHUNK_SIZE))
 
 
 # ==================== FACTURAS TRIMESTRALES ====================
 
-@login_required
-def tax_invoice_list(request):
-    """Panel centralizado de facturas trimestrales"""
-    from django.core.paginator import Paginator
-
-    invoices = TaxInvoice.objects.all().select_related('student')
+def _filtered_tax_invoices(request):
+    """
+    Facturas trimestrales con los filtros del panel (año, trimestre, alumno).
+    Retorna (queryset, filtros) para el listado y la exportación.
+    """
+    invoices = TaxInvoice.objects.all()
 
     # Filtros
-    year_filter = request.GET.get('year', '')
-    quarter_filter = request.GET.get('quarter', '')
-    student_filter = request.GET.get('student', '')
+    filters = {
+        'year_filter': request.GET.get('year', ''),
+        'quarter_filter': request.GET.get('quarter', ''),
+        'student_filter': request.GET.get('student', ''),
+    }
 
-    if year_filter:
-        invoices = invoices.filter(year=year_filter)
-    if quarter_filter:
-        invoices = invoices.filter(quarter=quarter_filter)
-    if student_filter:
+    if filters['year_filter'].isdigit():
+        invoices = invoices.filter(year=filters['year_filter'])
+    else:
+        filters['year_filter'] = ''
+    if filters['quarter_filter'].isdigit():
+        invoices = invoices.filter(quarter=filters['quarter_filter'])
+    else:
+        filters['quarter_filter'] = ''
+    if filters['student_filter']:
         invoices = invoices.filter(
-            Q(client_name__icontains=student_filter) |
-            Q(client_dni__icontains=student_filter)
+            Q(client_name__icontains=filters['student_filter']) |
+            Q(client_dni__icontains=filters['student_filter'])
         )
+    return invoices, filters
+
+
+@login_required
+def tax_invoice_list(request):
+    """Panel centralizado de facturas trimestrales"""
+    from django.core.paginator import Paginator
+    from urllib.parse import urlencode
+
+    invoices, filters = _filtered_tax_invoices(request)
+    invoices = invoices.select_related('student')
 
     # Obtener anos disponibles para el filtro
     available_years = TaxInvoice.objects.values_list('year', flat=True).distinct().order_by('-year')
@@ -956,14 +920,59 @@ def tax_invoice_list(request):
 
     context = {
         'page_obj': page_obj,
-        'year_filter': year_filter,
-        'quarter_filter': quarter_filter,
-        'student_filter': student_filter,
+        **filters,
+        'filter_query': urlencode({
+            'year': filters['year_filter'],
+            'quarter': filters['quarter_filter'],
+            'student': filters['student_filter'],
+        }),
         'available_years': available_years,
+        'curso_choices': TaxInvoice.CURSO_CHOICES,
     }
     return render(request, 'students/tax_invoice_list.html', context)
 
 
+@login_required
+def tax_invoice_export(request):
+    """
+    Descarga las facturas trimestrales del panel (con sus filtros) en Excel o CSV,
+    con las columnas de Trimestre-X.xlsx que lee import_trimestre.
+    """
+    from .spreadsheets import EXPORT_FORMATS, table_response
+    from .trimestre_export import TRIMESTRE_HEADER, trimestre_filename, trimestre_rows
+
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        messages.error(request, 'Formato de exportación no válido.')
+        return redirect('tax_invoice_list')
+
+    invoices, filters = _filtered_tax_invoices(request)
+    filename = trimestre_filename(filters['year_filter'], filters['quarter_filter'])
+    return table_response(export_format, filename, 'Trimestre', TRIMESTRE_HEADER, trimestre_rows(invoices))
+
+
+@login_required
+def tax_invoice_print(request):
+    """
+    Tirada de impresión de las facturas trimestrales del panel (con sus
+    filtros): un solo PDF con una página por factura, por número.
+    """
+    from .invoice_pdf import PRINT_RUN_CHUNK_SIZE, draw_tax_invoice, print_run_response
+    from .trimestre_export import trimestre_filename
+
+    invoices, filters = _filtered_tax_invoices(request)
+    if not filters['year_filter']:
+        messages.error(request, 'Selecciona un año para imprimir las facturas.')
+        return redirect('tax_invoice_list')
+    if not invoices.exists():
+        messages.error(request, 'No hay facturas trimestrales con esos filtros.')
+        return redirect('tax_invoice_list')
+
+    invoices = invoices.order_by('year', 'invoice_number')
+    filename = f"{trimestre_filename(filters['year_filter'], filters['quarter_filter'])}.pdf"
+    return print_run_response(filename, draw_tax_invoice, invoices.iterator(chunk_size=PRINT_RUN_CHUNK_SIZE))
+
+
 @login_required
 def tax_invoice_create(request, student_pk=None):
     """Crear una nueva factura trimestral"""
@@ -989,18 +998,11 @@ def tax_invoice_create(request, student_pk=None):
                     tax_invoice.student = get_object_or_404(Student, pk=student_id)
                     student = tax_invoice.student
 
-            # Generar numero de factura
             year = tax_invoice.fecha.year if tax_invoice.fecha else date.today().year
             tax_invoice.year = year
-            tax_invoice.invoice_number = TaxInvoice.generate_invoice_number(year)
 
             # Snapshot de datos del cliente
-            tax_invoice.client_name = f"{tax_invoice.student.first_name} {tax_invoice.student.last_name}"
-            tax_invoice.client_dni = tax_invoice.student.dni
-            tax_invoice.client_street = tax_invoice.student.street_address or tax_invoice.student.address
-            tax_invoice.client_postal_code = tax_invoice.student.postal_code
-            tax_invoice.client_municipality = tax_invoice.student.municipality
-            tax_invoice.client_province = tax_invoice.student.province
+            tax_invoice.copy_client_data(tax_invoice.student)
 
             # Calcular importes
             total_paid = form.cleaned_data['total_paid']
@@ -1019,12 +1021,16 @@ def tax_invoice_create(request, student_pk=None):
             tax_invoice.total = total
             tax_invoice.created_by = request.user
 
-            tax_invoice.save()
+            # Generar numero de factura en la misma transacción que el alta
+            # (si algo falla, el número se libera y no quedan huecos)
+            with transaction.atomic():
+                tax_invoice.invoice_number = TaxInvoice.generate_invoice_number(year)
+                tax_invoice.save()
 
-            # Vincular pagos seleccionados
-            selected_payments = form.cleaned_data.get('selected_payments')
-            if selected_payments:
-                tax_invoice.payments.set(selected_payments)
+                # Vincular pagos seleccionados
+                selected_payments = form.cleaned_data.get('selected_payments')
+                if selected_payments:
+                    tax_invoice.payments.set(selected_payments)
 
             messages.success(request, f'Factura trimestral {tax_invoice.invoice_number} creada correctamente')
 
@@ -1060,160 +1066,151 @@ def tax_invoice_detail(request, pk):
 @login_required
 def generate_tax_invoice_pdf(request, pk):
     """Genera PDF para una factura trimestral (formato Carrasco)"""
-    from django.http import HttpResponse
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    import io
-    import os
+    from .invoice_pdf import pdf_response, render_tax_invoice_pdf, tax_invoice_filename, tax_invoice_fingerprint
 
     tax_invoice = get_object_or_404(TaxInvoice, pk=pk)
 
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Datos del emisor (David Carrasco)
-    DATOS_EMISOR = {
-        'nombre': 'David Carrasco Sanchez',
-        'dni': '52648389 D',
-        'domicilio': 'C/ Beniparrell, 31 - Bajo 9',
-        'cp': '46470',
-        'municipio': 'Albal (Valencia)'
-    }
+    return pdf_response(
+        request,
+        tax_invoice_fingerprint(tax_invoice),
+        lambda: render_tax_invoice_pdf(tax_invoice),
+        filename=tax_invoice_filename(tax_invoice),
+        last_modified=tax_invoice.created_at
+    )
 
-    margin_left = 20 * mm
-    margin_right = width - 20 * mm
-    y = height - 20 * mm
-
-    # === CABECERA ===
-    # Intentar cargar logo
-    logo_path = os.path.join(os.path.dirname(__file__), 'static', 'students', 'logo.png')
-    if os.path.exists(logo_path):
-        try:
-            c.drawImage(logo_path, margin_left, y - 45 * mm, width=60 * mm, height=45 * mm, preserveAspectRatio=True)
-        except:
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(margin_left, y - 5 * mm, "A U T O E S C U E L A")
-            c.setFont("Helvetica-Bold", 22)
-            c.drawString(margin_left, y - 15 * mm, "CARRASCO")
-    else:
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(margin_left, y - 5 * mm, "A U T O E S C U E L A")
-        c.setFont("Helvetica-Bold", 22)
-        c.drawString(margin_left, y - 15 * mm, "CARRASCO")
-
-    # Recuadro datos emisor (derecha)
-    box_x = 105 * mm
-    box_y = y - 45 * mm
-    box_width = 85 * mm
-    box_height = 43 * mm
-
-    c.setStrokeColor(colors.black)
-    c.setLineWidth(0.5)
-    c.rect(box_x, box_y, box_width, box_height)
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(box_x + 3 * mm, box_y + box_height - 7 * mm,
-                 f"Fecha: {tax_invoice.fecha.strftime('%d/%m/%Y')}")
-    c.drawString(box_x + 3 * mm, box_y + box_height - 14 * mm,
-                 f"Nombre: {DATOS_EMISOR['nombre']}")
-    c.setFont("Helvetica", 9)
-    c.drawString(box_x + 3 * mm, box_y + box_height - 20 * mm, DATOS_EMISOR['dni'])
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(box_x + 3 * mm, box_y + box_height - 27 * mm,
-                 f"Domicilio: {DATOS_EMISOR['domicilio']}")
-    c.drawString(box_x + 3 * mm, box_y + box_height - 33 * mm,
-                 f"C.P: {DATOS_EMISOR['cp']}")
-    c.setFont("Helvetica", 9)
-    c.drawString(box_x + 3 * mm, box_y + box_height - 39 * mm, DATOS_EMISOR['municipio'])
-
-    y = y - 55 * mm
-
-    # === DATOS CLIENTE ===
-    client_box_height = 40 * mm
-    client_box_y = y - client_box_height
-    c.rect(margin_left, client_box_y, 80 * mm, client_box_height)
-
-    c.setFont("Helvetica-BoldOblique", 9)
-    c.drawString(margin_left + 3 * mm, y - 6 * mm, f"Cliente: {tax_invoice.client_name}")
-    c.drawString(margin_left + 3 * mm, y - 12 * mm, f"Dni: {tax_invoice.client_dni}")
-    c.drawString(margin_left + 3 * mm, y - 18 * mm, f"Domicilio: {tax_invoice.client_street}")
-    c.drawString(margin_left + 3 * mm, y - 24 * mm, f"C.P: {tax_invoice.client_postal_code}")
-
-    mun_prov = f"{tax_invoice.client_municipality}"
-    if tax_invoice.client_province:
-        mun_prov += f", {tax_invoice.client_province}"
-    c.drawString(margin_left + 3 * mm, y - 30 * mm, f"Municipio/Provincia: {mun_prov}")
-
-    c.setFont("Helvetica", 9)
-    c.drawString(margin_left + 3 * mm, y - 38 * mm,
-                 f"N FACTURA ALB {tax_invoice.invoice_number}")
-
-    y = y - 50 * mm
-
-    # === TABLA DE CONCEPTOS ===
-    conceptos = []
-
-    if tax_invoice.base_imponible > 0:
-        concepto_curso = f"CURSO PERMISO {tax_invoice.curso}\nALUMNO: {tax_invoice.client_name},\n{tax_invoice.client_dni}"
-        conceptos.append(['1', concepto_curso, f"{tax_invoice.base_imponible:.2f}", ''])
-
-    if tax_invoice.tasas_amount > 0:
-        conceptos.append(['1', "TASA DE TRAFICO (EXENTA DE IVA)", f"{tax_invoice.tasas_amount:.2f}", ''])
-
-    table_data = [['CANTIDAD', 'CONCEPTO', 'PRECIO', 'TOTAL']]
-    table_data.extend(conceptos)
-
-    while len(table_data) < 12:
-        table_data.append(['', '', '', ''])
-
-    col_widths = [20 * mm, 95 * mm, 25 * mm, 25 * mm]
-    table = Table(table_data, colWidths=col_widths)
-    table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 9),
-        ('FONT', (0, 1), (-1, -1), 'Helvetica', 9),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 0), (3, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 0), (-1, -1), 3),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-    ]))
-
-    table_width, table_height = table.wrap(0, 0)
-    table.drawOn(c, margin_left, y - table_height)
-
-    y = y - table_height - 10 * mm
-
-    # === TOTALES ===
-    iva_percent = 21 if tax_invoice.iva_amount > 0 else 0
-
-    totals_data = [
-        ['BASE IMPONIBLE', f"{tax_invoice.base_imponible:.2f}"],
-        [f'IVA {iva_percent} %', f"{tax_invoice.iva_amount:.2f}"],
-        ['EXENTO', f"{tax_invoice.tasas_amount:.2f}"],
-        ['TOTAL', f"{tax_invoice.total:.0f}"],
-    ]
-
-    totals_table = Table(totals_data, colWidths=[35 * mm, 20 * mm])
-    totals_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
-        ('FONT', (0, -1), (-1, -1), 'Helvetica-Bold', 10),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
-
-    tw, th = totals_table.wrap(0, 0)
-    totals_table.drawOn(c, margin_right - tw, y - th)
-
-    c.save()
-
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    num_short = tax_invoice.invoice_number.split('/')[1] if '/' in tax_invoice.invoice_number else tax_invoice.invoice_number
-    response['Content-Disposition'] = f'attachment; filename="fra {num_short}.pdf"'
 
+@login_required
+def tax_invoice_export_zip(request):
+    """Descarga en un ZIP todos los PDF de un trimestre (y curso opcional)"""
+    from django.http import StreamingHttpResponse
+    from .invoice_export import stream_quarter_zip, zip_filename
+
+    try:
+        year = int(request.GET.get('year', ''))
+        quarter = int(request.GET.get('quarter', ''))
+    except ValueError:
+        messages.error(request, 'Selecciona un año y un trimestre para exportar.')
+        return redirect('tax_invoice_list')
+    if quarter not in (1, 2, 3, 4):
+        messages.error(request, 'Trimestre no válido.')
+        return redirect('tax_invoice_list')
+
+    curso = request.GET.get('curso', '')
+    if curso and curso not in dict(TaxInvoice.CURSO_CHOICES):
+        messages.error(request, 'Curso no válido.')
+        return redirect('tax_invoice_list')
+
+    response = StreamingHttpResponse(stream_quarter_zip(year, quarter, curso or None), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{zip_filename(year, quarter, curso)}"'
     return response
+
+
+@login_required
+def tax_invoice_batch(request):
+    """
+    Facturación en bloque: una factura trimestral por alumno y trimestre con
+    todos los pagos sin factura de un rango de fechas.
+    GET con fechas muestra la vista previa; POST crea las facturas.
+    """
+    from .forms import TaxInvoiceBatchForm
+    from .tax_invoice_batch import generate_tax_invoices, preview_tax_invoices
+
+    if request.method == 'POST':
+        form = TaxInvoiceBatchForm(request.POST)
+        if form.is_valid():
+            invoices = generate_tax_invoices(
+                form.cleaned_data['date_from'], form.cleaned_data['date_to'], user=request.user
+            )
+            if not invoices:
+                messages.info(request, 'No hay pagos sin factura en ese periodo.')
+                return redirect('tax_invoice_batch')
+            message = f'{len(invoices)} facturas trimestrales creadas'
+            if len({tax_invoice.year for tax_invoice in invoices}) == 1:
+                message += f' ({invoices[0].invoice_number} - {invoices[-1].invoice_number})'
+            messages.success(request, message)
+            return redirect('tax_invoice_list')
+    else:
+        form = TaxInvoiceBatchForm(request.GET or None)
+
+    preview = None
+    if form.is_bound and form.is_valid():
+        invoices = preview_tax_invoices(form.cleaned_data['date_from'], form.cleaned_data['date_to'])
+        preview = {
+            'invoices': invoices[:TAX_INVOICE_BATCH_PREVIEW_ROWS],
+            'hidden_count': max(0, len(invoices) - TAX_INVOICE_BATCH_PREVIEW_ROWS),
+            'invoice_count': len(invoices),
+            'payment_count': sum(len(tax_invoice.batch_payments) for tax_invoice in invoices),
+            'base_imponible': sum(tax_invoice.base_imponible for tax_invoice in invoices),
+            'iva_amount': sum(tax_invoice.iva_amount for tax_invoice in invoices),
+            'total': sum(tax_invoice.total for tax_invoice in invoices),
+        }
+
+    return render(request, 'students/tax_invoice_batch.html', {
+        'form': form,
+        'preview': preview,
+    })
+
+
+@login_required
+def tax_summary(request):
+    """
+    Resumen trimestral de IVA por curso.
+    Lee la tabla TaxInvoiceSummary (no recorre las facturas); ?format=csv|xlsx descarga la tabla.
+    """
+    from .models import TaxInvoiceSummary
+    from .spreadsheets import EXPORT_FORMATS, table_response
+
+    summaries = TaxInvoiceSummary.objects.all()
+
+    year_filter = request.GET.get('year', '')
+    quarter_filter = request.GET.get('quarter', '')
+    if year_filter.isdigit():
+        summaries = summaries.filter(year=year_filter)
+    else:
+        year_filter = ''
+    if quarter_filter in ('1', '2', '3', '4'):
+        summaries = summaries.filter(quarter=quarter_filter)
+    else:
+        quarter_filter = ''
+
+    # Agrupar por trimestre con su total (como mucho un grupo por curso)
+    amount_fields = TaxInvoiceSummary.AMOUNT_FIELDS
+    quarters = []
+    grand_total = dict.fromkeys(['invoice_count'] + amount_fields, 0)
+    for summary in summaries:
+        if not quarters or (quarters[-1]['year'], quarters[-1]['quarter']) != (summary.year, summary.quarter):
+            quarters.append({
+                'year': summary.year,
+                'quarter': summary.quarter,
+                'rows': [],
+                'totals': dict.fromkeys(['invoice_count'] + amount_fields, 0),
+            })
+        quarters[-1]['rows'].append(summary)
+        for field in grand_total:
+            quarters[-1]['totals'][field] += getattr(summary, field)
+            grand_total[field] += getattr(summary, field)
+
+    export_format = request.GET.get('format', '')
+    if export_format in EXPORT_FORMATS:
+        header = ['Año', 'Trimestre', 'Curso', 'Facturas', 'Base imponible', 'IVA', 'Tasas DGT', 'Total']
+        rows = []
+        for quarter in quarters:
+            for summary in quarter['rows']:
+                rows.append([summary.year, summary.quarter, summary.curso, summary.invoice_count] +
+                            [getattr(summary, field) for field in amount_fields])
+            totals = quarter['totals']
+            rows.append([quarter['year'], quarter['quarter'], 'Total', totals['invoice_count']] +
+                        [totals[field] for field in amount_fields])
+        suffix = ''.join(f'_{part}' for part in (year_filter, quarter_filter and f'T{quarter_filter}') if part)
+        return table_response(export_format, f'resumen_iva{suffix}', 'Resumen IVA', header, rows)
+
+    available_years = TaxInvoiceSummary.objects.values_list('year', flat=True).distinct().order_by('-year')
+
+    context = {
+        'quarters': quarters,
+        'grand_total': grand_total,
+        'year_filter': year_filter,
+        'quarter_filter': quarter_filter,
+        'available_years': available_years,
+    }
+    return render(request, 'students/tax_summary.html', context)